@@ -2,30 +2,79 @@
 # app.py - Market Mentor: A Website for Walmart Suppliers
 # ==============================================================================
 import os
+import json
 import time
 import logging
-from typing import Dict, List
-import requests
-from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+import zlib
+import hmac
+import math
+import random
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from datetime import datetime, timezone
+from flask import Flask, Response, abort, request, jsonify, render_template, stream_with_context
 from dotenv import load_dotenv
-from functools import lru_cache
-from hashlib import md5
+from hashlib import sha256
 import re
 import string
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed, wait as futures_wait,
+)
+from functools import lru_cache
+
+if TYPE_CHECKING:
+    # Imported on first use (see LAZY_STARTUP); only needed here for annotations
+    import requests
+    from assets import Asset, AssetManifest
+    from docindex import DocumentIndex
+    from relevance_model import RelevanceModel
 
 # ==============================================================================
 # 1. Configuration and Setup
 # ==============================================================================
 
-# Load environment variables and setup logging
-load_dotenv()
+# Load environment variables and setup logging. The .env file is looked up next
+# to app.py only, instead of walking up from the caller's directory.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(APP_DIR, ".env"))
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
-app = Flask(__name__)
-
-@app.route('/public/<path:filename>')
-def serve_public(filename):
-    return send_from_directory('public', filename)
+# Flask's own /static route is replaced by the fingerprinted asset routes in section 8
+app = Flask(__name__, static_folder=None)
+
+# Startup-optimized mode for serverless cold starts: the HTTP client, keyword
+# list, relevance model, rejection pool and MinHash tables are built on first
+# use instead of at import. Otherwise everything is built at import so the first
+# request pays nothing extra. On by default on Vercel.
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "true" if os.getenv("VERCEL") else "false").lower() == "true"
+
+# Static assets (assets.py): files under static/ and public/ are served at
+# content-hashed /assets/ URLs with a one-year immutable Cache-Control, in the
+# best encoding the client accepts. `python assets.py build` precompresses them
+# into ASSET_BUILD_DIR ahead of time; without a build, compressed copies are
+# made on first request. The plain /static and /public URLs keep working for
+# external links, cached for ASSET_MAX_AGE seconds. s-maxage lets the CDN in
+# front of the app (Vercel's edge) keep hashed assets too, so repeat fetches
+# never reach a Python worker.
+ASSET_BUILD_DIR = os.getenv("ASSET_BUILD_DIR", os.path.join(APP_DIR, "build", "assets"))
+ASSET_MAX_AGE = int(os.getenv("ASSET_MAX_AGE", "3600"))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, s-maxage=31536000, immutable"
+
+# Rendered pages (/, /terms, /privacy) are kept in memory and re-rendered only
+# when the template or text file they come from changes (by mtime). Browsers
+# revalidate them with ETag/Last-Modified and get 304s. Templates are checked
+# for changes on those re-renders only, so the reload check costs nothing per request.
+TEMPLATES_DIR = os.path.join(APP_DIR, "templates")
+TERMS_PATH = os.getenv("TERMS_PATH", os.path.join(APP_DIR, "nunn tos.txt"))
+PRIVACY_PATH = os.getenv("PRIVACY_PATH", os.path.join(APP_DIR, "nunn privacy policy.txt"))
+app.config["TEMPLATES_AUTO_RELOAD"] = True
 
 # Environment variables
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
@@ -34,85 +83,1388 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 CUSTOM_SEARCH_ENGINE_ID = os.getenv("CUSTOM_SEARCH_ENGINE_ID")
 YDC_API_KEY = os.getenv("YDC_API_KEY")
 
-# Confirm environment variables loading
-for var in ['OPENROUTER_API_KEY', 'OPENROUTER_DIF_API_KEY',
-            'GOOGLE_API_KEY', 'CUSTOM_SEARCH_ENGINE_ID', 'YDC_API_KEY']:
-    if not os.getenv(var):
-        logging.error(f"{var} is missing or not loaded correctly.")
-    else:
-        logging.info(f"{var} loaded successfully.")
+# Settings each upstream provider needs. A provider with missing settings is
+# skipped (its calls raise UpstreamUnavailable) instead of failing the import,
+# so the site still serves pages and answers from whatever is configured.
+PROVIDER_SETTINGS = {
+    "openrouter": ("OPENROUTER_API_KEY", "OPENROUTER_DIF_API_KEY"),
+    "google": ("GOOGLE_API_KEY", "CUSTOM_SEARCH_ENGINE_ID"),
+    "you.com": ("YDC_API_KEY",),
+}
+
+
+def missing_provider_settings(provider: str) -> List[str]:
+    return [name for name in PROVIDER_SETTINGS.get(provider, ()) if not os.getenv(name)]
+
+# Context retrieval settings: every search provider gets its own deadline, and
+# all providers are queried at the same time on a shared thread pool.
+SEARCH_PROVIDER_TIMEOUT = float(os.getenv("SEARCH_PROVIDER_TIMEOUT", "12"))
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "8"))
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="search")
+
+# Shared HTTP client settings. All upstream calls go through one session with a
+# keep-alive connection pool per host, so repeated calls skip the TCP+TLS handshake.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "20"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))
+
+# Upstream protection, per provider (openrouter, google, you.com):
+#  - an AIMD concurrency limit between UPSTREAM_MIN_CONCURRENCY and
+#    UPSTREAM_MAX_CONCURRENCY: it grows by one per limit's worth of healthy calls
+#    and halves on a failure or a call slower than UPSTREAM_SLOW_FACTOR times the
+#    recent median for that kind of call; callers wait up to
+#    UPSTREAM_QUEUE_TIMEOUT seconds for a slot,
+#  - a circuit breaker that opens after BREAKER_FAILURE_THRESHOLD consecutive
+#    failures and skips the provider for BREAKER_COOLDOWN seconds,
+#  - hedged searches: when a search is slower than that provider's recent p95,
+#    an identical second request is sent and the first response wins.
+UPSTREAM_MIN_CONCURRENCY = int(os.getenv("UPSTREAM_MIN_CONCURRENCY", "2"))
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", str(HTTP_POOL_MAXSIZE)))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2"))
+UPSTREAM_SLOW_FACTOR = float(os.getenv("UPSTREAM_SLOW_FACTOR", "2.5"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+HEDGE_SEARCHES = os.getenv("HEDGE_SEARCHES", "true").lower() == "true"
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Upstream endpoints (overridable so benchmarks can point at local stand-ins)
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+GOOGLE_SEARCH_URL = os.getenv("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
+YDC_SEARCH_URL = os.getenv("YDC_SEARCH_URL", "https://api.ydc-index.io/search")
+
+# Local supplier document index, built with `python docindex.py build <docs dir>`.
+# It is memory-mapped on the first question and skipped when the directory is
+# missing. When its best chunk scores at least DOC_INDEX_SKIP_WEB_SCORE, the
+# paid web searches are skipped for that question (0 always queries them).
+DOC_INDEX_PATH = os.getenv("DOC_INDEX_PATH", os.path.join(APP_DIR, "doc_index"))
+DOC_INDEX_TOP_K = int(os.getenv("DOC_INDEX_TOP_K", "6"))
+DOC_INDEX_MIN_SCORE = float(os.getenv("DOC_INDEX_MIN_SCORE", "2.0"))
+DOC_INDEX_SKIP_WEB_SCORE = float(os.getenv("DOC_INDEX_SKIP_WEB_SCORE", "0"))
+
+# Context assembly: search passages are deduplicated by URL and by near-duplicate
+# text (MinHash over word shingles), ranked against the question and packed into
+# CONTEXT_TOKEN_BUDGET estimated tokens before they reach the prompt.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.8"))
+
+# Prompt caching for the answer call: the fixed instructions are sent as the
+# first system block with an Anthropic cache_control marker (OpenRouter passes
+# it through) and the search context follows in its own block, so the provider
+# can serve the shared prefix from its prompt cache. Anthropic ignores markers
+# on prefixes shorter than PROMPT_CACHE_MIN_TOKENS (1024 for Claude 3.5 Sonnet).
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+# Local relevance classifier (relevance_model.py), consulted when the keyword
+# gate does not match. Scores at or below RELEVANCE_REJECT_SCORE are rejected
+# with no upstream calls; everything else goes to the You.com + GPT-4o gate.
+# Local accepts (scores at or above RELEVANCE_ACCEPT_SCORE) are off unless it is
+# set: the bundled model was trained on a small seed set and scores questions
+# about other retailers (Costco, Target) as relevant. Set it only for a model
+# trained on logged gate decisions whose held-out accept_precision has been
+# checked (`python relevance_model.py train` reports it). When
+# RELEVANCE_DECISION_LOG is set, AI gate decisions are appended to it as
+# training data for the model.
+RELEVANCE_MODEL_PATH = os.getenv(
+    "RELEVANCE_MODEL_PATH", os.path.join(APP_DIR, "relevance_model.npz")
+)
+RELEVANCE_ACCEPT_SCORE = float(os.getenv("RELEVANCE_ACCEPT_SCORE") or "inf")
+RELEVANCE_REJECT_SCORE = float(os.getenv("RELEVANCE_REJECT_SCORE", "0.15"))
+RELEVANCE_DECISION_LOG = os.getenv("RELEVANCE_DECISION_LOG", "")
+
+# Pre-written rejection messages served in rotation instead of a Claude call;
+# when the file is missing or empty, rejections are generated by the model.
+REJECTION_MESSAGES_PATH = os.getenv(
+    "REJECTION_MESSAGES_PATH", os.path.join(APP_DIR, "rejection_messages.txt")
+)
+
+# Versioned keyword list for the hardcoded relevance gate
+WALMART_KEYWORDS_PATH = os.getenv(
+    "WALMART_KEYWORDS_PATH", os.path.join(APP_DIR, "walmart_keywords.txt")
+)
+
+# Cache settings. Backends are listed fastest first (an empty list disables the
+# cache); the SQLite file lives in the temp directory by default so it is
+# writable on serverless hosts.
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(tempfile.gettempdir(), "marketmentor_cache.sqlite3"))
+SEARCH_CACHE_BACKENDS = os.getenv("SEARCH_CACHE_BACKENDS", "memory,sqlite")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "21600"))
+SEARCH_CACHE_MEMORY_ENTRIES = int(os.getenv("SEARCH_CACHE_MEMORY_ENTRIES", "512"))
+SEARCH_CACHE_SQLITE_ENTRIES = int(os.getenv("SEARCH_CACHE_SQLITE_ENTRIES", "5000"))
+RELEVANCY_CACHE_BACKENDS = os.getenv("RELEVANCY_CACHE_BACKENDS", "memory,sqlite")
+RELEVANCY_CACHE_TTL = float(os.getenv("RELEVANCY_CACHE_TTL", "604800"))
+RELEVANCY_CACHE_MEMORY_ENTRIES = int(os.getenv("RELEVANCY_CACHE_MEMORY_ENTRIES", "2000"))
+RELEVANCY_CACHE_SQLITE_ENTRIES = int(os.getenv("RELEVANCY_CACHE_SQLITE_ENTRIES", "20000"))
+
+# Answer cache: questions share an entry when they have the same words in the
+# same order after dropping articles, pronouns and "is/are/do/does" (see
+# answer_cache_key). Question words, modals, prepositions and numbers are kept,
+# since the stored answer is returned verbatim: "where" vs "should", "to" vs
+# "from" or a 98% vs 90% OTIF target need different answers.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Background jobs: POST /ask?mode=async returns a job ID and a bounded pool runs
+# the question; GET /jobs/<id> polls it. JOB_QUEUE_DEPTH caps queued plus running
+# jobs per process (429 beyond it) and results are kept in SQLite for
+# JOB_RESULT_TTL seconds. Off by default on Vercel, whose functions are frozen
+# between requests so background work cannot finish; the page then streams.
+ASYNC_JOBS_ENABLED = os.getenv("ASYNC_JOBS_ENABLED", "false" if os.getenv("VERCEL") else "true").lower() == "true"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", "32"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "5"))
+
+# Rate limiting: every client gets a token bucket of RATE_LIMIT_BURST questions
+# that refills at RATE_LIMIT_PER_MINUTE; a question beyond it is answered 429
+# with Retry-After. Clients are identified by an X-API-Key header listed in
+# CLIENT_API_KEYS ("name=key,name2=key2"), otherwise by IP address (the first
+# X-Forwarded-For hop when RATE_LIMIT_TRUST_FORWARDED, as behind Vercel's proxy).
+# Upstream calls and LLM tokens are accounted per client and UTC day; clients
+# over CLIENT_DAILY_TOKEN_QUOTA tokens (0 = no quota) are refused until midnight.
+# RATE_LIMIT_BACKEND "memory" is per process; "sqlite" shares buckets and usage
+# between the workers on one machine through CACHE_DB_PATH.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "6"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv(
+    "RATE_LIMIT_TRUST_FORWARDED", "true" if os.getenv("VERCEL") else "false"
+).lower() == "true"
+CLIENT_API_KEYS = {
+    key.strip(): name.strip()
+    for name, _, key in (entry.partition("=") for entry in os.getenv("CLIENT_API_KEYS", "").split(","))
+    if name.strip() and key.strip()
+}
+CLIENT_DAILY_TOKEN_QUOTA = int(os.getenv("CLIENT_DAILY_TOKEN_QUOTA", "0"))
+
+# Batch answering (POST /ask/batch and batch.py): up to BATCH_MAX_QUESTIONS
+# questions per batch, answered BATCH_WORKERS at a time. Every question still to
+# be answered is charged to the client's rate limit, and a batch with more than
+# RATE_LIMIT_BURST of them is refused with 413. Questions whose
+# embeddings are at least BATCH_SHARE_SIMILARITY apart reuse one set of search
+# results. Completed answers are checkpointed for JOB_RESULT_TTL seconds so a
+# re-sent batch only runs the questions that did not finish.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_SHARE_SIMILARITY = float(os.getenv("BATCH_SHARE_SIMILARITY", "0.8"))
+
+# Single-flight: concurrent identical questions (and identical search calls)
+# wait on one in-flight computation instead of each calling the upstreams.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# ==============================================================================
+# 2. Observability
+# ==============================================================================
+
+class Counter:
+    """Prometheus-style counter with labels."""
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Prometheus-style histogram with labels and fixed buckets (seconds)."""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labels + ("le",), key + (f"{bound:g}",))
+                    lines.append(f"{self.name}_bucket{labels} {count:g}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + ('+Inf',))} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-2]:g}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-1]:.6f}")
+        return lines
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+REQUEST_DURATION = Histogram(
+    "marketmentor_request_duration_seconds", "End-to-end question latency.", ("route", "outcome"))
+STAGE_DURATION = Histogram(
+    "marketmentor_stage_duration_seconds", "Latency of each pipeline stage.", ("stage", "status"))
+UPSTREAM_DURATION = Histogram(
+    "marketmentor_upstream_duration_seconds", "Latency of upstream HTTP calls, including retries.", ("host",))
+UPSTREAM_REQUESTS = Counter(
+    "marketmentor_upstream_requests_total", "Upstream HTTP calls by final status code.", ("host", "status"))
+UPSTREAM_RETRIES = Counter(
+    "marketmentor_upstream_retries_total", "Retries performed on upstream HTTP calls.", ("host",))
+LLM_TOKENS = Counter(
+    "marketmentor_llm_tokens_total",
+    "Tokens reported in OpenRouter usage fields (prompt tokens also split into cached_prompt/uncached_prompt).",
+    ("model", "type"))
+SINGLE_FLIGHT_CALLS = Counter(
+    "marketmentor_single_flight_calls_total",
+    "Calls that ran (leader) or joined an identical in-flight call (collapsed).", ("flight", "role"))
+UPSTREAM_SHED = Counter(
+    "marketmentor_upstream_shed_total",
+    "Upstream calls not sent because the provider was not configured, its breaker was open or no concurrency slot freed up.", ("provider", "reason"))
+UPSTREAM_HEDGES = Counter(
+    "marketmentor_upstream_hedges_total", "Hedged search requests sent, and how many of them won.", ("provider", "event"))
+RATE_LIMITED = Counter(
+    "marketmentor_rate_limited_total", "Questions refused with 429 by the per-client rate limiter.", ("reason",))
+JOBS = Counter(
+    "marketmentor_jobs_total", "Background jobs by lifecycle event.", ("event",))
+CONTEXT_TOKENS = Counter(
+    "marketmentor_context_tokens_total",
+    "Estimated context tokens retrieved and sent to the answer model.", ("stage",))
+
+METRICS = [
+    REQUEST_DURATION, STAGE_DURATION, UPSTREAM_DURATION, UPSTREAM_REQUESTS, UPSTREAM_RETRIES, LLM_TOKENS,
+    SINGLE_FLIGHT_CALLS, CONTEXT_TOKENS, JOBS, UPSTREAM_SHED, UPSTREAM_HEDGES, RATE_LIMITED,
+]
+
+trace_logger = logging.getLogger("marketmentor.trace")
+
+
+class RequestTrace:
+    """
+    Everything recorded while answering one question: a span per pipeline stage,
+    every upstream call with its status and retries, and LLM token usage.
+    Emitted as one JSON log line when the request finishes.
+    """
+
+    def __init__(self, route: str, request_id: Optional[str] = None, client: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.route = route
+        self.client = client
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.spans: List[Dict] = []
+        self.upstream: List[Dict] = []
+        self.tokens: Dict[str, int] = {}
+        self.outcome: Optional[str] = None  # set by the pipeline, e.g. "answered" or "rejected"
+        self._lock = threading.Lock()
+
+    def offset(self) -> float:
+        return round(time.perf_counter() - self.started, 4)
+
+    def add_span(self, span: Dict) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def add_upstream(self, call: Dict) -> None:
+        with self._lock:
+            self.upstream.append(call)
+
+    def add_tokens(self, usage: Dict[str, int]) -> None:
+        with self._lock:
+            for name, count in usage.items():
+                self.tokens[name] = self.tokens.get(name, 0) + count
+
+    def to_dict(self, outcome: str) -> Dict:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "route": self.route,
+                "client": self.client,
+                "started_at": self.started_at,
+                "duration_s": self.offset(),
+                "outcome": outcome,
+                "spans": list(self.spans),
+                "upstream": list(self.upstream),
+                "tokens": dict(self.tokens),
+            }
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def request_trace(route: str, request_id: Optional[str] = None, client: Optional[str] = None,
+                  charge: bool = True) -> Iterator[RequestTrace]:
+    """
+    Trace one question from start to finish. Sets the current trace for every
+    span and upstream call made inside the block, records the request latency
+    histogram and writes the JSON trace log line on exit. The upstream calls
+    and tokens are charged to client, when given, unless charge is False (the
+    ASGI app charges from a worker thread instead, as the store may be SQLite).
+    """
+    trace = RequestTrace(route, request_id, client)
+    token = current_trace.set(trace)
+    outcome = "ok"
+    try:
+        yield trace
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        current_trace.reset(token)
+        outcome = trace.outcome or outcome
+        REQUEST_DURATION.observe(trace.offset(), route=route, outcome=outcome)
+        trace_logger.info(json.dumps(trace.to_dict(outcome)))
+        if client is not None and charge:
+            client_limiter.charge(trace)
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Dict]:
+    """
+    Time one pipeline stage. The yielded dict can be updated with extra
+    attributes (e.g. a decision) that are stored on the span.
+    """
+    trace = current_trace.get()
+    record = {"stage": stage, "start_s": trace.offset() if trace else 0.0, **attributes}
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield record
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=stage, status=status)
+        if trace is not None:
+            record.update(duration_s=round(elapsed, 4), status=status)
+            trace.add_span(record)
+
+
+def record_upstream_call(method: str, url: str, status: Optional[int], retries: int, elapsed: float) -> None:
+    """Record an upstream HTTP call in the metrics and the current trace."""
+    host = url.split("/")[2] if "//" in url else url
+    UPSTREAM_DURATION.observe(elapsed, host=host)
+    UPSTREAM_REQUESTS.inc(host=host, status=status if status is not None else "error")
+    if retries:
+        UPSTREAM_RETRIES.inc(retries, host=host)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_upstream({
+            "method": method, "host": host, "status": status,
+            "retries": retries, "duration_s": round(elapsed, 4),
+        })
+
+
+def record_token_usage(model: str, usage: Optional[Dict]) -> None:
+    """
+    Record the token counts from an OpenRouter "usage" field. Prompt tokens are
+    also split into cached (read from the provider's prompt cache, reported in
+    prompt_tokens_details) and uncached, plus any tokens written to the cache.
+    """
+    if not usage:
+        return
+    counts = {
+        name: int(usage[name])
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+        if isinstance(usage.get(name), (int, float))
+    }
+    if "prompt_tokens" in counts:
+        details = usage.get("prompt_tokens_details") or {}
+        cached = details.get("cached_tokens")
+        counts["cached_prompt_tokens"] = int(cached) if isinstance(cached, (int, float)) else 0
+        counts["uncached_prompt_tokens"] = counts["prompt_tokens"] - counts["cached_prompt_tokens"]
+        if isinstance(details.get("cache_write_tokens"), (int, float)):
+            counts["cache_write_tokens"] = int(details["cache_write_tokens"])
+        logging.info(f"Token usage ({model}): {counts['prompt_tokens']} prompt "
+                     f"({counts['cached_prompt_tokens']} cached, {counts['uncached_prompt_tokens']} uncached), "
+                     f"{counts.get('completion_tokens', 0)} completion.")
+    for name, count in counts.items():
+        LLM_TOKENS.inc(count, model=model, type=name.replace("_tokens", ""))
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_tokens(counts)
+
+
+def completion_content(response_json: Dict, model: str) -> str:
+    """Return the message text of a chat completion and record its token usage."""
+    record_token_usage(response_json.get("model", model), response_json.get("usage"))
+    return response_json["choices"][0]["message"]["content"]
+
+
+def render_metrics() -> str:
+    """Render every metric, plus cache and connection-pool gauges, in Prometheus text format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    lines += ["# HELP marketmentor_cache_lookups_total Cache lookups by cache and result.",
+              "# TYPE marketmentor_cache_lookups_total counter"]
+    for cache_name, stats in (("search", search_cache.stats()), ("relevancy", relevancy_cache.stats()),
+                              ("answer", answer_cache.stats())):
+        for result, value in stats.items():
+            if result not in ("hit_rate", "entries"):
+                lines.append(f'marketmentor_cache_lookups_total{{cache="{cache_name}",result="{result}"}} {value:g}')
+
+    lines += ["# HELP marketmentor_http_pool_connections Upstream connections opened and reused per host.",
+              "# TYPE marketmentor_http_pool_connections gauge"]
+    for host, stats in http_pool_stats().items():
+        for kind in ("connections", "reused"):
+            lines.append(f'marketmentor_http_pool_connections{{host="{host}",kind="{kind}"}} {stats[kind]}')
+    return "\n".join(lines) + "\n"
+
+# ==============================================================================
+# 3. Shared HTTP Client
+# ==============================================================================
+
+def create_http_session() -> "requests.Session":
+    """
+    Build the session used for every upstream call. Each upstream host gets its
+    own adapter (and therefore its own keep-alive pool of HTTP_POOL_MAXSIZE
+    connections), with retry and backoff on 429 and 5xx responses; read
+    timeouts are retried for the searches only.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    for base_url in {GOOGLE_SEARCH_URL, YDC_SEARCH_URL}:
+        host_prefix = "/".join(base_url.split("/")[:3]) + "/"
+        session.mount(host_prefix, HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry))
+    # OpenRouter calls are non-idempotent POSTs with a long read timeout: a read
+    # timeout is not retried (the request may already be billed, and a retry would
+    # run past the function's time limit); only 429/5xx and connect errors are.
+    # Mounted on the full URL so it wins over a host prefix shared with a search provider.
+    session.mount(OPENROUTER_URL, HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE,
+                                              max_retries=retry.new(read=0)))
+    return session
+
+
+@lru_cache(maxsize=1)
+def get_http_session() -> "requests.Session":
+    """The shared upstream session, created (and requests imported) on first use."""
+    return create_http_session()
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling a provider that is not configured, whose breaker
+    is open or whose concurrency limit is exhausted.
+    """
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one provider: +1/limit per healthy call (about
+    +1 per limit's worth of calls) and halved on congestion, at most once a
+    second so one slow burst does not collapse it to the minimum. Release
+    listeners are called (outside the lock, from any thread) whenever a slot
+    may have freed up, so waiters that cannot block on the condition, like the
+    ASGI app's coroutines, are woken too.
+    """
+
+    def __init__(self, name: str, minimum: int, maximum: int):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(self.maximum + self.minimum) / 2
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._release_listeners: List[Callable[[], None]] = []
+
+    def add_release_listener(self, listener: Callable[[], None]) -> None:
+        self._release_listeners.append(listener)
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for a slot; False if none freed up."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+        for listener in self._release_listeners:
+            listener()
+
+    def on_success(self) -> None:
+        with self._cond:
+            previous = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            grew = int(self.limit) > previous
+            if grew:
+                self._cond.notify()
+        if grew:
+            for listener in self._release_listeners:
+                listener()
+
+    def on_congestion(self, reason: str) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < 1.0:
+                return
+            previous = self.limit
+            self.limit = max(float(self.minimum), self.limit / 2)
+            self._last_decrease = now
+        if int(previous) != int(self.limit):
+            logging.warning(
+                f"Upstream '{self.name}' is congested ({reason}); concurrency limit {int(previous)} -> {int(self.limit)}."
+            )
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures. While open, calls are
+    refused for `cooldown` seconds; then one probe call is let through
+    (half-open), which closes the breaker on success or reopens it on failure.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """True while calls would be refused (open and still cooling down)."""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self._opened_at < self.cooldown
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._probe_in_flight = False
+                logging.warning(f"Circuit breaker for '{self.name}' is half-open; sending a probe request.")
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self) -> None:
+        """Give back a probe claimed by allow() whose call ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            previous = self.state
+            if ok:
+                self.failures = 0
+                self.state = "closed"
+            else:
+                self.failures += 1
+                if self.state == "half_open" or self.failures >= self.threshold:
+                    self.state = "open"
+                    self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+            state, failures = self.state, self.failures
+        if state != previous:
+            if state == "open":
+                logging.warning(
+                    f"Circuit breaker for '{self.name}' opened after {failures} consecutive failures; "
+                    f"skipping it for {self.cooldown:.0f}s."
+                )
+            else:
+                logging.warning(f"Circuit breaker for '{self.name}' closed; provider is healthy again.")
+
+
+class UpstreamGuard:
+    """
+    Concurrency limit, circuit breaker and recent latencies for one provider.
+    Latencies are tracked per kind of call (e.g. the GPT-4o gate and the Claude
+    answer both go to OpenRouter but take very different times).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.missing_settings = missing_provider_settings(name)
+        self.limiter = AdaptiveLimiter(name, UPSTREAM_MIN_CONCURRENCY, UPSTREAM_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _percentile(self, operation: str, fraction: float) -> Optional[float]:
+        with self._lock:
+            window = sorted(self._latencies.get(operation, ()))
+        if len(window) < HEDGE_MIN_SAMPLES:
+            return None
+        return window[min(len(window) - 1, int(fraction * len(window)))]
+
+    def unavailable_reason(self) -> Optional[str]:
+        """Why calls to this provider would be refused right now, or None."""
+        if self.missing_settings:
+            return f"not configured (missing {', '.join(self.missing_settings)})"
+        if self.breaker.is_open():
+            return "its circuit breaker is open"
+        return None
+
+    def admit(self) -> None:
+        """Raise UpstreamUnavailable right away, before queueing for a slot, if the provider is unusable."""
+        if self.missing_settings:
+            UPSTREAM_SHED.inc(provider=self.name, reason="not_configured")
+            raise UpstreamUnavailable(f"'{self.name}' is {self.unavailable_reason()}")
+        if self.breaker.is_open():
+            UPSTREAM_SHED.inc(provider=self.name, reason="breaker_open")
+            raise UpstreamUnavailable(f"circuit breaker for '{self.name}' is open")
+
+    def claim(self) -> None:
+        """
+        Ask the breaker to let one call through (possibly as the half-open
+        probe). Called only once a concurrency slot is held, so a claimed probe
+        always ends in record() or breaker.release_probe().
+        """
+        if not self.breaker.allow():
+            UPSTREAM_SHED.inc(provider=self.name, reason="breaker_open")
+            raise UpstreamUnavailable(f"circuit breaker for '{self.name}' is open")
+
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """Recent p95 latency of this kind of call, or None until enough samples are in."""
+        return self._percentile(operation, 0.95)
+
+    def record(self, operation: str, elapsed: float, ok: bool) -> None:
+        """Feed one finished call into the breaker and the AIMD limit."""
+        self.breaker.record(ok)
+        median = self._percentile(operation, 0.5)
+        with self._lock:
+            self._latencies.setdefault(operation, deque(maxlen=200)).append(elapsed)
+        if not ok:
+            self.limiter.on_congestion("failure")
+        elif median is not None and elapsed > UPSTREAM_SLOW_FACTOR * median:
+            self.limiter.on_congestion(f"{operation} took {elapsed:.1f}s vs {median:.1f}s median")
+        else:
+            self.limiter.on_success()
+
+    def stats(self) -> Dict:
+        return {
+            "breaker": self.breaker.state,
+            "failures": self.breaker.failures,
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+        }
+
+
+UPSTREAM_GUARDS: Dict[str, UpstreamGuard] = {name: UpstreamGuard(name) for name in PROVIDER_SETTINGS}
+for _guard in UPSTREAM_GUARDS.values():
+    if _guard.missing_settings:
+        logging.warning(f"Provider '{_guard.name}' is not configured (missing {', '.join(_guard.missing_settings)}); "
+                        f"its calls will be skipped.")
+hedge_executor = ThreadPoolExecutor(max_workers=HTTP_POOL_MAXSIZE, thread_name_prefix="hedge")
+
+
+def upstream_guard(url: str) -> Optional[UpstreamGuard]:
+    """The guard for the provider behind url (matched on the configured endpoints)."""
+    for base_url, name in ((OPENROUTER_URL, "openrouter"), (GOOGLE_SEARCH_URL, "google"), (YDC_SEARCH_URL, "you.com")):
+        if url.startswith(base_url):
+            return UPSTREAM_GUARDS[name]
+    return None
+
+
+def is_failure_status(status: Optional[int]) -> bool:
+    return status is None or status == 429 or status >= 500
+
+
+def _send(method: str, url: str, kwargs: Dict) -> "requests.Response":
+    started = time.perf_counter()
+    try:
+        response = get_http_session().request(method, url, **kwargs)
+    except Exception:
+        record_upstream_call(method, url, None, HTTP_MAX_RETRIES, time.perf_counter() - started)
+        raise
+    retries = getattr(response.raw, "retries", None)
+    retry_count = len(retries.history) if retries is not None else 0
+    if retry_count:
+        logging.warning(f"{method} {url} needed {retry_count} retries (final status {response.status_code}).")
+    record_upstream_call(method, url, response.status_code, retry_count, time.perf_counter() - started)
+    return response
+
+
+def _send_guarded(guard: UpstreamGuard, operation: str, method: str, url: str, kwargs: Dict,
+                  queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT) -> "requests.Response":
+    if not guard.limiter.acquire(queue_timeout):
+        UPSTREAM_SHED.inc(provider=guard.name, reason="concurrency_limit")
+        raise UpstreamUnavailable(f"'{guard.name}' concurrency limit ({int(guard.limiter.limit)}) reached")
+    try:
+        guard.claim()
+        started = time.perf_counter()
+        try:
+            response = _send(method, url, kwargs)
+        except Exception:
+            guard.record(operation, time.perf_counter() - started, ok=False)
+            raise
+        except BaseException:
+            # Interrupted without an outcome: free the half-open probe for the next call
+            guard.breaker.release_probe()
+            raise
+    finally:
+        guard.limiter.release()
+    guard.record(operation, time.perf_counter() - started, ok=not is_failure_status(response.status_code))
+    return response
+
+
+def _send_hedged(guard: UpstreamGuard, operation: str, method: str, url: str, kwargs: Dict) -> "requests.Response":
+    """
+    Send the request; if it is still running after the recent p95 latency, send
+    an identical second one (only if a concurrency slot is free right away) and
+    return whichever succeeds first.
+    """
+    delay = guard.hedge_delay(operation)
+    if delay is None:
+        return _send_guarded(guard, operation, method, url, kwargs)
+
+    first = hedge_executor.submit(copy_context().run, _send_guarded, guard, operation, method, url, kwargs)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeoutError:
+        pass
+
+    UPSTREAM_HEDGES.inc(provider=guard.name, event="sent")
+    logging.info(f"'{guard.name}' {operation} exceeded its p95 ({delay:.2f}s); sending a hedged request.")
+    second = hedge_executor.submit(copy_context().run, _send_guarded, guard, operation, method, url, kwargs, 0.0)
+    pending, error = {first, second}, None
+    while pending:
+        done, pending = futures_wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    UPSTREAM_HEDGES.inc(provider=guard.name, event="won")
+                return future.result()
+            if error is None or future is first:
+                error = future.exception()
+    raise error
+
+
+def http_request(method: str, url: str, read_timeout: float = HTTP_READ_TIMEOUT,
+                 operation: Optional[str] = None, hedge: bool = False, **kwargs) -> "requests.Response":
+    """
+    Send a request through the shared session. Every call gets a connect/read
+    timeout so a hung upstream cannot hold a worker thread indefinitely.
+    Calls to a known provider go through its guard: they are refused with
+    UpstreamUnavailable while it is not configured, its breaker is open or no
+    concurrency slot frees up in time, and count toward its adaptive limit (by `operation`, the kind
+    of call). hedge=True allows a hedged second request for idempotent calls.
+    For streamed responses the slot is held until the response headers arrive.
+    """
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, read_timeout))
+    guard = upstream_guard(url)
+    if guard is None:
+        return _send(method, url, kwargs)
+
+    guard.admit()
+    operation = operation or method
+    if hedge and HEDGE_SEARCHES:
+        return _send_hedged(guard, operation, method, url, kwargs)
+    return _send_guarded(guard, operation, method, url, kwargs)
+
+
+def upstream_guard_stats() -> Dict[str, Dict]:
+    return {name: guard.stats() for name, guard in UPSTREAM_GUARDS.items()}
+
+
+def http_pool_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Report connection reuse for each upstream host pool: how many requests were
+    sent, how many connections had to be opened, and how many requests reused
+    an existing keep-alive connection.
+    """
+    stats = {}
+    for adapter in set(get_http_session().adapters.values()):
+        pools = adapter.poolmanager.pools
+        with pools.lock:
+            host_pools = list(pools._container.values())
+        for pool in host_pools:
+            stats[pool.host] = {
+                "requests": pool.num_requests,
+                "connections": pool.num_connections,
+                "reused": max(0, pool.num_requests - pool.num_connections),
+            }
+    return stats
+
+# ==============================================================================
+# 4. Caching
+# ==============================================================================
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a question or search query for cache keys: Unicode-fold, lowercase,
+    unify curly quotes, collapse whitespace and drop surrounding punctuation, so
+    "What is OTIF?" and "what is  OTIF" share an entry.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = text.replace("\u2018", "'").replace("\u2019", "'").replace("\u201c", '"').replace("\u201d", '"')
+    text = " ".join(text.split())
+    return text.strip(string.punctuation + " ")
+
+
+def make_cache_key(namespace: str, text: str, **params) -> str:
+    """Build a stable cache key from a namespace, normalized text and any parameters."""
+    material = json.dumps([namespace, normalize_query(text), sorted(params.items())], default=str)
+    return sha256(material.encode("utf-8")).hexdigest()
+
+
+def question_fingerprint(question: str) -> str:
+    """Fingerprint of the normalized question, used to key per-question decisions and answers."""
+    return make_cache_key("question", question)
+
+
+class MemoryCacheBackend:
+    """In-process LRU store with per-entry expiry, bounded to max_entries."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk store that survives cold starts and is shared by every worker on the
+    same machine. Values are stored as JSON; each namespace is bounded to
+    max_entries, evicting the least recently used rows first.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, namespace: str, max_entries: int = 5000):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (time.time(), self.namespace, key)
+            )
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache read failed ({self.namespace}): {e}")
+            return None
+
+    def set(self, key: str, value, ttl: float) -> None:
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now + ttl, now)
+            )
+            self._writes += 1
+            # Trim periodically rather than on every write to keep inserts cheap
+            if self._writes % 50 == 1:
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache write failed ({self.namespace}): {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND expires_at < ?", (self.namespace, now))
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries)
+        )
+
+    def delete(self, key: str) -> None:
+        try:
+            self._connect().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache delete failed ({self.namespace}): {e}")
+
+    def clear(self) -> None:
+        try:
+            self._connect().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache clear failed ({self.namespace}): {e}")
+
+
+class TTLCache:
+    """
+    Read-through cache over one or more backends, checked fastest first. A hit in
+    a slower backend (e.g. SQLite after a cold start) is copied into the faster
+    ones. Tracks hits per backend and misses.
+    """
+
+    def __init__(self, name: str, backends: List, ttl: float):
+        self.name = name
+        self.backends = backends
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counters = {"misses": 0, **{f"hits_{backend.name}": 0 for backend in backends}}
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, key: str):
+        for index, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                self._count(f"hits_{backend.name}")
+                for faster in self.backends[:index]:
+                    faster.set(key, value, self.ttl)
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value) -> None:
+        for backend in self.backends:
+            backend.set(key, value, self.ttl)
+
+    def delete(self, key: str) -> None:
+        for backend in self.backends:
+            backend.delete(key)
+
+    def clear(self) -> None:
+        for backend in self.backends:
+            backend.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = sum(stats.values())
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+def create_cache(name: str, backend_names: str, ttl: float, memory_entries: int, sqlite_entries: int) -> TTLCache:
+    """
+    Build a TTLCache from a comma-separated backend list such as "memory,sqlite".
+    Unknown backend names are logged and ignored.
+    """
+    backends = []
+    for backend_name in [b.strip() for b in backend_names.split(",") if b.strip()]:
+        if backend_name == "memory":
+            backends.append(MemoryCacheBackend(max_entries=memory_entries))
+        elif backend_name == "sqlite":
+            backends.append(SQLiteCacheBackend(CACHE_DB_PATH, namespace=name, max_entries=sqlite_entries))
+        else:
+            logging.error(f"Unknown cache backend '{backend_name}' for {name} cache; ignoring it.")
+    return TTLCache(name, backends, ttl)
+
+
+class _InFlightCall:
+    """One running computation and the outcome shared with everyone waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution. The first
+    caller (the leader) runs the function; callers that arrive while it is
+    still running wait for it and get the same result, or the same exception.
+    Nothing is kept once the call finishes, so this only deduplicates work that
+    overlaps in time; remembering results is left to the caches.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[str, _InFlightCall] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "collapsed": 0}
+
+    def _count(self, role: str) -> None:
+        with self._lock:
+            self._counters["leaders" if role == "leader" else "collapsed"] += 1
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role=role)
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[object, bool]:
+        """
+        Run fn(*args, **kwargs) unless an identical call is already in flight.
+        Returns (result, collapsed), where collapsed is True when the result
+        came from another caller's execution.
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _InFlightCall()
+
+        if not is_leader:
+            self._count("collapsed")
+            with span(f"{self.name}.collapsed"):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        self._count("leader")
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._calls)}
+
+
+search_cache = create_cache(
+    "search", SEARCH_CACHE_BACKENDS, SEARCH_CACHE_TTL,
+    memory_entries=SEARCH_CACHE_MEMORY_ENTRIES, sqlite_entries=SEARCH_CACHE_SQLITE_ENTRIES
+)
+search_flight = SingleFlight("search", enabled=SINGLE_FLIGHT_ENABLED)
+
+
+def cached_search(provider: str, fetch: Callable[..., List[Dict]], query: str, **params) -> List[Dict]:
+    """
+    Return search hits for the query from the search cache, calling fetch on a miss.
+    The key covers the provider, the normalized query and every provider parameter.
+    Concurrent misses for the same key share one fetch through search_flight.
+    Exceptions from fetch propagate and nothing is cached for them.
+    """
+    key = make_cache_key(provider, query, **params)
+    hits = search_cache.get(key)
+    if hits is not None:
+        logging.info(f"Search cache hit for {provider}: {query}")
+        return hits
+
+    def fetch_and_store() -> List[Dict]:
+        fetched = fetch(query, **params)
+        search_cache.set(key, fetched)
+        return fetched
+
+    hits, collapsed = search_flight.do(key, fetch_and_store)
+    if collapsed:
+        logging.info(f"Search for {provider} joined an identical in-flight call: {query}")
+    return hits
+
+# Words that carry no topic on their own; dropped so "what is OTIF" and
+# "what is MABD" are not considered near-duplicates.
+EMBEDDING_STOPWORDS = frozenset(
+    "a an and are as at be can could do does for from how i in is it me my of on or "
+    "should that the this to we what when where which who why will with would you your".split()
+)
+
+
+def embed_question(text: str, dim: int = 1024) -> np.ndarray:
+    """
+    Embed a question as an L2-normalized vector of hashed features: content
+    words, word bigrams and character trigrams, with log-scaled counts.
+    Cheap enough to run on every request and needs no model or external service.
+    """
+    words = [w for w in re.findall(r"[a-z0-9]+", normalize_query(text)) if w not in EMBEDDING_STOPWORDS]
+    features = list(words)
+    features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        vector[zlib.crc32(feature.encode("utf-8")) % dim] += 1.0
+    np.log1p(vector, out=vector)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# Words that never change what answer a question needs; everything else,
+# including question words, modals and prepositions, is part of the answer key.
+ANSWER_KEY_STOPWORDS = frozenset(
+    "a an the is are be do does i me my we our you your it its this that".split()
+)
+
+
+def answer_cache_key(text: str) -> Tuple[str, ...]:
+    """
+    Words and numbers of the normalized question in order, without
+    ANSWER_KEY_STOPWORDS: "What is the OTIF target?" and "what is OTIF target"
+    share a key, "Where do I ship?" and "Should I ship?" do not. A question made
+    only of stopwords keys on all of its words.
+    """
+    words = tuple(re.findall(r"[a-z0-9]+", normalize_query(text)))
+    return tuple(w for w in words if w not in ANSWER_KEY_STOPWORDS) or words
+
+
+class AnswerCache:
+    """
+    In-process cache of final answers, keyed on answer_cache_key so rewordings
+    that differ only in articles, pronouns, case and punctuation share an
+    entry. Entries expire after ttl and the least recently used entry is
+    evicted when the cache is full.
+    """
 
-# Validate environment variables
-if not all([OPENROUTER_API_KEY, GOOGLE_API_KEY, CUSTOM_SEARCH_ENGINE_ID, YDC_API_KEY]):
-    logging.error("One or more required API keys are missing. Please check your environment variables.")
-    raise ValueError("Missing required API keys")
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # answer key -> (expires_at, question, answer), in least-recently-used order
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[float, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "variant_hits": 0, "misses": 0}
+
+    def get(self, question: str) -> Optional[str]:
+        key = answer_cache_key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            if normalize_query(entry[1]) == normalize_query(question):
+                self._counters["exact_hits"] += 1
+            else:
+                self._counters["variant_hits"] += 1
+                logging.info(f"Answer cache hit on a rewording of '{entry[1]}'")
+            return entry[2]
+
+    def set(self, question: str, answer: str) -> None:
+        key = answer_cache_key(question)
+        with self._lock:
+            self._entries.pop(key, None)
+            # Drop expired entries before evicting live ones
+            now = time.time()
+            for expired_key in [k for k, entry in self._entries.items() if entry[0] < now]:
+                del self._entries[expired_key]
+            while len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+            self._entries[key] = (now + self.ttl, question, answer)
+
+    def invalidate(self, question: Optional[str] = None) -> int:
+        """
+        Remove the entry for a question (shared with its rewordings), or every
+        entry when no question is given. Returns the number of entries removed.
+        """
+        with self._lock:
+            if question is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            return int(self._entries.pop(answer_cache_key(question), None) is not None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries))
+        lookups = stats["exact_hits"] + stats["variant_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL)
 
 # ==============================================================================
-# 2. Utility Functions
+# 5. Utility Functions
 # ==============================================================================
 
+class KeywordMatcher:
+    """
+    Precompiled matcher over the Walmart keyword list. Keyword phrases are split
+    into words and stored in a trie, so a question is tokenized once and every
+    phrase starting at each word is found with dictionary lookups, instead of
+    running one regex per keyword.
+    """
+
+    _TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+    _END = ""  # trie key marking the end of a phrase; never a real token
+
+    def __init__(self, keywords: List[str], version: str = "unversioned"):
+        self.version = version
+        self.keywords = keywords
+        self.trie: Dict = {}
+        for keyword in keywords:
+            node = self.trie
+            for token in self.tokenize(keyword):
+                node = node.setdefault(token, {})
+            node[self._END] = keyword
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return cls._TOKEN_PATTERN.findall(text.lower())
+
+    @classmethod
+    def from_file(cls, path: str) -> "KeywordMatcher":
+        """Load a keyword file: one phrase per line, "#" comments, "# version: N" header."""
+        keywords = []
+        version = "unversioned"
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if line.startswith("#"):
+                    if line[1:].strip().lower().startswith("version:"):
+                        version = line.split(":", 1)[1].strip()
+                    continue
+                if line:
+                    keywords.append(line)
+        return cls(keywords, version)
+
+    def find_all(self, text: str) -> List[str]:
+        """Return every keyword phrase found in the text, in order of first appearance."""
+        tokens = self.tokenize(text)
+        matched = {}
+        for start in range(len(tokens)):
+            node = self.trie.get(tokens[start])
+            position = start + 1
+            while node is not None:
+                if self._END in node:
+                    matched.setdefault(node[self._END], None)
+                if position == len(tokens):
+                    break
+                node = node.get(tokens[position])
+                position += 1
+        return list(matched)
+
+
+@lru_cache(maxsize=1)
+def get_keyword_matcher() -> KeywordMatcher:
+    matcher = KeywordMatcher.from_file(WALMART_KEYWORDS_PATH)
+    logging.info(f"Loaded Walmart keyword list v{matcher.version} ({len(matcher.keywords)} keywords).")
+    return matcher
+
+
+def find_walmart_keywords(question: str) -> List[str]:
+    """Return every Walmart keyword found in the question."""
+    return get_keyword_matcher().find_all(question)
+
+
 def hardcoded_walmart_check(question: str) -> bool:
     """
     Perform a quick, hardcoded relevance check to determine if the question
     is likely related to Walmart suppliers, Walmart's processes, or
     selling products through Walmart. 
     """
-    question_normalized = question.lower().translate(str.maketrans('', '', string.punctuation))
-
-    # Expanded list of keywords and phrases related to Walmart suppliers & processes
-    walmart_keywords = [
-        r"\bwalmart\b", r"\bsam['s]? club\b", r"\bwalmart connect\b", r"\bretail link\b", r"\bsupplier center\b",
-        r"\bwalmart supplier portal\b", r"\bmodular\b", r"\bin-store merchandising\b",
-        r"\bsupplier agreement\b", r"\bwalmart terms\b", r"\bstore planning\b", r"\bon-time in full\b",
-        r"\botif\b", r"\bsustainability\b", r"\bcompliance\b", r"\belectronic product code\b",
-        r"\bepc\b", r"\bpackaging\b", r"\bshipping\b", r"\bwarehouse\b", r"\bdelivery\b",
-        r"\bdistribution center\b", r"\bsupplier security\b", r"\bglobal supplier\b", r"\bedi\b",
-        r"\binvoice\b", r"\bupc\b", r"\bbarcode\b", r"\blabeling\b", r"\bfreight\b",
-        r"\bcollect-ready\b", r"\bmust arrive by date\b", r"\bmabd\b", r"\binventory management\b",
-        r"\bforecasting\b", r"\breplenishment\b", r"\bgeneral merchandise\b", r"\bproduct listing\b",
-        r"\bexecution requirements\b", r"\boms\b", r"\blogistics\b", r"\bvendor agreement\b",
-        r"\bonline marketplace\b", r"\bthird-party marketplace\b", r"\bwalmart marketplace\b",
-        r"\bvba\b", r"\bsupplier compliance\b", r"\bsuppliers?\b", r"\bsupply chain\b", r"\bmerchandise\b",
-        r"\bpurchase order\b", r"\bpo\b", r"\bcase pack\b", r"\bmaster pack\b", r"\bpackaging specification\b",
-        r"\bitem file\b", r"\breceiving\b", r"\bcarrier\b", r"\bpayables\b", r"\bvpn\b",
-        r"\bnew item setup\b", r"\bmod creation\b", r"\bmod changes\b", r"\brack and stack\b",
-        r"\bshelf management\b", r"\bmarket manager\b", r"\baccount manager\b", r"\bin-store compliance\b",
-        r"\bin-store standards\b", r"\bhazardous materials\b", r"\bhazmat\b", r"\bstorm compliance\b",
-        r"\brfid\b", r"\bgs1\b", r"\bglobal data synchronization network\b", r"\bgdsn\b",
-        r"\bdata sync\b", r"\bretail industry\b", r"\bclub channel\b", r"\bprivate label\b",
-        r"\bgreat value\b", r"\bbrand guidelines\b", r"\bpackaging design\b", r"\bexecution tracking\b",
-        r"\breturns policy\b", r"\bwalmart store returns\b", r"\bstore claims\b", r"\bdispute resolution\b",
-        r"\bvendor compliance\b", r"\bmonetary fines\b", r"\bchargebacks\b", r"\broot cause\b",
-        r"\bglobal compliance\b", r"\bproduct safety\b", r"\bfood safety\b", r"\bbakery supplier\b",
-        r"\bproduce supplier\b", r"\bmeat supplier\b", r"\bconsumables supplier\b", r"\bhealth and wellness supplier\b",
-        r"\bonline grocery\b", r"\bclick and collect\b", r"\bpickup tower\b", r"\bdrone delivery\b",
-        r"\bjet.com\b", r"\bfulfillment\b", r"\bwalmart fulfillment services\b", r"\breturns center\b",
-        r"\bapparel supplier\b", r"\belectronics supplier\b", r"\btoy supplier\b", r"\bimport requirements\b",
-        r"\btariffs\b", r"\bharmonized tariff schedule\b", r"\bhs code\b", r"\bcountry of origin\b",
-        r"\blead time\b", r"\bmodule changes\b", r"\bexecution guide\b", r"\bcompliance guide\b",
-        r"\bcorporate compliance\b", r"\bcorporate responsibility\b", r"\bethics\b", r"\bconduct\b",
-        r"\binvoice matching\b", r"\baccounts payable\b", r"\bremittance\b", r"\bbilling disputes\b",
-        r"\bremittance advice\b", r"\bpayment terms\b", r"\bsam's club suppliers?\b",
-        r"\bselling at walmart\b", r"\bproduct onboarding\b", r"\bproduct compliance\b",
-        r"\bonline item file\b", r"\bproduct development\b", r"\bwalmart labs\b", r"\bmerchandising portal\b"
-    ]
-
-    for keyword in walmart_keywords:
-        if re.search(keyword, question_normalized):
-            logging.info(f"Hardcoded Walmart relevance check passed for keyword: {keyword}")
-            return True
+    matched = find_walmart_keywords(question)
+    if matched:
+        logging.info(f"Hardcoded Walmart relevance check passed for keywords: {matched}")
+        return True
 
     logging.info("Hardcoded Walmart relevance check failed.")
     return False
 
 
-def is_walmart_supplier_related(question: str, snippets: str) -> bool:
-    """
-    Use GPT-4o to determine if a question is related to Walmart supplier issues,
-    Walmart processes, or Walmart-specific retail topics by checking provided snippets.
-    """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    
+def build_relevancy_request(question: str, snippets: str) -> Tuple[Dict, Dict]:
+    """Build the headers and payload for the GPT-4o relevancy check."""
     headers = {
         "Authorization": f"Bearer {OPENROUTER_DIF_API_KEY}",
         "HTTP-Referer": "https://marketmentor.com",  # Optional for analytics
@@ -144,56 +1496,233 @@ Respond with 'true' if any snippet suggests the question is about Walmart suppli
         "max_tokens": 50
     }
 
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"].strip()
-
-        if content.lower().startswith('true'):
-            decision = True
-            explanation = content[4:].strip()
-        elif content.lower().startswith('false'):
-            decision = False
-            explanation = content[5:].strip()
-        else:
-            decision = False
-            explanation = "Unexpected response format from API."
+    return headers, payload
 
-        logging.info(f"AI-based Walmart relevance check decision: {decision}, Explanation: {explanation}")
-        return decision
+
+def parse_relevancy_decision(content: str) -> bool:
+    """
+    Turn the relevancy model's 'true'/'false' reply into a decision. Raises
+    ValueError on any other reply, so callers treat it like a failed call and
+    neither cache nor log a decision the model never made.
+    """
+    content = content.strip()
+    if content.lower().startswith('true'):
+        decision = True
+        explanation = content[4:].strip()
+    elif content.lower().startswith('false'):
+        decision = False
+        explanation = content[5:].strip()
+    else:
+        raise ValueError(f"Unexpected response format from API: {content[:100]!r}")
+
+    logging.info(f"AI-based Walmart relevance check decision: {decision}, Explanation: {explanation}")
+    return decision
+
+
+def ai_relevancy_decision(question: str, snippets: str) -> bool:
+    """
+    Use GPT-4o to determine if a question is related to Walmart supplier issues,
+    Walmart processes, or Walmart-specific retail topics by checking provided snippets.
+    Raises if the model call fails or its reply is not a decision.
+    """
+    headers, payload = build_relevancy_request(question, snippets)
+    response = http_request("POST", OPENROUTER_URL, operation="gate", json=payload, headers=headers)
+    response.raise_for_status()
+    return parse_relevancy_decision(completion_content(response.json(), payload["model"]))
+
+
+def is_walmart_supplier_related(question: str, snippets: str) -> bool:
+    """
+    Error-tolerant wrapper around ai_relevancy_decision: any failure is logged
+    and treated as not related.
+    """
+    try:
+        return ai_relevancy_decision(question, snippets)
     except Exception as e:
         logging.error(f"Error in Walmart relevancy check: {e}")
         return False
 
 
+def load_relevance_model(path: str) -> Optional["RelevanceModel"]:
+    """Load the local relevance classifier; None (AI gate only) when it is missing or unreadable."""
+    if not os.path.exists(path):
+        logging.info(f"No relevance model at {path}; every keyword-gate miss goes to the AI gate.")
+        return None
+    try:
+        from relevance_model import RelevanceModel
+        model = RelevanceModel.load(path)
+        logging.info(f"Loaded relevance model from {path} ({model.dim} features).")
+        return model
+    except Exception as e:
+        logging.error(f"Could not load relevance model from {path}: {e}")
+        return None
+
+
+@lru_cache(maxsize=1)
+def get_relevance_model() -> Optional["RelevanceModel"]:
+    return load_relevance_model(RELEVANCE_MODEL_PATH)
+
+
+def local_relevance_decision(question: str) -> Optional[bool]:
+    """
+    Score the question with the local classifier. Returns False for a clear
+    reject, True for a clear accept (only when RELEVANCE_ACCEPT_SCORE is set),
+    or None when the AI gate has to decide (including when no model is loaded).
+    """
+    model = get_relevance_model()
+    if model is None:
+        return None
+    with span("local_classifier") as record:
+        score = record["score"] = round(model.score(question), 4)
+    if score >= RELEVANCE_ACCEPT_SCORE:
+        logging.info(f"Local relevance classifier accepted the question (score {score:.3f}).")
+        return True
+    if score <= RELEVANCE_REJECT_SCORE:
+        logging.info(f"Local relevance classifier rejected the question (score {score:.3f}).")
+        return False
+    logging.info(f"Local relevance classifier is unsure (score {score:.3f}); escalating to the AI gate.")
+    return None
+
+
+_decision_log_lock = threading.Lock()
+
+
+def log_gate_decision(question: str, relevant: bool) -> None:
+    """Append an AI gate decision to RELEVANCE_DECISION_LOG in the classifier's training format."""
+    if not RELEVANCE_DECISION_LOG:
+        return
+    line = json.dumps({"question": question, "relevant": relevant, "source": "ai_gate",
+                       "decided_at": datetime.now(timezone.utc).isoformat()})
+    try:
+        with _decision_log_lock, open(RELEVANCE_DECISION_LOG, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+    except OSError as e:
+        logging.error(f"Could not write relevance decision log: {e}")
+
+
 def count_distinct_options(question: str, pattern: str) -> int:
     matches = re.findall(pattern, question, re.IGNORECASE)
     return len(set(matches))
 
-@lru_cache(maxsize=1000)
-def get_cached_walmart_relevancy_check(question: str, snippets: str) -> bool:
-    """Cached version of the Walmart relevancy check."""
-    return is_walmart_supplier_related(question, snippets)
 
-def check_relevancy_with_cache(question: str, snippets: str) -> bool:
-    """Interface for cached relevancy check."""
-    question_normalized = question.lower().strip()
-    question_hash = md5(question_normalized.encode()).hexdigest()
-    return get_cached_walmart_relevancy_check(question, snippets)
+relevancy_cache = create_cache(
+    "relevancy", RELEVANCY_CACHE_BACKENDS, RELEVANCY_CACHE_TTL,
+    memory_entries=RELEVANCY_CACHE_MEMORY_ENTRIES, sqlite_entries=RELEVANCY_CACHE_SQLITE_ENTRIES
+)
 
-# ==============================================================================
-# 3. API Integration Functions
-# ==============================================================================
 
-def perform_web_search(query, time_restricted=False, num_results=10):
+relevancy_flight = SingleFlight("relevancy", enabled=SINGLE_FLIGHT_ENABLED)
+
+
+def check_relevancy_with_cache(question: str) -> bool:
     """
-    Perform a Google search (STANDARD).
-    Used to gather Walmart-specific knowledge from general web results.
+    AI-based relevancy check with a persistent decision cache keyed on the
+    question fingerprint. On a hit neither the You.com snippet search nor the
+    GPT-4o call is made; concurrent misses for the same fingerprint share one
+    check. Decisions are only cached when both the snippet search and the model
+    call succeeded.
     """
-    logging.info(f"\n{'='*80}\nPERFORMING GOOGLE SEARCH (STANDARD)\n{'='*80}")
-    logging.info(f"Query: {query}")
+    key = question_fingerprint(question)
+    decision = relevancy_cache.get(key)
+    if decision is not None:
+        logging.info(f"Relevancy cache hit: decision {decision}.")
+        return decision
+
+    decision, collapsed = relevancy_flight.do(key, _check_relevancy_uncached, question, key)
+    if collapsed:
+        logging.info(f"Relevancy check joined an identical in-flight check: decision {decision}.")
+    return decision
+
+
+NO_SNIPPETS_NOTE = "(No search snippets are available right now; decide from the question alone.)"
+
+
+def _check_relevancy_uncached(question: str, key: str) -> bool:
+    # Perform AI-based relevance check with a limited snippet from You.com
+    with span("search.you.com.gate"):
+        snippets = perform_you_search(question, num_results=5)
+    try:
+        decision = ai_relevancy_decision(question, snippets or NO_SNIPPETS_NOTE)
+    except Exception as e:
+        logging.error(f"Error in Walmart relevancy check: {e}")
+        return False
+
+    # A decision made without snippets is not cached, so it is retried once search recovers
+    if snippets is not None:
+        relevancy_cache.set(key, decision)
+        log_gate_decision(question, decision)
+    return decision
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for deduplication: no scheme, "www.", fragment or trailing slash."""
+    url = re.sub(r"^[a-z]+://", "", (url or "").strip().lower())
+    url = url.split("#", 1)[0].rstrip("/")
+    return url[4:] if url.startswith("www.") else url
+
+
+# Universal hashing (a * h + b) mod p over 32-bit shingle hashes; p < 2^32 keeps a * h within uint64
+MINHASH_PERMUTATIONS = 64
+_MINHASH_PRIME = np.uint64(4294967291)
+
+
+@lru_cache(maxsize=1)
+def minhash_permutations() -> Tuple[np.ndarray, np.ndarray]:
+    """The (a, b) columns of the hash family; built on first use since numpy.random is slow to import."""
+    rng = np.random.default_rng(20240521)
+    a = rng.integers(1, int(_MINHASH_PRIME), MINHASH_PERMUTATIONS, dtype=np.uint64)[:, None]
+    b = rng.integers(0, int(_MINHASH_PRIME), MINHASH_PERMUTATIONS, dtype=np.uint64)[:, None]
+    return a, b
+
+
+def minhash_signature(text: str, shingle_size: int = 3) -> np.ndarray:
+    """
+    MinHash signature of the text's word shingles. The fraction of equal
+    positions in two signatures estimates the Jaccard similarity of their
+    shingle sets.
+    """
+    words = KeywordMatcher.tokenize(text)
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64) % _MINHASH_PRIME
+    a, b = minhash_permutations()
+    return ((a * hashes + b) % _MINHASH_PRIME).min(axis=1)
+
 
-    url = "https://www.googleapis.com/customsearch/v1"
+def rank_passages(question: str, passages: List[Dict], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """
+    BM25 score of each passage against the question, with idf taken from the
+    passages themselves. Stopwords in the question are ignored.
+    """
+    terms = {t for t in KeywordMatcher.tokenize(question) if t not in EMBEDDING_STOPWORDS}
+    documents = [KeywordMatcher.tokenize(f"{p['title']} {p['text']}") for p in passages]
+    if not terms or not documents:
+        return [0.0] * len(passages)
+
+    avg_length = sum(len(d) for d in documents) / len(documents) or 1.0
+    frequency = {t: sum(1 for d in documents if t in d) for t in terms}
+    scores = []
+    for document in documents:
+        counts = {}
+        for token in document:
+            if token in terms:
+                counts[token] = counts.get(token, 0) + 1
+        norm = k1 * (1 - b + b * len(document) / avg_length)
+        scores.append(sum(
+            np.log1p((len(documents) - frequency[t] + 0.5) / (frequency[t] + 0.5)) * tf * (k1 + 1) / (tf + norm)
+            for t, tf in counts.items()
+        ))
+    return [float(score) for score in scores]
+
+# ==============================================================================
+# 6. API Integration Functions
+# ==============================================================================
+
+def build_google_search_params(query: str, time_restricted: bool = False, num_results: int = 10) -> Dict:
+    """Build the query parameters for a Google Custom Search call."""
     params = {
         "key": GOOGLE_API_KEY,
         "cx": CUSTOM_SEARCH_ENGINE_ID,
@@ -207,39 +1736,48 @@ def perform_web_search(query, time_restricted=False, num_results=10):
         params["dateRestrict"] = "d365"
         params["sort"] = "date"
 
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        search_data = response.json()
-
-        results = []
-        for item in search_data.get("items", []):
-            results.append(
-                f"Title: {item.get('title', 'No Title')}\n"
-                f"URL: {item.get('link', 'No Link')}\n"
-                f"Snippet: {item.get('snippet', 'No Snippet')}"
-            )
+    return params
 
-        final_results = "\n\n".join(results) if results else "No relevant search results found."
 
-        if results:
-            logging.info(f"Google search completed, found {len(results)} results.")
-        else:
-            logging.info("No relevant search results found from Google search.")
+def parse_google_hits(search_data: Dict) -> List[Dict]:
+    """Keep the fields we use (title, link, snippet) from a Google Custom Search response."""
+    return [
+        {"title": item.get("title"), "link": item.get("link"), "snippet": item.get("snippet")}
+        for item in search_data.get("items", [])
+    ]
 
-        return final_results
-    except Exception as e:
-        logging.error(f"Error in web search: {e}")
-        return f"(Error: {str(e)})"
+
+def format_google_hits(items: List[Dict]) -> str:
+    """Format Google hits as the text block embedded in the prompt."""
+    results = []
+    for item in items:
+        results.append(
+            f"Title: {item.get('title') or 'No Title'}\n"
+            f"URL: {item.get('link') or 'No Link'}\n"
+            f"Snippet: {item.get('snippet') or 'No Snippet'}"
+        )
+
+    if results:
+        logging.info(f"Google search completed, found {len(results)} results.")
+    else:
+        logging.info("No relevant search results found from Google search.")
+
+    return "\n\n".join(results) if results else "No relevant search results found."
 
 
-def perform_you_search(query, num_results=15):
+def fetch_google_hits(query: str, time_restricted: bool = False, num_results: int = 10) -> List[Dict]:
     """
-    Perform search using the You.com API for Walmart-related questions.
+    Call Google Custom Search and return the raw result items (title, link, snippet).
+    Raises on upstream errors so failed searches are never cached.
     """
-    logging.info(f"\n{'='*80}\nPERFORMING YOU.COM SEARCH\n{'='*80}")
-    logging.info(f"Search query: {query}")
+    params = build_google_search_params(query, time_restricted, num_results)
+    response = http_request("GET", GOOGLE_SEARCH_URL, hedge=True, params=params)
+    response.raise_for_status()
+    return parse_google_hits(response.json())
+
 
+def build_you_search_request(query: str, num_results: int = 15) -> Tuple[Dict, Dict]:
+    """Build the headers and query parameters for a You.com search call."""
     headers = {
         "X-API-Key": YDC_API_KEY
     }
@@ -251,48 +1789,81 @@ def perform_you_search(query, num_results=15):
         "country": "US"
     }
 
-    try:
-        response = requests.get(
-            "https://api.ydc-index.io/search",
-            headers=headers,
-            params=params
+    return headers, params
+
+
+def parse_you_hits(data: Dict, num_results: int = 15) -> List[Dict]:
+    """Keep the fields we use (title, url, description, snippets) from a You.com response."""
+    return [
+        {
+            "title": hit.get("title"),
+            "url": hit.get("url"),
+            "description": hit.get("description"),
+            "snippets": hit.get("snippets", []),
+        }
+        for hit in data.get("hits", [])[:num_results]
+    ]
+
+
+def format_you_hits(hits: List[Dict]) -> str:
+    """Format You.com hits as the text block embedded in prompts."""
+    results = []
+    for hit in hits:
+        combined_snippets = ' '.join(hit.get('snippets') or [])
+        description = hit.get('description') or 'No Description'
+
+        results.append(
+            f"Title: {hit.get('title') or 'No Title'}\n"
+            f"URL: {hit.get('url') or 'No URL'}\n"
+            f"Description: {description}\n"
+            f"Snippet: {combined_snippets}"
         )
-        response.raise_for_status()
-        data = response.json()
-
-        results = []
-        for hit in data.get('hits', [])[:num_results]:
-            combined_snippets = ' '.join(hit.get('snippets', []))
-            description = hit.get('description', 'No Description')
-
-            results.append(
-                f"Title: {hit.get('title', 'No Title')}\n"
-                f"URL: {hit.get('url', 'No URL')}\n"
-                f"Description: {description}\n"
-                f"Snippet: {combined_snippets}"
-            )
 
-        final_results = "\n\n".join(results) if results else "No relevant You.com search results found."
+    if results:
+        logging.info(f"You.com search completed, found {len(results)} results.")
+    else:
+        logging.info("No relevant You.com search results found.")
 
-        if results:
-            logging.info(f"You.com search completed, found {len(results)} results.")
-        else:
-            logging.info("No relevant You.com search results found.")
+    return "\n\n".join(results) if results else "No relevant You.com search results found."
 
-        return final_results
-    except Exception as e:
-        error_msg = f"Error in You.com search: {e}"
-        logging.error(error_msg)
-        return f"(Error: {str(e)})"
+
+def fetch_you_hits(query: str, num_results: int = 15) -> List[Dict]:
+    """
+    Call the You.com search API and return the raw hits (title, url, description, snippets).
+    Raises on upstream errors so failed searches are never cached.
+    """
+    headers, params = build_you_search_request(query, num_results)
+    response = http_request("GET", YDC_SEARCH_URL, hedge=True, headers=headers, params=params)
+    response.raise_for_status()
+    return parse_you_hits(response.json(), num_results)
 
 
-def create_system_prompt(context_combined):
+def perform_you_search(query, num_results=15) -> Optional[str]:
     """
-    Create system prompt with essential requirements for Walmart supplier Q&A.
-    We only cite official Walmart documents if relevant in the provided context.
-    The style is an enthusiastic consultant well-versed in Walmart corporate requirements.
+    Perform search using the You.com API for Walmart-related questions.
+    Results are served from the search cache when a matching query was seen recently.
+    Returns None when the search fails, so callers never put error text into a prompt.
     """
-    base_prompt = f"""You are Market Mentor, an enthusiastic consultant intimately familiar with Walmart’s corporate requirements, supplier processes, and best practices. You provide thorough, accurate, and helpful answers about how to sell products at Walmart, navigate supplier systems, and comply with corporate policies.
+    logging.info(f"\n{'='*80}\nPERFORMING YOU.COM SEARCH\n{'='*80}")
+    logging.info(f"Search query: {query}")
+
+    try:
+        hits = cached_search("you.com", fetch_you_hits, query, num_results=num_results)
+        return format_you_hits(hits)
+    except Exception as e:
+        logging.error(f"Error in You.com search: {e}")
+        return None
+
+
+ANSWER_MODEL = "anthropic/claude-3.5-sonnet"
+
+# Instructions for the answer call: the style of an enthusiastic consultant
+# well-versed in Walmart corporate requirements, citing official Walmart
+# documents only when they appear in the context. Kept free of per-request
+# content so every call starts with the same bytes (the cacheable prefix). The
+# glossary of supplier terms grounds terminology and also keeps the prefix
+# above PROMPT_CACHE_MIN_TOKENS, below which the cache marker is ignored.
+ANSWER_INSTRUCTIONS = """You are Market Mentor, an enthusiastic consultant intimately familiar with Walmart’s corporate requirements, supplier processes, and best practices. You provide thorough, accurate, and helpful answers about how to sell products at Walmart, navigate supplier systems, and comply with corporate policies.
 
 **RESPONSE REQUIREMENTS:**
 
@@ -327,24 +1898,71 @@ def create_system_prompt(context_combined):
 7. **Focus**:
    - Always relate your answer to Walmart’s supplier processes, compliance, and corporate requirements.
 
-Here is your CONTEXT:
-
-{context_combined}
-
+8. **Terminology**:
+   - Use the glossary below to interpret questions and to explain terms consistently. It describes what the terms mean, not current targets, fees or deadlines: take those only from the context, and never cite the glossary itself.
+
+**GLOSSARY OF WALMART SUPPLIER TERMS:**
+
+- **OTIF (On-Time In-Full)**: Walmart’s measure of whether purchase orders arrive within their delivery window and with the full ordered quantity, tracked separately for collect and prepaid shipments. Suppliers below the current target can be charged a fee based on the cost of the non-compliant cases.
+- **MABD (Must Arrive By Date)**: The date on a purchase order by which the shipment must arrive at the receiving distribution center or store; it anchors the on-time part of OTIF.
+- **Collect freight**: Walmart arranges and pays for transportation from the supplier’s ship point; the supplier must have the load ready for pickup on the scheduled date.
+- **Prepaid freight**: The supplier arranges and pays for transportation and is responsible for booking a delivery appointment that meets the MABD.
+- **Distribution center (DC)**: A Walmart facility that receives supplier freight and ships it on to stores; regional, grocery, import and e-commerce fulfillment centers follow different receiving rules.
+- **DSV (Drop Ship Vendor)**: A supplier that ships Walmart.com orders directly to customers from its own inventory.
+- **Marketplace seller**: A third-party seller listing on Walmart.com under a seller agreement, as opposed to a supplier selling to Walmart on a purchase order (first party).
+- **WFS (Walmart Fulfillment Services)**: Walmart’s fulfillment program in which marketplace sellers store inventory in Walmart fulfillment centers and Walmart ships their orders.
+- **Retail Link and Walmart Luminate**: Walmart’s supplier data tools for point-of-sale, inventory, forecast and performance reporting.
+- **Supplier Center and Supplier One**: Walmart’s supplier portals for onboarding, item setup, agreements and support requests.
+- **Item setup**: Creating an item in Walmart’s systems with its GTIN, attributes, pack quantities, dimensions and cost before it can be ordered.
+- **GTIN/UPC**: The GS1 product identifiers Walmart uses for items; each pack level (each, inner, case) carries its own GTIN.
+- **Vendor pack and warehouse pack**: The vendor pack is the case quantity the supplier ships to Walmart; the warehouse pack is the quantity a DC ships to a store.
+- **EDI (Electronic Data Interchange)**: The standard documents exchanged with Walmart, including the 850 purchase order, 855 acknowledgment, 856 advance ship notice (ASN) and 810 invoice.
+- **ASN (Advance Ship Notice)**: The EDI 856 sent when a shipment leaves, listing its contents and labels; it must match the physical freight.
+- **GS1-128 / SSCC label**: The barcode label identifying each pallet or case, whose Serial Shipping Container Code ties the physical unit to the ASN.
+- **SQEP (Supplier Quality Excellence Program)**: Walmart’s program of packaging, labeling, loading and shipping requirements, with charges for non-compliance.
+- **Chargebacks and deductions**: Amounts Walmart deducts from supplier invoices for fees, compliance charges, allowances or pricing differences; suppliers can research and dispute them.
+- **Supplier Agreement**: The contract covering a supplier’s terms of trade with Walmart, including payment terms, allowances and policy obligations.
+- **Modular (planogram)**: The shelf layout for a category that decides where, and in how many stores, an item is placed.
+- **Replenishment**: The Walmart team and systems that forecast demand and generate purchase orders for items in the modular.
+- **EDLP (Everyday Low Price) and Rollback**: Walmart’s pricing strategy of steady low prices, and its temporary price reductions.
+- **Private brands**: Walmart-owned brands made by contract manufacturers under Walmart’s own specifications and audits.
+- **Responsible sourcing**: Walmart’s standards and audit requirements for the factories and facilities that make products it sells.
+- **Walmart Connect**: Walmart’s retail media business, selling advertising on Walmart’s sites, apps and stores.
+- **Sam’s Club**: Walmart’s membership warehouse club, with its own buyers, item setup and supplier requirements.
+
+The CONTEXT from the searches follows these instructions.
 When you answer, incorporate relevant context from the searches if it helps. 
 If no official Walmart sources are present in the context, you may reference the general idea of official Walmart documentation without inventing specific titles or URLs.
 """
-    return base_prompt
 
 
-def query_claude_with_context(question: str, context: str) -> str:
-    """
-    Query the AI model with the constructed prompt and user question.
-    """
-    url = "https://openrouter.ai/api/v1/chat/completions"
+def answer_instructions_block() -> Dict:
+    """The fixed first system block, marked for prompt caching when the answer model supports it."""
+    block = {"type": "text", "text": ANSWER_INSTRUCTIONS}
+    if PROMPT_CACHE_ENABLED and ANSWER_MODEL.startswith("anthropic/"):
+        block["cache_control"] = {"type": "ephemeral"}
+        prefix_tokens = estimate_tokens(ANSWER_INSTRUCTIONS)
+        if prefix_tokens < PROMPT_CACHE_MIN_TOKENS:
+            logging.info(f"Answer instructions are ~{prefix_tokens} tokens, below the {PROMPT_CACHE_MIN_TOKENS}-token "
+                         f"minimum for prompt caching; the cache marker has no effect until they grow past it.")
+    return block
+
+
+ANSWER_INSTRUCTIONS_BLOCK = answer_instructions_block()
+
 
-    base_system_prompt = create_system_prompt(context)
+def answer_system_content(context: str) -> List[Dict]:
+    """System message for the answer call: the shared instructions block, then this question's context."""
+    return [ANSWER_INSTRUCTIONS_BLOCK, {"type": "text", "text": f"Here is your CONTEXT:\n\n{context}"}]
 
+
+def build_answer_request(question: str, context: str, stream: bool = False) -> Tuple[Dict, Dict]:
+    """
+    Build the headers and payload for the answer call to Claude via OpenRouter.
+    Shared by the blocking and streaming answer paths. The system message is
+    the fixed instructions block followed by the context, so everything before
+    the context is an identical, cacheable prefix.
+    """
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "HTTP-Referer": "https://marketmentor.com",
@@ -353,53 +1971,164 @@ def query_claude_with_context(question: str, context: str) -> str:
     }
 
     messages = [
-        {"role": "system", "content": base_system_prompt},
+        {"role": "system", "content": answer_system_content(context)},
         {"role": "user", "content": question}
     ]
 
     payload = {
-        "model": "anthropic/claude-3.5-sonnet",
+        "model": ANSWER_MODEL,
         "messages": messages,
         "temperature": 0.7,
         "top_p": 1,
         "repetition_penalty": 1.0,
         "max_tokens": 30000,
     }
+    if stream:
+        payload["stream"] = True
+        # Ask OpenRouter to append token usage to the final streamed chunk
+        payload["usage"] = {"include": True}
+
+    return headers, payload
 
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        response.raise_for_status()
 
-        response_json = response.json()
-        content = response_json['choices'][0]['message']['content']
+def log_answer_stats(question: str, context: str, content: str) -> None:
+    """Log the generated answer and the size of each prompt component."""
+    logging.info(f"\n{'='*80}\nAI RESPONSE GENERATED\n{'='*80}")
+    logging.info(content)
 
-        logging.info(f"\n{'='*80}\nAI RESPONSE GENERATED\n{'='*80}")
-        logging.info(content)
+    # Optional: Log usage stats
+    instructions_length = len(ANSWER_INSTRUCTIONS)
+    context_length = len(context)
+    question_length = len(question)
+    content_length = len(content)
+    logging.info(f"Instructions Length: {instructions_length}")
+    logging.info(f"Context Length: {context_length}")
+    logging.info(f"Question Length: {question_length}")
+    logging.info(f"Response Length: {content_length}")
 
-        # Optional: Log usage stats
-        system_prompt_length = len(base_system_prompt)
-        context_length = len(context)
-        question_length = len(question)
-        content_length = len(content)
-        logging.info(f"System Prompt Length: {system_prompt_length}")
-        logging.info(f"Context Length: {context_length}")
-        logging.info(f"Question Length: {question_length}")
-        logging.info(f"Response Length: {content_length}")
 
+ANSWER_ERROR_MESSAGE = "An error occurred while generating the response. Please try again."
+
+
+def query_claude_with_context(question: str, context: str) -> str:
+    """
+    Query the AI model with the constructed prompt and user question.
+    """
+    headers, payload = build_answer_request(question, context)
+
+    try:
+        response = http_request("POST", OPENROUTER_URL, read_timeout=LLM_READ_TIMEOUT, operation="answer",
+                                json=payload, headers=headers)
+        response.raise_for_status()
+
+        content = completion_content(response.json(), payload["model"])
+
+        log_answer_stats(question, context, content)
         return content
 
     except Exception as e:
         logging.error(f"Error in AI response generation: {str(e)}")
-        return "An error occurred while generating the response. Please try again."
+        return ANSWER_ERROR_MESSAGE
 
 
-def generate_humorous_rejection(question: str) -> str:
+# Sentinel returned by parse_stream_line for the final "data: [DONE]" event
+STREAM_DONE = object()
+
+
+def parse_stream_line(line: str):
     """
-    Generate a witty but professional rejection message if a question
-    is not related to Walmart supplier or corporate processes.
+    Parse one line of an OpenRouter streaming completion. Returns the text delta
+    (or None for keep-alive comments and empty deltas), or STREAM_DONE at the end
+    of the stream. Raises if the stream reports an error.
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    
+    # OpenRouter sends ": OPENROUTER PROCESSING" keep-alive comments between events
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return STREAM_DONE
+    chunk = json.loads(data)
+    if "error" in chunk:
+        raise RuntimeError(chunk["error"].get("message", "Streaming error from OpenRouter"))
+    if chunk.get("usage"):
+        record_token_usage(chunk.get("model", "unknown"), chunk["usage"])
+    choices = chunk.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content")
+
+
+def stream_claude_with_context(question: str, context: str) -> Iterator[str]:
+    """
+    Stream the AI answer as it is generated. Consumes OpenRouter's streaming
+    completion (server-sent events) and yields each text delta as it arrives.
+    Errors are raised to the caller, which decides how to report them.
+    """
+    headers, payload = build_answer_request(question, context, stream=True)
+
+    with http_request("POST", OPENROUTER_URL, read_timeout=LLM_READ_TIMEOUT, operation="answer.stream",
+                      json=payload, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        parts = []
+        for line in response.iter_lines(decode_unicode=True):
+            delta = parse_stream_line(line)
+            if delta is STREAM_DONE:
+                break
+            if delta:
+                parts.append(delta)
+                yield delta
+
+    log_answer_stats(question, context, "".join(parts))
+
+
+FALLBACK_REJECTION_MESSAGE = (
+    "I'm Market Mentor, your friendly Walmart supplier guru. "
+    "I only handle Walmart-related inquiries. Perhaps you'd like to talk about "
+    "product setup, shipping, or compliance? I'm here whenever you're ready!"
+)
+
+
+class RejectionPool:
+    """
+    Pre-written rejection messages served from memory. The order is shuffled
+    once at load and then rotated, so consecutive off-topic questions get
+    different messages.
+    """
+
+    def __init__(self, messages: List[str]):
+        self.messages = list(messages)
+        random.shuffle(self.messages)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "RejectionPool":
+        """Load one message per line, skipping blank lines and "#" comments."""
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                messages = [line.strip() for line in file if line.strip() and not line.lstrip().startswith("#")]
+        except OSError as e:
+            logging.info(f"No rejection message pool ({e}); rejections will be generated.")
+            messages = []
+        return cls(messages)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def next(self) -> Optional[str]:
+        if not self.messages:
+            return None
+        with self._lock:
+            message = self.messages[self._next % len(self.messages)]
+            self._next += 1
+        return message
+
+
+@lru_cache(maxsize=1)
+def get_rejection_pool() -> RejectionPool:
+    return RejectionPool.from_file(REJECTION_MESSAGES_PATH)
+
+
+def build_rejection_request(question: str) -> Tuple[Dict, Dict]:
+    """Build the headers and payload for the humorous rejection call."""
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "HTTP-Referer": "https://marketmentor.com",
@@ -429,27 +2158,423 @@ Craft a short, playful rejection (2-3 sentences) that:
         "max_tokens": 150,
         "top_p": 0.9
     }
-    
+
+    return headers, payload
+
+
+def generate_humorous_rejection(question: str) -> str:
+    """
+    Generate a witty but professional rejection message if a question
+    is not related to Walmart supplier or corporate processes.
+    Served from the in-memory rejection pool when it has messages.
+    """
+    pooled_message = get_rejection_pool().next()
+    if pooled_message is not None:
+        logging.info("Humorous rejection served from the message pool.")
+        return pooled_message
+
+    headers, payload = build_rejection_request(question)
+
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = http_request("POST", OPENROUTER_URL, operation="rejection", json=payload, headers=headers)
         response.raise_for_status()
-        rejection_message = response.json()["choices"][0]["message"]["content"].strip()
+        rejection_message = completion_content(response.json(), payload["model"]).strip()
         
         logging.info("Humorous rejection generated successfully.")
         return rejection_message
     except Exception as e:
         logging.error(f"Error generating humorous rejection: {e}")
-        return (
-            "I'm Market Mentor, your friendly Walmart supplier guru. "
-            "I only handle Walmart-related inquiries. Perhaps you'd like to talk about "
-            "product setup, shipping, or compliance? I'm here whenever you're ready!"
-        )
+        return FALLBACK_REJECTION_MESSAGE
+
+_document_index: Optional["DocumentIndex"] = None
+_document_index_loaded = False
+_document_index_lock = threading.Lock()
+
+
+def get_document_index() -> Optional["DocumentIndex"]:
+    """Open the local document index on first use; None when it is missing or unreadable."""
+    global _document_index, _document_index_loaded
+    if _document_index_loaded:
+        return _document_index
+    with _document_index_lock:
+        if not _document_index_loaded:
+            if os.path.isdir(DOC_INDEX_PATH):
+                try:
+                    from docindex import DocumentIndex
+                    started = time.perf_counter()
+                    _document_index = DocumentIndex(DOC_INDEX_PATH)
+                    logging.info(
+                        f"Loaded local document index ({len(_document_index)} chunks) "
+                        f"in {(time.perf_counter() - started) * 1000:.1f}ms."
+                    )
+                except Exception as e:
+                    logging.error(f"Could not open local document index at {DOC_INDEX_PATH}: {e}")
+            else:
+                logging.info(f"No local document index at {DOC_INDEX_PATH}; using web search only.")
+            _document_index_loaded = True
+    return _document_index
+
+
+@lru_cache(maxsize=256)
+def search_local_documents(question: str) -> Tuple[Dict, ...]:
+    """Top chunks from the local index scoring at least DOC_INDEX_MIN_SCORE."""
+    index = get_document_index()
+    if index is None:
+        return ()
+    started = time.perf_counter()
+    hits = [hit for hit in index.search(question, DOC_INDEX_TOP_K) if hit["score"] >= DOC_INDEX_MIN_SCORE]
+    logging.info(f"Local document search found {len(hits)} chunks in {(time.perf_counter() - started) * 1000:.1f}ms.")
+    return tuple(hits)
+
+
+def context_search_query(question: str) -> str:
+    """Frame the user's question for the context searches."""
+    return f"In the context of Walmart suppliers: {question}"
+
+
+def you_passages(hits: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "title": hit.get("title") or "No Title",
+            "url": hit.get("url") or "",
+            "text": " ".join(filter(None, [hit.get("description")] + list(hit.get("snippets") or []))),
+        }
+        for hit in hits
+    ]
+
+
+def google_passages(items: List[Dict]) -> List[Dict]:
+    return [
+        {"title": item.get("title") or "No Title", "url": item.get("link") or "", "text": item.get("snippet") or ""}
+        for item in items
+    ]
+
+
+def local_passages(hits: Tuple[Dict, ...]) -> List[Dict]:
+    # Chunks of one document share its source path, so they are deduplicated per chunk, not per URL
+    return [
+        {"title": hit["title"], "url": hit["source"], "text": hit["text"],
+         "dedup_key": f"{hit['source']}#{hit['chunk_id']}"}
+        for hit in hits
+    ]
+
+
+def search_you_context(question: str) -> List[Dict]:
+    """You.com results for the answer context (15 hits)."""
+    query = context_search_query(question)
+    logging.info(f"You.com context search: {query}")
+    return you_passages(cached_search("you.com", fetch_you_hits, query, num_results=15))
+
+
+def search_google_context(question: str) -> List[Dict]:
+    """Google results (standard, not date-restricted) for the answer context (10 hits)."""
+    query = context_search_query(question)
+    logging.info(f"Google context search: {query}")
+    return google_passages(cached_search("google", fetch_google_hits, query, time_restricted=False, num_results=10))
+
+
+def search_local_context(question: str) -> List[Dict]:
+    """Chunks from the local supplier document index (no network calls)."""
+    return local_passages(search_local_documents(question))
+
+
+# Search providers used to build the answer context. Each provider receives the
+# raw question and returns passages ({"title", "url", "text"} dicts, best first)
+# that the context-assembly stage deduplicates and packs into the prompt; add an
+# entry here to query another source in parallel without adding wall-clock
+# latency. Providers marked "local" make no paid API calls, and providers that
+# raise are left out of the context.
+SEARCH_PROVIDERS: List[Dict] = [
+    {
+        "name": "local",
+        "title": "WALMART SUPPLIER DOCUMENTS (LOCAL INDEX)",
+        "search": search_local_context,
+        "local": True,
+    },
+    {
+        "name": "you.com",
+        "title": "YOU.COM SEARCH RESULTS",
+        "search": search_you_context,
+    },
+    {
+        "name": "google",
+        "title": "GOOGLE SEARCH RESULTS (STANDARD)",
+        "search": search_google_context,
+    },
+]
+
+
+def context_providers(question: str) -> List[Dict]:
+    """
+    The providers to query for this question: every provider with a local
+    index, or only the local ones when the index is confident on its own
+    (best chunk at or above DOC_INDEX_SKIP_WEB_SCORE). Providers that are not
+    configured or whose circuit breaker is open are left out, so the answer is
+    built from the rest.
+    """
+    available = [p for p in SEARCH_PROVIDERS if not p.get("local") or get_document_index() is not None]
+    for provider in [p for p in available if p["name"] in UPSTREAM_GUARDS]:
+        reason = UPSTREAM_GUARDS[provider["name"]].unavailable_reason()
+        if reason:
+            logging.warning(f"Skipping {provider['name']} search: {reason}.")
+            available.remove(provider)
+    if DOC_INDEX_SKIP_WEB_SCORE > 0:
+        hits = search_local_documents(question)
+        if hits and hits[0]["score"] >= DOC_INDEX_SKIP_WEB_SCORE:
+            logging.info(f"Local index is confident (score {hits[0]['score']:.2f}); skipping web search providers.")
+            return [p for p in available if p.get("local")]
+    return available
+
+
+def _timed_search(provider: Dict, question: str) -> Tuple[List[Dict], float]:
+    """Run a provider search and return its passages with the elapsed seconds."""
+    started = time.perf_counter()
+    with span(f"search.{provider['name']}"):
+        results = provider["search"](question)
+    return results, time.perf_counter() - started
+
+
+def gather_search_context(question: str) -> List[Tuple[str, List[Dict]]]:
+    """
+    Fan out to every configured search provider at once and collect the results.
+    Each provider has its own deadline (SEARCH_PROVIDER_TIMEOUT, or a "timeout"
+    key on the provider entry). Providers that time out or raise are logged and
+    left out, so the answer is built from whatever came back in time.
+    Returns (title, passages) pairs in SEARCH_PROVIDERS order.
+    """
+    started = time.perf_counter()
+    futures = [
+        # Each worker runs in a copy of the caller's context so its spans join the current trace
+        (provider, search_executor.submit(copy_context().run, _timed_search, provider, question))
+        for provider in context_providers(question)
+    ]
+
+    contexts = []
+    for provider, future in futures:
+        deadline = started + provider.get("timeout", SEARCH_PROVIDER_TIMEOUT)
+        try:
+            results, elapsed = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            logging.info(f"Search provider '{provider['name']}' returned {len(results)} passages in {elapsed:.2f}s.")
+            contexts.append((provider["title"], results))
+        except FutureTimeoutError:
+            future.cancel()
+            logging.warning(
+                f"Search provider '{provider['name']}' exceeded its "
+                f"{provider.get('timeout', SEARCH_PROVIDER_TIMEOUT):.1f}s deadline; continuing without it."
+            )
+        except Exception as e:
+            logging.error(f"Search provider '{provider['name']}' failed: {e}")
+
+    logging.info(f"Context retrieval finished in {time.perf_counter() - started:.2f}s.")
+    return contexts
 
 # ==============================================================================
-# 4. Core Logic
+# 7. Core Logic
 # ==============================================================================
 
-def process_question(question: str) -> str:
+def get_cached_answer(question: str) -> Optional[str]:
+    """Return a cached answer for the question or a rewording of it, if any."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    started = time.perf_counter()
+    answer = answer_cache.get(question)
+    if answer is not None:
+        logging.info(f"Answer cache hit in {(time.perf_counter() - started) * 1000:.1f}ms.")
+    logging.info(f"Answer cache stats: {answer_cache.stats()}")
+    return answer
+
+
+def store_answer(question: str, answer: str) -> None:
+    """Cache a successfully generated answer. Errors and empty answers are never cached."""
+    if ANSWER_CACHE_ENABLED and answer and answer != ANSWER_ERROR_MESSAGE:
+        answer_cache.set(question, answer)
+
+
+def is_question_relevant(question: str) -> bool:
+    """
+    Decide whether the question is about Walmart supplier or corporate processes,
+    using the hardcoded keyword check first, then the local classifier, and the
+    AI-based check only for questions the classifier is unsure about.
+    """
+    with span("keyword_gate") as record:
+        record["passed"] = hardcoded_walmart_check(question)
+    if record["passed"]:
+        logging.info("✓ Hardcoded Walmart relevance check passed.")
+        return True
+
+    local_decision = local_relevance_decision(question)
+    if local_decision is not None:
+        return local_decision
+
+    logging.info("Hardcoded Walmart relevance check failed. Performing AI-based check.")
+    with span("ai_gate") as record:
+        is_related = record["passed"] = check_relevancy_with_cache(question)
+    logging.info(f"Relevancy cache stats: {relevancy_cache.stats()}")
+    if is_related:
+        logging.info("AI-based Walmart relevance check passed.")
+    else:
+        logging.info("AI-based Walmart relevance check failed.")
+    return is_related
+
+
+context_flight = SingleFlight("context", enabled=SINGLE_FLIGHT_ENABLED)
+
+
+def build_answer_context(question: str) -> str:
+    """
+    Gather context from every search provider concurrently and combine it into
+    the block that is embedded in the system prompt. Concurrent calls for the
+    same normalized question share one retrieval.
+    """
+    logging.info(f"\n{'='*80}\nGATHERING INFORMATION FROM SOURCES\n{'='*80}")
+    context, collapsed = context_flight.do(normalize_query(question), _retrieve_context, question)
+    if collapsed:
+        logging.info("Context retrieval joined an identical in-flight retrieval.")
+    return context
+
+
+def _retrieve_context(question: str) -> str:
+    with span("retrieval"):
+        contexts = gather_search_context(question)
+
+    logging.info(f"Searches completed from {len(contexts)}/{len(SEARCH_PROVIDERS)} providers.")
+    return assemble_context(question, contexts)
+
+
+def format_passages(passages: List[Dict]) -> str:
+    """Format passages as the Title/URL/Snippet block embedded in the prompt."""
+    return "\n\n".join(
+        f"Title: {p['title']}\nURL: {p['url'] or 'No URL'}\nSnippet: {p['text'] or 'No Snippet'}"
+        for p in passages
+    )
+
+
+def assemble_context(question: str, contexts: List[Tuple[str, List[Dict]]],
+                     budget: Optional[int] = None, similarity: Optional[float] = None) -> str:
+    """
+    Turn the providers' passages into the prompt context:
+      1. drop passages whose URL (or "dedup_key", for local chunks) was already
+         seen, keeping the longer text,
+      2. rank the rest by BM25 against the question (provider order breaks ties),
+      3. drop near-duplicates of a better-ranked passage (MinHash Jaccard >= similarity),
+      4. pack the best passages into the token budget.
+    Passages stay grouped under their provider's banner. Logs the estimated
+    tokens saved against sending every passage verbatim.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    similarity = CONTEXT_DEDUP_SIMILARITY if similarity is None else similarity
+
+    with span("context_assembly") as record:
+        candidates, by_key, duplicate_urls = [], {}, 0
+        for title, passages in contexts:
+            for passage in passages:
+                key = passage.get("dedup_key") or normalize_url(passage["url"])
+                if key and key in by_key:
+                    duplicate_urls += 1
+                    kept = by_key[key]
+                    if len(passage["text"]) > len(kept["text"]):
+                        kept["text"] = passage["text"]
+                    continue
+                candidate = {**passage, "section": title, "order": len(candidates)}
+                candidates.append(candidate)
+                if key:
+                    by_key[key] = candidate
+
+        for candidate, score in zip(candidates, rank_passages(question, candidates)):
+            candidate["score"] = score
+        candidates.sort(key=lambda c: (-c["score"], c["order"]))
+
+        selected, signatures, near_duplicates, over_budget, used = [], [], 0, 0, 0
+        for candidate in candidates:
+            signature = minhash_signature(candidate["text"])
+            if any(np.mean(signature == other) >= similarity for other in signatures):
+                near_duplicates += 1
+                continue
+            cost = estimate_tokens(format_passages([candidate]))
+            if used + cost > budget:
+                over_budget += 1
+                continue
+            signatures.append(signature)
+            selected.append(candidate)
+            used += cost
+
+        sections = []
+        for title, _ in contexts:
+            passages = sorted((c for c in selected if c["section"] == title), key=lambda c: -c["score"])
+            if passages:
+                sections.append((title, format_passages(passages)))
+        context = combine_contexts(sections)
+
+        tokens_before = estimate_tokens(combine_contexts(
+            [(title, format_passages(passages)) for title, passages in contexts if passages]
+        ))
+        tokens_after = estimate_tokens(context)
+        record.update(passages_in=sum(len(p) for _, p in contexts), passages_out=len(selected),
+                      tokens_before=tokens_before, tokens_after=tokens_after)
+        CONTEXT_TOKENS.inc(tokens_before, stage="retrieved")
+        CONTEXT_TOKENS.inc(tokens_after, stage="sent")
+
+    logging.info(
+        f"Context assembly: {record['passages_in']} passages -> {len(selected)} "
+        f"({duplicate_urls} duplicate URLs, {near_duplicates} near-duplicates, {over_budget} over budget); "
+        f"~{tokens_before} -> ~{tokens_after} tokens (saved ~{tokens_before - tokens_after})."
+    )
+    return context
+
+
+def combine_contexts(contexts: List[Tuple[str, str]]) -> str:
+    """Join (title, results) pairs into one context block with section banners."""
+    if not contexts:
+        contexts = [("SEARCH RESULTS", "No search results were available for this question.")]
+
+    return "\n\n".join([
+        f"{'='*80}\n{title}\n{'='*80}\n{content}" 
+        for title, content in contexts
+    ])
+
+
+question_flight = SingleFlight("question", enabled=SINGLE_FLIGHT_ENABLED)
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """Leader/collapsed counts for every single-flight layer."""
+    return {flight.name: flight.stats() for flight in (question_flight, context_flight, relevancy_flight, search_flight)}
+
+
+def answer_question(question: str, build_context: Callable[[str], str] = None) -> Tuple[str, str]:
+    """
+    Run the relevance gates, the context searches and the final Claude call for
+    a question that missed the answer cache. Returns (outcome, response) where
+    outcome is "rejected", "answered" or "error". build_context replaces
+    build_answer_context (batches use it to share search results).
+    """
+    # Step 1: Perform Walmart relevance checks
+    if not is_question_relevant(question):
+        logging.info("Generating humorous rejection.")
+        with span("rejection"):
+            return "rejected", generate_humorous_rejection(question)
+
+    # Step 2: Gather context from every search provider concurrently
+    try:
+        combined_context = (build_context or build_answer_context)(question)
+
+        # Step 3: Generate final answer
+        logging.info(f"\n{'='*80}\nGENERATING FINAL RESPONSE\n{'='*80}")
+        with span("llm_generation"):
+            response = query_claude_with_context(question, combined_context)
+        logging.info("Final AI response generated successfully.")
+        store_answer(question, response)
+        logging.info(f"Upstream connection pool stats: {http_pool_stats()}")
+        logging.info(f"Search cache stats: {search_cache.stats()}")
+
+        return ("error" if response == ANSWER_ERROR_MESSAGE else "answered"), response
+
+    except Exception as e:
+        logging.error(f"Error processing question: {e}")
+        return "error", f"An error occurred while processing your question: {str(e)}"
+
+
+def process_question(question: str, request_id: Optional[str] = None, client: Optional[str] = None) -> str:
     """
     Process the user's question:
       1. Check if it's related to Walmart supplier or corporate processes 
@@ -457,98 +2582,973 @@ def process_question(question: str) -> str:
       2. If yes, gather context from You.com and Google (standard).
       3. Summarize and craft a thorough AI answer in the voice of a Walmart consultant.
       4. If not related, provide a playful rejection message.
+    Identical questions arriving while one is being answered wait for it and
+    share its response. Every stage is traced under request_id (generated when
+    not given) and its upstream usage is charged to client.
     """
     logging.info(f"\n{'='*80}\nPROCESSING NEW QUESTION: '{question}'\n{'='*80}")
 
-    # Step 1: Perform hardcoded Walmart relevance check
-    if hardcoded_walmart_check(question):
-        logging.info("✓ Hardcoded Walmart relevance check passed.")
-    else:
-        logging.info("Hardcoded Walmart relevance check failed. Performing AI-based check.")
-        # Perform AI-based relevance check with a limited snippet from You.com
-        snippets = perform_you_search(question, num_results=5)
-        is_related = is_walmart_supplier_related(question, snippets)
-        if not is_related:
-            logging.info("AI-based Walmart relevance check failed. Generating humorous rejection.")
-            return generate_humorous_rejection(question)
-        else:
-            logging.info("AI-based Walmart relevance check passed.")
+    with request_trace("ask", request_id, client) as trace:
+        with span("answer_cache") as record:
+            cached_answer = get_cached_answer(question)
+            record["hit"] = cached_answer is not None
+        if cached_answer is not None:
+            trace.outcome = "cached"
+            return cached_answer
 
-    # Step 2: Gather context from You.com and Google
-    try:
-        logging.info(f"\n{'='*80}\nGATHERING INFORMATION FROM SOURCES\n{'='*80}")
-        you_results = perform_you_search(f"In the context of Walmart suppliers: {question}")
-        google_results = perform_web_search(f"In the context of Walmart suppliers: {question}", time_restricted=False)
+        (trace.outcome, response), collapsed = question_flight.do(
+            normalize_query(question), answer_question, question
+        )
+        if collapsed:
+            logging.info("Question joined an identical in-flight question; sharing its response.")
+        logging.info(f"Single-flight stats: {single_flight_stats()}")
+        logging.info(f"Upstream guard stats: {upstream_guard_stats()}")
+        return response
 
-        logging.info("Searches completed from You.com and Google.")
 
-        # Combine contexts
-        contexts = [
-            ("YOU.COM SEARCH RESULTS", you_results),
-            ("GOOGLE SEARCH RESULTS (STANDARD)", google_results),
-        ]
+def sse_event(data: Dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event. Data is JSON-encoded so newlines survive."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-        combined_context = "\n\n".join([
-            f"{'='*80}\n{title}\n{'='*80}\n{content}" 
-            for title, content in contexts
-        ])
 
-        # Step 3: Generate final answer
-        logging.info(f"\n{'='*80}\nGENERATING FINAL RESPONSE\n{'='*80}")
-        response = query_claude_with_context(question, combined_context)
-        logging.info("Final AI response generated successfully.")
+def stream_question(question: str, request_id: Optional[str] = None, client: Optional[str] = None) -> Iterator[str]:
+    """
+    Streaming counterpart of process_question. Yields server-sent events:
+      - "status" events while the gates and searches run,
+      - unnamed events carrying {"delta": ...} text as the answer is generated,
+      - a final "done" event (or "error" if generation failed part-way).
+    Rejections are sent as a single delta followed by "done".
+    """
+    logging.info(f"\n{'='*80}\nSTREAMING NEW QUESTION: '{question}'\n{'='*80}")
+
+    with request_trace("ask_stream", request_id, client) as trace:
+        try:
+            with span("answer_cache") as record:
+                cached_answer = get_cached_answer(question)
+                record["hit"] = cached_answer is not None
+            if cached_answer is not None:
+                trace.outcome = "cached"
+                yield sse_event({"delta": cached_answer})
+                yield sse_event({}, event="done")
+                return
+
+            yield sse_event({"stage": "checking"}, event="status")
+            if not is_question_relevant(question):
+                logging.info("Generating humorous rejection.")
+                trace.outcome = "rejected"
+                with span("rejection"):
+                    rejection = generate_humorous_rejection(question)
+                yield sse_event({"delta": rejection})
+                yield sse_event({}, event="done")
+                return
+
+            yield sse_event({"stage": "searching"}, event="status")
+            combined_context = build_answer_context(question)
+
+            yield sse_event({"stage": "generating"}, event="status")
+            logging.info(f"\n{'='*80}\nSTREAMING FINAL RESPONSE\n{'='*80}")
+            parts = []
+            with span("llm_generation") as record:
+                for delta in stream_claude_with_context(question, combined_context):
+                    if not parts:
+                        record["first_token_s"] = trace.offset()
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+
+            logging.info("Final AI response streamed successfully.")
+            store_answer(question, "".join(parts))
+            logging.info(f"Upstream connection pool stats: {http_pool_stats()}")
+            logging.info(f"Search cache stats: {search_cache.stats()}")
+            logging.info(f"Single-flight stats: {single_flight_stats()}")
+            logging.info(f"Upstream guard stats: {upstream_guard_stats()}")
+            trace.outcome = "answered"
+            yield sse_event({}, event="done")
+
+        except Exception as e:
+            logging.error(f"Error streaming question: {e}")
+            trace.outcome = "error"
+            yield sse_event({"message": ANSWER_ERROR_MESSAGE}, event="error")
+
+USAGE_FIELDS = ("requests", "limited", "upstream_calls", "prompt_tokens", "completion_tokens")
+
+
+def client_identity(api_key: Optional[str], forwarded_for: Optional[str], remote_addr: Optional[str]) -> str:
+    """
+    The name requests are rate limited and accounted under: "key:<name>" for an
+    X-API-Key listed in CLIENT_API_KEYS, otherwise "ip:<address>". Unknown API
+    keys are ignored so a client cannot mint fresh buckets by inventing keys.
+    """
+    if api_key and api_key in CLIENT_API_KEYS:
+        return f"key:{CLIENT_API_KEYS[api_key]}"
+    if RATE_LIMIT_TRUST_FORWARDED and forwarded_for:
+        return f"ip:{forwarded_for.split(',')[0].strip()}"
+    return f"ip:{remote_addr or 'unknown'}"
 
-        return response
 
-    except Exception as e:
-        logging.error(f"Error processing question: {e}")
-        return f"An error occurred while processing your question: {str(e)}"
+def usage_day(now: float) -> str:
+    """UTC date of a timestamp, as YYYY-MM-DD (formatted once per day)."""
+    return _format_day(int(now // 86400))
+
+
+@lru_cache(maxsize=4)
+def _format_day(day_number: int) -> str:
+    return datetime.fromtimestamp(day_number * 86400, timezone.utc).strftime("%Y-%m-%d")
+
+
+def seconds_until_utc_midnight(now: float) -> float:
+    return 86400 - now % 86400
+
+
+class MemoryRateLimitStore:
+    """
+    Token buckets and daily usage for this process. At most max_clients buckets
+    are kept, dropping the least recently seen (a dropped client simply starts
+    again with a full bucket); usage is kept for today and yesterday.
+    """
+
+    name = "memory"
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._usage: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._day = ""
+        self._lock = threading.Lock()
+
+    def take(self, client: str, cost: float, now: float) -> float:
+        """Take cost tokens from the client's bucket; 0.0 when admitted, else seconds until they would be available."""
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / self.rate
+            self._buckets[client] = (tokens - cost if wait == 0.0 else tokens, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def add_usage(self, client: str, day: str, counts: Dict[str, int]) -> None:
+        with self._lock:
+            if day != self._day:
+                self._usage = {key: value for key, value in self._usage.items() if key[0] == self._day}
+                self._day = day
+            entry = self._usage.get((day, client))
+            if entry is None:
+                entry = self._usage[(day, client)] = dict.fromkeys(USAGE_FIELDS, 0)
+            for field, count in counts.items():
+                entry[field] += count
+
+    def usage(self, client: str, day: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._usage.get((day, client)) or dict.fromkeys(USAGE_FIELDS, 0))
+
+    def top_clients(self, day: str, limit: int) -> List[Dict]:
+        with self._lock:
+            rows = [{"client": client, **entry} for (entry_day, client), entry in self._usage.items() if entry_day == day]
+        rows.sort(key=lambda row: (row["prompt_tokens"] + row["completion_tokens"], row["requests"]), reverse=True)
+        return rows[:limit]
+
+
+class SQLiteRateLimitStore:
+    """
+    Token buckets and daily usage in SQLite, shared by every worker process on
+    the machine. Each bucket update is one short write transaction.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, rate: float, burst: float):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS client_usage ("
+                " day TEXT NOT NULL, client TEXT NOT NULL, requests INTEGER NOT NULL DEFAULT 0,"
+                " limited INTEGER NOT NULL DEFAULT 0, upstream_calls INTEGER NOT NULL DEFAULT 0,"
+                " prompt_tokens INTEGER NOT NULL DEFAULT 0, completion_tokens INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (day, client))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def take(self, client: str, cost: float, now: float) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE client = ?", (client,)).fetchone()
+            tokens, updated = row if row is not None else (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (client, tokens, updated_at) VALUES (?, ?, ?)",
+                (client, tokens - cost if wait == 0.0 else tokens, now)
+            )
+            self._writes += 1
+            # Buckets idle long enough to be full again are equivalent to no row
+            if self._writes % 500 == 1:
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.burst / self.rate,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def add_usage(self, client: str, day: str, counts: Dict[str, int]) -> None:
+        fields = [field for field in USAGE_FIELDS if counts.get(field)]
+        if not fields:
+            return
+        self._connect().execute(
+            f"INSERT INTO client_usage (day, client, {', '.join(fields)}) VALUES (?, ?{', ?' * len(fields)}) "
+            f"ON CONFLICT (day, client) DO UPDATE SET "
+            + ", ".join(f"{field} = {field} + excluded.{field}" for field in fields),
+            (day, client, *(counts[field] for field in fields))
+        )
+
+    def usage(self, client: str, day: str) -> Dict[str, int]:
+        row = self._connect().execute(
+            f"SELECT {', '.join(USAGE_FIELDS)} FROM client_usage WHERE day = ? AND client = ?", (day, client)
+        ).fetchone()
+        return dict(zip(USAGE_FIELDS, row or (0,) * len(USAGE_FIELDS)))
+
+    def top_clients(self, day: str, limit: int) -> List[Dict]:
+        rows = self._connect().execute(
+            f"SELECT client, {', '.join(USAGE_FIELDS)} FROM client_usage WHERE day = ?"
+            " ORDER BY prompt_tokens + completion_tokens DESC, requests DESC LIMIT ?", (day, limit)
+        ).fetchall()
+        return [dict(zip(("client",) + USAGE_FIELDS, row)) for row in rows]
+
+
+class ClientRateLimiter:
+    """
+    Admission control and accounting per client: a token bucket on questions,
+    an optional daily LLM token quota, and per-day counts of requests, refusals,
+    upstream calls and tokens. Store errors admit the request rather than fail it.
+    """
+
+    def __init__(self, store, enabled: bool, daily_token_quota: int = 0):
+        self.store = store
+        self.enabled = enabled and store.rate > 0
+        self.daily_token_quota = daily_token_quota
+
+    def admit(self, client: str, cost: float = 1) -> Optional[float]:
+        """
+        Charge cost questions to the client. Returns None when admitted, or the
+        number of seconds to send as Retry-After. A cost above the burst size
+        can never be admitted; check fits() first and refuse such requests.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        day = usage_day(now)
+        try:
+            if self.daily_token_quota > 0:
+                used = self.store.usage(client, day)
+                if used["prompt_tokens"] + used["completion_tokens"] >= self.daily_token_quota:
+                    self.store.add_usage(client, day, {"limited": 1})
+                    RATE_LIMITED.inc(reason="daily_token_quota")
+                    return seconds_until_utc_midnight(now)
+
+            wait = self.store.take(client, cost, now)
+            self.store.add_usage(client, day, {"limited": 1} if wait else {"requests": int(cost)})
+        except sqlite3.Error as e:
+            logging.warning(f"Rate limit store failed ({self.store.name}); admitting {client}: {e}")
+            return None
+        if wait:
+            RATE_LIMITED.inc(reason="rate")
+            logging.info(f"Rate limited {client}; retry in {wait:.1f}s.")
+            return wait
+        return None
+
+    def fits(self, cost: float) -> bool:
+        """Whether a request costing cost questions can ever be admitted (a full bucket holds burst)."""
+        return not self.enabled or cost <= self.store.burst
+
+    def charge(self, trace: RequestTrace) -> None:
+        """Add a finished request's upstream calls and LLM tokens to its client's usage."""
+        counts = {
+            "upstream_calls": len(trace.upstream),
+            "prompt_tokens": trace.tokens.get("prompt_tokens", 0),
+            "completion_tokens": trace.tokens.get("completion_tokens", 0),
+        }
+        try:
+            self.store.add_usage(trace.client, usage_day(time.time()), counts)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not record usage for {trace.client}: {e}")
+
+
+def create_rate_limit_store():
+    rate = RATE_LIMIT_PER_MINUTE / 60.0
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteRateLimitStore(CACHE_DB_PATH, rate, RATE_LIMIT_BURST)
+    if RATE_LIMIT_BACKEND != "memory":
+        logging.warning(f"Unknown RATE_LIMIT_BACKEND '{RATE_LIMIT_BACKEND}'; using memory.")
+    return MemoryRateLimitStore(rate, RATE_LIMIT_BURST)
+
+
+client_limiter = ClientRateLimiter(create_rate_limit_store(), RATE_LIMIT_ENABLED, CLIENT_DAILY_TOKEN_QUOTA)
+
+
+class JobStore:
+    """
+    SQLite store for background job state and results, shared by every worker
+    process on the machine so any of them can answer a poll. Rows expire
+    JOB_RESULT_TTL seconds after their last update.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, question TEXT NOT NULL,"
+                " result TEXT, error TEXT, created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id: str, question: str) -> None:
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO jobs (id, status, question, created_at, updated_at, expires_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+            (job_id, question, now, now, now + self.ttl)
+        )
+        self._writes += 1
+        # Purge expired jobs periodically rather than on every write
+        if self._writes % 50 == 1:
+            conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,))
+
+    def update(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        now = time.time()
+        try:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, expires_at = ? WHERE id = ?",
+                (status, result, error, now, now + self.ttl, job_id)
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Could not update job {job_id}: {e}")
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT id, status, result, error, created_at, updated_at, expires_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None or row[6] < time.time():
+            return None
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "response": row[2],
+            "error": row[3],
+            "created_at": datetime.fromtimestamp(row[4], timezone.utc).isoformat(),
+            "updated_at": datetime.fromtimestamp(row[5], timezone.utc).isoformat(),
+        }
+
+
+class JobQueue:
+    """
+    Bounded background runner for questions. At most `depth` jobs may be queued
+    or running in this process; submit returns None beyond that so the caller
+    can answer 429 instead of letting the backlog grow without limit.
+    """
+
+    def __init__(self, store: JobStore, workers: int, depth: int):
+        self.store = store
+        self.depth = depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def submit(self, question: str, request_id: Optional[str] = None, client: Optional[str] = None) -> Optional[str]:
+        """Queue the question and return its job ID, or None when the queue is full."""
+        with self._lock:
+            if self._pending >= self.depth:
+                JOBS.inc(event="rejected")
+                return None
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, question)
+            self._executor.submit(self._run, job_id, question, request_id or job_id, client)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        JOBS.inc(event="submitted")
+        logging.info(f"Queued job {job_id} ({self.pending()}/{self.depth} pending).")
+        return job_id
+
+    def _run(self, job_id: str, question: str, request_id: str, client: Optional[str]) -> None:
+        try:
+            self.store.update(job_id, "running")
+            response = process_question(question, request_id=request_id, client=client)
+            if response == ANSWER_ERROR_MESSAGE or response.startswith("An error occurred"):
+                self.store.update(job_id, "failed", error=response)
+                JOBS.inc(event="failed")
+            else:
+                self.store.update(job_id, "done", result=response)
+                JOBS.inc(event="done")
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, "failed", error=ANSWER_ERROR_MESSAGE)
+            JOBS.inc(event="failed")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+job_store = JobStore(CACHE_DB_PATH, JOB_RESULT_TTL)
+job_queue = JobQueue(job_store, JOB_WORKERS, JOB_QUEUE_DEPTH)
+
+
+class SharedSearches:
+    """
+    Search results shared by the questions of one batch. Each question is
+    assigned to the first earlier question whose embedding is at least
+    `similarity` close; the searches run once per such leader, and every
+    question then ranks and packs the shared passages for its own wording.
+    """
+
+    def __init__(self, similarity: float):
+        self.similarity = similarity
+        self._leaders: List[Tuple[np.ndarray, str]] = []
+        self._results: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def assign(self, question: str) -> str:
+        """Return the leader question whose search results this question will use."""
+        vector = embed_question(question)
+        for leader_vector, leader in self._leaders:
+            if float(vector @ leader_vector) >= self.similarity:
+                return leader
+        self._leaders.append((vector, question))
+        return question
+
+    def leaders(self) -> int:
+        return len(self._leaders)
+
+    def contexts(self, leader: str) -> List[Tuple[str, List[Dict]]]:
+        with self._lock:
+            future = self._results.get(leader)
+            owner = future is None
+            if owner:
+                future = self._results[leader] = Future()
+        if not owner:
+            with span("retrieval.shared"):
+                return future.result()
+        try:
+            with span("retrieval"):
+                contexts = gather_search_context(leader)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        future.set_result(contexts)
+        return contexts
+
+
+class BatchCheckpoint:
+    """
+    SQLite record of finished batch answers, so a batch that is sent again
+    (after a dropped connection or a crash) resumes instead of starting over.
+    Failed answers are not recorded and are retried on resume.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS batch_results ("
+                " batch_id TEXT NOT NULL, item_id TEXT NOT NULL, result TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, PRIMARY KEY (batch_id, item_id))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def load(self, batch_id: str) -> Dict[str, Dict]:
+        try:
+            rows = self._connect().execute(
+                "SELECT item_id, result FROM batch_results WHERE batch_id = ? AND expires_at >= ?",
+                (batch_id, time.time())
+            ).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read checkpoint for batch {batch_id}: {e}")
+            return {}
+        return {item_id: json.loads(result) for item_id, result in rows}
+
+    def save(self, batch_id: str, result: Dict) -> None:
+        if result["outcome"] == "error":
+            return
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO batch_results (batch_id, item_id, result, expires_at) VALUES (?, ?, ?, ?)",
+                (batch_id, result["id"], json.dumps(result), time.time() + self.ttl)
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"Could not checkpoint item {result['id']} of batch {batch_id}: {e}")
+
+
+batch_checkpoint = BatchCheckpoint(CACHE_DB_PATH, JOB_RESULT_TTL)
+
+
+def batch_plan(items: List[Dict], done: Dict[str, Dict]) -> Tuple[List[Dict], Dict[str, List[Dict]]]:
+    """
+    Split the items that still need answering into unique questions and
+    duplicates (same normalized question), keyed by the id they copy.
+    """
+    primaries: Dict[str, Dict] = {}
+    duplicates: Dict[str, List[Dict]] = {}
+    for item in items:
+        if item["id"] in done:
+            continue
+        primary = primaries.setdefault(normalize_query(item["question"]), item)
+        if primary is not item:
+            duplicates.setdefault(primary["id"], []).append(item)
+    return list(primaries.values()), duplicates
+
+
+def _answer_batch_item(item: Dict, leader: str, searches: SharedSearches, request_id: str,
+                       client: Optional[str]) -> Dict:
+    started = time.perf_counter()
+    question = item["question"]
+    with request_trace("ask_batch", request_id, client) as trace:
+        try:
+            with span("answer_cache") as record:
+                response = get_cached_answer(question)
+                record["hit"] = response is not None
+            if response is not None:
+                trace.outcome = "cached"
+            else:
+                trace.outcome, response = answer_question(
+                    question, build_context=lambda q: assemble_context(q, searches.contexts(leader))
+                )
+        except Exception as e:
+            logging.error(f"Batch item {item['id']} failed: {e}")
+            trace.outcome, response = "error", ANSWER_ERROR_MESSAGE
+    return {
+        "id": item["id"],
+        "question": question,
+        "outcome": trace.outcome,
+        "response": response,
+        "duration_s": round(time.perf_counter() - started, 3),
+    }
+
 
+def answer_batch(items: List[Dict], workers: int = BATCH_WORKERS, batch_id: Optional[str] = None,
+                 client: Optional[str] = None, done: Optional[Dict[str, Dict]] = None) -> Iterator[Dict]:
+    """
+    Answer a batch of {"id", "question"} items, yielding one result per item
+    as soon as it is ready (completion order, not input order):
+      - items in `done` (by default, batch_id's checkpoint) are yielded first, marked "resumed",
+      - questions that normalize the same are answered once; the copies carry "duplicate_of",
+      - up to `workers` questions run at once, sharing search results between
+        similar questions (BATCH_SHARE_SIMILARITY).
+    New results are checkpointed under batch_id when one is given.
+    """
+    if done is None:
+        done = batch_checkpoint.load(batch_id) if batch_id else {}
+    for item in items:
+        if item["id"] in done:
+            yield {**done[item["id"]], "resumed": True}
+
+    primaries, duplicates = batch_plan(items, done)
+    searches = SharedSearches(BATCH_SHARE_SIMILARITY)
+    leaders = {item["id"]: searches.assign(item["question"]) for item in primaries}
+    logging.info(
+        f"Batch {batch_id or '(unnamed)'}: {len(items)} items, {len(done)} already done, "
+        f"{len(primaries)} unique questions to answer with {searches.leaders()} search sets, {workers} workers."
+    )
+    if workers * len([p for p in SEARCH_PROVIDERS if not p.get("local")]) > SEARCH_MAX_WORKERS:
+        logging.warning(
+            f"BATCH_WORKERS={workers} can have more searches in flight than SEARCH_MAX_WORKERS={SEARCH_MAX_WORKERS}; "
+            f"raise SEARCH_MAX_WORKERS for throughput to keep scaling."
+        )
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+    try:
+        futures = [
+            executor.submit(
+                copy_context().run, _answer_batch_item, item, leaders[item["id"]], searches,
+                f"{batch_id or uuid.uuid4().hex}:{item['id']}", client,
+            )
+            for item in primaries
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            copies = [
+                {**result, "id": copy["id"], "question": copy["question"], "duplicate_of": result["id"]}
+                for copy in duplicates.get(result["id"], [])
+            ]
+            for finished in [result] + copies:
+                if batch_id:
+                    batch_checkpoint.save(batch_id, finished)
+                yield finished
+    finally:
+        # Stop queued questions if the consumer goes away (e.g. the client disconnected)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+@lru_cache(maxsize=1)
+def get_asset_manifest() -> "AssetManifest":
+    from assets import AssetManifest
+    started = time.perf_counter()
+    manifest = AssetManifest(APP_DIR, ASSET_BUILD_DIR)
+    logging.info(f"Fingerprinted {len(manifest)} static assets ({manifest.precompressed} precompressed by a build) "
+                 f"in {(time.perf_counter() - started) * 1000:.1f}ms.")
+    return manifest
+
+
+def warm_up() -> None:
+    """Build everything LAZY_STARTUP defers, so the first question pays nothing extra."""
+    started = time.perf_counter()
+    get_http_session()
+    get_keyword_matcher()
+    get_relevance_model()
+    get_rejection_pool()
+    minhash_permutations()
+    get_asset_manifest()
+    logging.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.1f}ms.")
+
+
+if not LAZY_STARTUP:
+    warm_up()
 
 # ==============================================================================
-# 5. Flask Routes
+# 8. Flask Routes
 # ==============================================================================
 
+@app.template_global()
+def asset_url(path: str) -> str:
+    """Fingerprinted URL of a file under static/ or public/, e.g. asset_url('static/style.css')."""
+    return get_asset_manifest().url(path)
+
+
+def asset_response(asset: "Asset", cache_control: str) -> Response:
+    """The asset in the best encoding the client accepts, or 304 when its ETag still matches."""
+    from assets import negotiate_encodings
+    for encoding in negotiate_encodings(request.headers.get("Accept-Encoding", "")):
+        body = asset.body(encoding)
+        if body is not None:
+            break
+    etag = asset.etag(encoding)
+    headers = {"Cache-Control": cache_control, "ETag": f'"{etag}"', "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=asset.content_type, headers=headers)
+
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    asset = get_asset_manifest().by_hashed.get(filename)
+    if asset is None:
+        abort(404)
+    return asset_response(asset, IMMUTABLE_CACHE_CONTROL)
+
+
+def serve_unhashed_asset(path: str) -> Response:
+    asset = get_asset_manifest().assets.get(path)
+    if asset is None:
+        abort(404)
+    return asset_response(asset, f"public, max-age={ASSET_MAX_AGE}")
+
+
+@app.route('/static/<path:filename>')
+def serve_static(filename):
+    return serve_unhashed_asset(f"static/{filename}")
+
+
+@app.route('/public/<path:filename>')
+def serve_public(filename):
+    return serve_unhashed_asset(f"public/{filename}")
+
+
+class PageCache:
+    """
+    Rendered pages by name, each with the mtimes of the files it was rendered
+    from, its ETag and its Last-Modified time. A page is rendered again only
+    when one of its files has changed since.
+    """
+
+    def __init__(self):
+        self._pages: Dict[str, Tuple[Tuple[int, ...], bytes, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, files: List[str], render: Callable[[], str]) -> Tuple[bytes, str, float]:
+        """Return (body, etag, last_modified) for the page; raises OSError when a file is missing."""
+        mtimes = tuple(os.stat(path).st_mtime_ns for path in files)
+        page = self._pages.get(name)
+        if page is None or page[0] != mtimes:
+            with self._lock:
+                page = self._pages.get(name)
+                if page is None or page[0] != mtimes:
+                    body = render().encode("utf-8")
+                    page = self._pages[name] = (mtimes, body, sha256(body).hexdigest()[:16], max(mtimes) / 1e9)
+                    logging.info(f"Rendered page '{name}' ({len(body)} bytes).")
+        return page[1:]
+
+
+page_cache = PageCache()
+
+
+def cached_page(name: str, files: List[str], render: Callable[[], str]) -> Response:
+    """Serve a page from page_cache, or 304 when the client's copy is still current."""
+    body, etag, last_modified = page_cache.get(name, files, render)
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+    response.headers["Cache-Control"] = "public, no-cache"
+    return response.make_conditional(request)
+
+
+def render_legal_page(path: str, title: str) -> str:
+    with open(path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    return render_template('legal.html', content=content, title=title)
+
+
 @app.route('/')
 def home():
     # Render the updated index.html for Market Mentor
-    return render_template('index.html')
+    return cached_page("home", [os.path.join(TEMPLATES_DIR, "index.html")], lambda: render_template('index.html'))
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
     """
     Primary endpoint for handling user questions.
     Expects JSON payload: {"question": "..."}
+    With ?mode=async the question is queued as a background job instead: the
+    response is 202 with the job ID to poll at /jobs/<id>, or 429 when the
+    job queue is full. Clients over their rate limit get 429 with Retry-After.
     """
     try:
         user_question = request.json.get("question")
-        if not user_question or not user_question.strip():
+        if not isinstance(user_question, str) or not user_question.strip():
             return jsonify({'response': 'Please provide a valid question.'})
 
-        response = process_question(user_question)
-        return jsonify({'response': response})
+        async_mode = request.args.get("mode") == "async"
+        # Answered before the rate limit so the page's fallback to /ask/stream is charged only once
+        if async_mode and not ASYNC_JOBS_ENABLED:
+            return jsonify({'error': 'Async job mode is disabled on this server.'}), 404
+
+        request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        client = request_client()
+        retry_after = client_limiter.admit(client)
+        if retry_after is not None:
+            return rate_limited_response(retry_after, request_id)
+        if async_mode:
+            return submit_question_job(user_question, request_id, client)
+
+        response = process_question(user_question, request_id=request_id, client=client)
+        return jsonify({'response': response}), 200, {'X-Request-ID': request_id}
     except Exception as e:
         logging.error(f"Error in ask_question route: {e}")
         return jsonify({'response': f'An error occurred: {str(e)})'})
 
+@app.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Streaming endpoint for user questions. Expects the same JSON payload as /ask
+    and responds with server-sent events as the answer is generated.
+    """
+    payload = request.get_json(silent=True)
+    user_question = payload.get("question") if isinstance(payload, dict) else None
+    if not isinstance(user_question, str) or not user_question.strip():
+        return jsonify({'response': 'Please provide a valid question.'}), 400
+
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    client = request_client()
+    retry_after = client_limiter.admit(client)
+    if retry_after is not None:
+        return rate_limited_response(retry_after, request_id)
+    return Response(
+        stream_with_context(stream_question(user_question, request_id=request_id, client=client)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Request-ID': request_id},
+    )
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_batch():
+    """
+    Batch endpoint for pre-generating answers. The body is JSONL: one
+    {"id": ..., "question": "..."} object (or bare JSON string) per line, at
+    most BATCH_MAX_QUESTIONS lines. The response streams one JSON line per
+    question as it completes, with "id", "question", "outcome", "response"
+    and, for copies of an earlier line, "duplicate_of".
+
+    Finished answers are checkpointed under the batch ID (?batch_id=, or a
+    hash of the body when not given, returned in X-Batch-ID): sending the same
+    batch again streams those back marked "resumed" and answers only the rest.
+    """
+    from batch import parse_batch_lines
+    try:
+        items = parse_batch_lines(request.get_data(as_text=True).splitlines())
+    except ValueError as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    if not items:
+        return jsonify({'error': 'The batch contains no questions.'}), 400
+    if len(items) > BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch.'}), 413
+
+    batch_id = request.args.get("batch_id") or sha256(request.get_data()).hexdigest()[:24]
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    done = batch_checkpoint.load(batch_id)
+    primaries, _ = batch_plan(items, done)
+    client = request_client()
+    # Each question still to be answered counts against the rate limit, so a
+    # batch may hold no more new questions than the client's bucket
+    if not client_limiter.fits(len(primaries)):
+        return jsonify({'error': f'{len(primaries)} questions to answer, but at most {client_limiter.store.burst:g} '
+                                 f'fit in the rate limit; split the batch.'}), 413, {'X-Request-ID': request_id}
+    retry_after = client_limiter.admit(client, cost=len(primaries)) if primaries else None
+    if retry_after is not None:
+        return rate_limited_response(retry_after, request_id)
+
+    lines = (json.dumps(result) + "\n" for result in answer_batch(items, batch_id=batch_id, client=client, done=done))
+    return Response(
+        stream_with_context(lines),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no',
+                 'X-Batch-ID': batch_id, 'X-Request-ID': request_id},
+    )
+
+def request_client() -> str:
+    return client_identity(
+        request.headers.get("X-API-Key"), request.headers.get("X-Forwarded-For"), request.remote_addr
+    )
+
+def rate_limited_response(retry_after: float, request_id: str):
+    retry_after = max(1, math.ceil(retry_after))
+    return (
+        jsonify({'error': 'Too many questions. Please slow down and try again shortly.', 'retry_after': retry_after}),
+        429,
+        {'Retry-After': str(retry_after), 'X-Request-ID': request_id},
+    )
+
+def submit_question_job(question: str, request_id: str, client: Optional[str] = None):
+    job_id = job_queue.submit(question, request_id=request_id, client=client)
+    if job_id is None:
+        return (
+            jsonify({'error': 'Too many questions in progress. Please try again shortly.'}),
+            429,
+            {'Retry-After': str(JOB_RETRY_AFTER), 'X-Request-ID': request_id},
+        )
+    poll_url = f"/jobs/{job_id}"
+    return (
+        jsonify({'job_id': job_id, 'status': 'queued', 'poll_url': poll_url}),
+        202,
+        {'Location': poll_url, 'X-Request-ID': request_id},
+    )
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """
+    Poll a background job. Status is "queued", "running", "done" (with
+    "response") or "failed" (with "error"). Unknown and expired jobs are 404.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired.'}), 404
+    return jsonify(job), 200, {'Cache-Control': 'no-store'}
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint: latency histograms, upstream calls, token usage and cache stats."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/answer-cache/invalidate', methods=['POST'])
+def invalidate_answer_cache():
+    """
+    Admin endpoint for clearing cached answers. Requires the X-Admin-Token header
+    to match ADMIN_TOKEN (disabled when ADMIN_TOKEN is not set).
+    Expects JSON payload: {"question": "..."} to drop one question and its
+    rewordings, or {"all": true} to clear the whole cache.
+    """
+    supplied_token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(supplied_token, ADMIN_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    payload = request.get_json(silent=True)
+    payload = payload if isinstance(payload, dict) else {}
+    question = payload.get("question")
+    if payload.get("all"):
+        removed = answer_cache.invalidate()
+    elif isinstance(question, str) and question.strip():
+        removed = answer_cache.invalidate(question)
+    else:
+        return jsonify({'error': 'Provide "question" or "all": true.'}), 400
+
+    logging.info(f"Answer cache invalidation removed {removed} entries.")
+    return jsonify({'removed': removed, 'stats': answer_cache.stats()})
+
+@app.route('/admin/usage')
+def client_usage():
+    """
+    Admin endpoint for per-client accounting. Requires the X-Admin-Token header
+    to match ADMIN_TOKEN. Returns the heaviest clients of a UTC day
+    (?day=YYYY-MM-DD, default today; ?limit=N, default 50) by LLM tokens.
+    """
+    supplied_token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(supplied_token, ADMIN_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+
+    day = request.args.get("day") or usage_day(time.time())
+    limit = request.args.get("limit", default=50, type=int)
+    return jsonify({'day': day, 'clients': client_limiter.store.top_clients(day, limit)})
+
 @app.route('/terms')
 def terms():
-    # Optional: update Terms of Service references if you have a custom file
+    # Terms of Service text from TERMS_PATH, rendered into legal.html
     try:
-        with open('mentor_tos.txt', 'r', encoding='utf-8') as file:
-            terms_content = file.read()
-        return render_template('legal.html', content=terms_content, title='Market Mentor - Terms of Service')
+        return cached_page("terms", [os.path.join(TEMPLATES_DIR, "legal.html"), TERMS_PATH],
+                           lambda: render_legal_page(TERMS_PATH, 'Market Mentor - Terms of Service'))
     except Exception as e:
         logging.error(f"Error loading terms: {e}")
         return "Error loading Terms of Service", 500
 
 @app.route('/privacy')
 def privacy():
-    # Optional: update Privacy Policy references if you have a custom file
+    # Privacy Policy text from PRIVACY_PATH, rendered into legal.html
     try:
-        with open('mentor_privacy.txt', 'r', encoding='utf-8') as file:
-            privacy_content = file.read()
-        return render_template('legal.html', content=privacy_content, title='Market Mentor - Privacy Policy')
+        return cached_page("privacy", [os.path.join(TEMPLATES_DIR, "legal.html"), PRIVACY_PATH],
+                           lambda: render_legal_page(PRIVACY_PATH, 'Market Mentor - Privacy Policy'))
     except Exception as e:
         logging.error(f"Error loading privacy policy: {e}")
         return "Error loading Privacy Policy", 500
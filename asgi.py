@@ -0,0 +1,809 @@
+# ==============================================================================
+# asgi.py - Market Mentor: Async (ASGI) Serving Mode
+# ==============================================================================
+"""
+ASGI entry point that serves /ask and /ask/stream with a fully asynchronous
+pipeline: the relevance gates, the context searches and the Claude call all run
+as coroutines on one shared httpx.AsyncClient, so a single process can hold
+hundreds of in-flight questions while they wait on upstream services. Work
+that would block the event loop (the SQLite-backed caches and rate-limit
+store, lazily loaded files, context assembly) runs in worker threads.
+
+Every other route (/, /terms, /privacy, /public/<path>, /jobs/<id>, admin
+endpoints), and /ask?mode=async, is passed through to the Flask app unchanged.
+
+Run with:
+    uvicorn asgi:application --workers 2
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+import app as market_mentor
+from app import (
+    ANSWER_ERROR_MESSAGE,
+    FALLBACK_REJECTION_MESSAGE,
+    GOOGLE_SEARCH_URL,
+    HEDGE_SEARCHES,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_POOL_MAXSIZE,
+    HTTP_READ_TIMEOUT,
+    HTTP_RETRY_BACKOFF,
+    LLM_READ_TIMEOUT,
+    NO_SNIPPETS_NOTE,
+    OPENROUTER_URL,
+    SEARCH_PROVIDER_TIMEOUT,
+    SEARCH_PROVIDERS,
+    SINGLE_FLIGHT_ENABLED,
+    STREAM_DONE,
+    SingleFlight,
+    UPSTREAM_HEDGES,
+    UPSTREAM_QUEUE_TIMEOUT,
+    UPSTREAM_SHED,
+    AdaptiveLimiter,
+    UpstreamGuard,
+    UpstreamUnavailable,
+    YDC_SEARCH_URL,
+    assemble_context,
+    build_answer_request,
+    build_google_search_params,
+    build_rejection_request,
+    build_relevancy_request,
+    build_you_search_request,
+    client_identity,
+    client_limiter,
+    completion_content,
+    context_providers,
+    context_search_query,
+    format_you_hits,
+    get_cached_answer,
+    get_rejection_pool,
+    google_passages,
+    hardcoded_walmart_check,
+    is_failure_status,
+    local_relevance_decision,
+    log_answer_stats,
+    log_gate_decision,
+    make_cache_key,
+    normalize_query,
+    parse_google_hits,
+    parse_relevancy_decision,
+    parse_stream_line,
+    parse_you_hits,
+    question_fingerprint,
+    record_upstream_call,
+    relevancy_cache,
+    request_trace,
+    search_cache,
+    span,
+    sse_event,
+    store_answer,
+    upstream_guard,
+    you_passages,
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# ==============================================================================
+# 1. Async HTTP Client
+# ==============================================================================
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the shared AsyncClient, creating it on first use. Its connection
+    pool mirrors the sync session: HTTP_POOL_MAXSIZE keep-alive connections per
+    process and a connect/read timeout on every call.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAXSIZE * 3,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE * 3,
+            ),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def _async_send(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send one request, retrying 429/5xx responses and connection errors with
+    exponential backoff (honouring Retry-After). As in the sync session, a POST
+    is only retried when it never reached the server (connect errors), and no
+    Retry-After wait may run past the call's read timeout, counted from the
+    first attempt.
+    """
+    client = get_async_client()
+    started = time.perf_counter()
+    timeout = kwargs.get("timeout")
+    deadline = started + ((timeout.read if isinstance(timeout, httpx.Timeout) else timeout) or HTTP_READ_TIMEOUT)
+    retryable_errors = httpx.TransportError if method == "GET" else (httpx.ConnectError, httpx.ConnectTimeout)
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        last_attempt = attempt == HTTP_MAX_RETRIES
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if last_attempt or not isinstance(e, retryable_errors):
+                record_upstream_call(method, url, None, attempt, time.perf_counter() - started)
+                raise
+        else:
+            retry_after = response.headers.get("Retry-After", "")
+            wait = float(retry_after) if retry_after.isdigit() else HTTP_RETRY_BACKOFF * (2 ** attempt)
+            out_of_time = time.perf_counter() + wait >= deadline
+            if response.status_code not in RETRY_STATUSES or last_attempt or out_of_time:
+                if attempt:
+                    logging.warning(f"{method} {url} needed {attempt} retries (final status {response.status_code}).")
+                record_upstream_call(method, url, response.status_code, attempt, time.perf_counter() - started)
+                return response
+            await asyncio.sleep(wait)
+            continue
+        await asyncio.sleep(HTTP_RETRY_BACKOFF * (2 ** attempt))
+
+
+class AsyncSlotWaiter:
+    """
+    Lets coroutines wait for a slot of a limiter shared with the sync code,
+    whose threading condition cannot be awaited. The limiter calls back on
+    every release (from any thread); while coroutines are waiting, that sets
+    an asyncio.Event on the loop and the woken waiters retry try_acquire.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, loop: asyncio.AbstractEventLoop):
+        self.limiter = limiter
+        self.loop = loop
+        self._freed = asyncio.Event()
+        # Counted before try_acquire, so a release between a failed try and the wait still wakes it
+        self._waiting = 0
+        limiter.add_release_listener(self._on_release)
+
+    def _on_release(self) -> None:
+        if self._waiting and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._freed.set)
+
+    async def acquire(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for a slot; False if none freed up."""
+        deadline = time.monotonic() + timeout
+        self._waiting += 1
+        try:
+            while not self.limiter.try_acquire():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._freed.clear()
+                try:
+                    await asyncio.wait_for(self._freed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            return True
+        finally:
+            self._waiting -= 1
+
+
+_slot_waiters: Dict[str, AsyncSlotWaiter] = {}
+
+
+async def acquire_upstream_slot(guard: UpstreamGuard, timeout: float) -> None:
+    """Wait up to timeout seconds for one of the provider's concurrency slots, without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    waiter = _slot_waiters.get(guard.name)
+    if waiter is None or waiter.loop is not loop:
+        waiter = _slot_waiters[guard.name] = AsyncSlotWaiter(guard.limiter, loop)
+    if not await waiter.acquire(timeout):
+        UPSTREAM_SHED.inc(provider=guard.name, reason="concurrency_limit")
+        raise UpstreamUnavailable(f"'{guard.name}' concurrency limit ({int(guard.limiter.limit)}) reached")
+
+
+async def _async_send_guarded(guard: UpstreamGuard, operation: str, method: str, url: str,
+                              queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT, **kwargs) -> httpx.Response:
+    await acquire_upstream_slot(guard, queue_timeout)
+    try:
+        guard.claim()
+        started = time.perf_counter()
+        try:
+            response = await _async_send(method, url, **kwargs)
+        except Exception:
+            guard.record(operation, time.perf_counter() - started, ok=False)
+            raise
+        except BaseException:
+            # Cancelled (e.g. by a search deadline or a lost hedge) without an outcome:
+            # free the half-open probe for the next call
+            guard.breaker.release_probe()
+            raise
+    finally:
+        guard.limiter.release()
+    guard.record(operation, time.perf_counter() - started, ok=not is_failure_status(response.status_code))
+    return response
+
+
+async def _async_send_hedged(guard: UpstreamGuard, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+    """Async counterpart of app._send_hedged; the losing request is cancelled."""
+    delay = guard.hedge_delay(operation)
+    if delay is None:
+        return await _async_send_guarded(guard, operation, method, url, **kwargs)
+
+    first = asyncio.ensure_future(_async_send_guarded(guard, operation, method, url, **kwargs))
+    pending, error = {first}, None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        UPSTREAM_HEDGES.inc(provider=guard.name, event="sent")
+        logging.info(f"'{guard.name}' {operation} exceeded its p95 ({delay:.2f}s); sending a hedged request.")
+        second = asyncio.ensure_future(_async_send_guarded(guard, operation, method, url, queue_timeout=0.0, **kwargs))
+        pending.add(second)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        UPSTREAM_HEDGES.inc(provider=guard.name, event="won")
+                    return task.result()
+                if error is None or task is first:
+                    error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def async_http_request(method: str, url: str, read_timeout: float = HTTP_READ_TIMEOUT,
+                             operation: Optional[str] = None, hedge: bool = False, **kwargs) -> httpx.Response:
+    """
+    Async counterpart of app.http_request: retries 429/5xx responses and
+    connection errors, and sends calls to known providers through the same
+    guards (breaker, adaptive concurrency limit, hedging) as the sync code.
+    """
+    kwargs.setdefault("timeout", httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT))
+    guard = upstream_guard(url)
+    if guard is None:
+        return await _async_send(method, url, **kwargs)
+
+    guard.admit()
+    operation = operation or method
+    if hedge and HEDGE_SEARCHES:
+        return await _async_send_hedged(guard, operation, method, url, **kwargs)
+    return await _async_send_guarded(guard, operation, method, url, **kwargs)
+
+# ==============================================================================
+# 2. Async API Integration Functions
+# ==============================================================================
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    Coroutine counterpart of app.SingleFlight. The leader's call runs as its
+    own task and every caller awaits it through asyncio.shield, so a caller
+    that is cancelled (e.g. by a provider deadline) does not cancel the shared
+    call for the others.
+    """
+
+    async def do(self, key: str, fn, *args, **kwargs) -> Tuple[object, bool]:
+        if not self.enabled:
+            return await fn(*args, **kwargs), False
+
+        task = self._calls.get(key)
+        if task is not None:
+            self._count("collapsed")
+            with span(f"{self.name}.collapsed"):
+                return await asyncio.shield(task), True
+
+        self._count("leader")
+        task = self._calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+        task.add_done_callback(lambda finished: self._finish(key, finished))
+        return await asyncio.shield(task), False
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark as retrieved even if every caller went away
+
+
+search_flight = AsyncSingleFlight("search", enabled=SINGLE_FLIGHT_ENABLED)
+relevancy_flight = AsyncSingleFlight("relevancy", enabled=SINGLE_FLIGHT_ENABLED)
+context_flight = AsyncSingleFlight("context", enabled=SINGLE_FLIGHT_ENABLED)
+question_flight = AsyncSingleFlight("question", enabled=SINGLE_FLIGHT_ENABLED)
+
+
+async def cached_search_async(provider: str, fetch, query: str, **params) -> List[Dict]:
+    """Async counterpart of app.cached_search, sharing the same search cache."""
+    key = make_cache_key(provider, query, **params)
+    hits = await asyncio.to_thread(search_cache.get, key)
+    if hits is not None:
+        logging.info(f"Search cache hit for {provider}: {query}")
+        return hits
+
+    async def fetch_and_store() -> List[Dict]:
+        fetched = await fetch(query, **params)
+        await asyncio.to_thread(search_cache.set, key, fetched)
+        return fetched
+
+    hits, collapsed = await search_flight.do(key, fetch_and_store)
+    if collapsed:
+        logging.info(f"Search for {provider} joined an identical in-flight call: {query}")
+    return hits
+
+
+async def fetch_google_hits_async(query: str, time_restricted: bool = False, num_results: int = 10) -> List[Dict]:
+    params = build_google_search_params(query, time_restricted, num_results)
+    response = await async_http_request("GET", GOOGLE_SEARCH_URL, hedge=True, params=params)
+    response.raise_for_status()
+    return parse_google_hits(response.json())
+
+
+async def fetch_you_hits_async(query: str, num_results: int = 15) -> List[Dict]:
+    headers, params = build_you_search_request(query, num_results)
+    response = await async_http_request("GET", YDC_SEARCH_URL, hedge=True, headers=headers, params=params)
+    response.raise_for_status()
+    return parse_you_hits(response.json(), num_results)
+
+
+async def perform_you_search_async(query: str, num_results: int = 15) -> Optional[str]:
+    """Async counterpart of app.perform_you_search (None when the search fails)."""
+    logging.info(f"Async You.com search: {query}")
+    try:
+        hits = await cached_search_async("you.com", fetch_you_hits_async, query, num_results=num_results)
+        return format_you_hits(hits)
+    except Exception as e:
+        logging.error(f"Error in You.com search: {e}")
+        return None
+
+
+async def chat_completion_async(headers: Dict, payload: Dict, operation: str,
+                                read_timeout: float = HTTP_READ_TIMEOUT) -> str:
+    """Send a non-streaming chat completion to OpenRouter and return the message text."""
+    response = await async_http_request("POST", OPENROUTER_URL, read_timeout=read_timeout, operation=operation,
+                                        json=payload, headers=headers)
+    response.raise_for_status()
+    return completion_content(response.json(), payload["model"])
+
+
+async def check_relevancy_with_cache_async(question: str) -> bool:
+    """Async counterpart of app.check_relevancy_with_cache, sharing the same decision cache."""
+    key = question_fingerprint(question)
+    decision = await asyncio.to_thread(relevancy_cache.get, key)
+    if decision is not None:
+        logging.info(f"Relevancy cache hit: decision {decision}.")
+        return decision
+
+    decision, _ = await relevancy_flight.do(key, _check_relevancy_uncached_async, question, key)
+    return decision
+
+
+async def _check_relevancy_uncached_async(question: str, key: str) -> bool:
+    with span("search.you.com.gate"):
+        snippets = await perform_you_search_async(question, num_results=5)
+    try:
+        headers, payload = build_relevancy_request(question, snippets or NO_SNIPPETS_NOTE)
+        decision = parse_relevancy_decision(await chat_completion_async(headers, payload, "gate"))
+    except Exception as e:
+        logging.error(f"Error in Walmart relevancy check: {e}")
+        return False
+
+    if snippets is not None:
+        await asyncio.to_thread(relevancy_cache.set, key, decision)
+        await asyncio.to_thread(log_gate_decision, question, decision)
+    return decision
+
+
+async def generate_humorous_rejection_async(question: str) -> str:
+    """Async counterpart of app.generate_humorous_rejection."""
+    pooled_message = (await asyncio.to_thread(get_rejection_pool)).next()
+    if pooled_message is not None:
+        return pooled_message
+    try:
+        headers, payload = build_rejection_request(question)
+        rejection_message = (await chat_completion_async(headers, payload, "rejection")).strip()
+        logging.info("Humorous rejection generated successfully.")
+        return rejection_message
+    except Exception as e:
+        logging.error(f"Error generating humorous rejection: {e}")
+        return FALLBACK_REJECTION_MESSAGE
+
+
+async def query_claude_with_context_async(question: str, context: str) -> str:
+    """Async counterpart of app.query_claude_with_context."""
+    try:
+        headers, payload = build_answer_request(question, context)
+        content = await chat_completion_async(headers, payload, "answer", read_timeout=LLM_READ_TIMEOUT)
+        log_answer_stats(question, context, content)
+        return content
+    except Exception as e:
+        logging.error(f"Error in AI response generation: {str(e)}")
+        return ANSWER_ERROR_MESSAGE
+
+
+async def stream_claude_with_context_async(question: str, context: str) -> AsyncIterator[str]:
+    """Async counterpart of app.stream_claude_with_context."""
+    headers, payload = build_answer_request(question, context, stream=True)
+    timeout = httpx.Timeout(LLM_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    guard = upstream_guard(OPENROUTER_URL)
+    guard.admit()
+
+    # As in the sync client, the concurrency slot is held until the response headers arrive
+    await acquire_upstream_slot(guard, UPSTREAM_QUEUE_TIMEOUT)
+    slot_held = True
+    try:
+        guard.claim()
+    except BaseException:
+        guard.limiter.release()
+        raise
+    started = time.perf_counter()
+    try:
+        async with get_async_client().stream("POST", OPENROUTER_URL, json=payload, headers=headers,
+                                             timeout=timeout) as response:
+            guard.limiter.release()
+            slot_held = False
+            guard.record("answer.stream", time.perf_counter() - started,
+                         ok=not is_failure_status(response.status_code))
+            response.raise_for_status()
+            parts = []
+            async for line in response.aiter_lines():
+                delta = parse_stream_line(line)
+                if delta is STREAM_DONE:
+                    break
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    except httpx.TransportError:
+        if slot_held:
+            guard.record("answer.stream", time.perf_counter() - started, ok=False)
+        raise
+    except BaseException:
+        if slot_held:
+            # Ended before the response headers, with no outcome to record
+            guard.breaker.release_probe()
+        raise
+    finally:
+        if slot_held:
+            guard.limiter.release()
+
+    log_answer_stats(question, context, "".join(parts))
+
+# ==============================================================================
+# 3. Async Core Logic
+# ==============================================================================
+
+async def search_you_context_async(question: str) -> List[Dict]:
+    """Async counterpart of app.search_you_context."""
+    query = context_search_query(question)
+    logging.info(f"Async You.com context search: {query}")
+    return you_passages(await cached_search_async("you.com", fetch_you_hits_async, query, num_results=15))
+
+
+async def search_google_context_async(question: str) -> List[Dict]:
+    """Async counterpart of app.search_google_context."""
+    query = context_search_query(question)
+    logging.info(f"Async Google context search: {query}")
+    return google_passages(await cached_search_async(
+        "google", fetch_google_hits_async, query, time_restricted=False, num_results=10
+    ))
+
+
+# Native coroutine implementations of the providers in app.SEARCH_PROVIDERS.
+# Providers without an entry here run their sync search in a worker thread.
+ASYNC_SEARCHES = {
+    "you.com": search_you_context_async,
+    "google": search_google_context_async,
+}
+
+
+async def _timed_search_async(provider: Dict, question: str) -> Tuple[List[Dict], float]:
+    started = time.perf_counter()
+    search = ASYNC_SEARCHES.get(provider["name"])
+    with span(f"search.{provider['name']}"):
+        if search is not None:
+            results = await search(question)
+        else:
+            results = await asyncio.to_thread(provider["search"], question)
+    return results, time.perf_counter() - started
+
+
+async def gather_search_context_async(question: str) -> List[Tuple[str, List[Dict]]]:
+    """
+    Async counterpart of app.gather_search_context: all providers run at once,
+    each under its own deadline, and late or failing providers are skipped.
+    """
+    started = time.perf_counter()
+    providers = await asyncio.to_thread(context_providers, question)
+    outcomes = await asyncio.gather(*[
+        asyncio.wait_for(_timed_search_async(provider, question),
+                         timeout=provider.get("timeout", SEARCH_PROVIDER_TIMEOUT))
+        for provider in providers
+    ], return_exceptions=True)
+
+    contexts = []
+    for provider, outcome in zip(providers, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            logging.warning(f"Search provider '{provider['name']}' exceeded its deadline; continuing without it.")
+        elif isinstance(outcome, BaseException):
+            logging.error(f"Search provider '{provider['name']}' failed: {outcome}")
+        else:
+            results, elapsed = outcome
+            logging.info(f"Search provider '{provider['name']}' returned {len(results)} passages in {elapsed:.2f}s.")
+            contexts.append((provider["title"], results))
+
+    logging.info(f"Context retrieval finished in {time.perf_counter() - started:.2f}s.")
+    return contexts
+
+
+async def is_question_relevant_async(question: str) -> bool:
+    # Both gates load their keyword list or model from disk on first use
+    with span("keyword_gate") as record:
+        record["passed"] = await asyncio.to_thread(hardcoded_walmart_check, question)
+    if record["passed"]:
+        return True
+    local_decision = await asyncio.to_thread(local_relevance_decision, question)
+    if local_decision is not None:
+        return local_decision
+    logging.info("Hardcoded Walmart relevance check failed. Performing AI-based check.")
+    with span("ai_gate") as record:
+        record["passed"] = await check_relevancy_with_cache_async(question)
+    return record["passed"]
+
+
+async def build_answer_context_async(question: str) -> str:
+    context, _ = await context_flight.do(normalize_query(question), _retrieve_context_async, question)
+    return context
+
+
+async def _retrieve_context_async(question: str) -> str:
+    with span("retrieval"):
+        contexts = await gather_search_context_async(question)
+    logging.info(f"Searches completed from {len(contexts)}/{len(SEARCH_PROVIDERS)} providers.")
+    # BM25 ranking and MinHash deduplication are CPU-bound
+    return await asyncio.to_thread(assemble_context, question, contexts)
+
+
+async def answer_question_async(question: str) -> Tuple[str, str]:
+    """Coroutine version of app.answer_question, returning (outcome, response)."""
+    if not await is_question_relevant_async(question):
+        logging.info("Generating humorous rejection.")
+        with span("rejection"):
+            return "rejected", await generate_humorous_rejection_async(question)
+
+    try:
+        combined_context = await build_answer_context_async(question)
+        with span("llm_generation"):
+            response = await query_claude_with_context_async(question, combined_context)
+        store_answer(question, response)
+        return ("error" if response == ANSWER_ERROR_MESSAGE else "answered"), response
+    except Exception as e:
+        logging.error(f"Error processing question: {e}")
+        return "error", f"An error occurred while processing your question: {str(e)}"
+
+
+@asynccontextmanager
+async def async_request_trace(route: str, request_id: Optional[str] = None,
+                              client: Optional[str] = None) -> AsyncIterator:
+    """app.request_trace, charging the client's usage from a worker thread on exit."""
+    trace = None
+    try:
+        with request_trace(route, request_id, client, charge=False) as trace:
+            yield trace
+    finally:
+        if client is not None and trace is not None:
+            await asyncio.to_thread(client_limiter.charge, trace)
+
+
+async def process_question_async(question: str, request_id: Optional[str] = None, client: Optional[str] = None) -> str:
+    """Coroutine version of app.process_question."""
+    logging.info(f"PROCESSING NEW QUESTION (async): '{question}'")
+
+    async with async_request_trace("ask", request_id, client) as trace:
+        with span("answer_cache") as record:
+            cached_answer = get_cached_answer(question)
+            record["hit"] = cached_answer is not None
+        if cached_answer is not None:
+            trace.outcome = "cached"
+            return cached_answer
+
+        (trace.outcome, response), collapsed = await question_flight.do(
+            normalize_query(question), answer_question_async, question
+        )
+        if collapsed:
+            logging.info("Question joined an identical in-flight question; sharing its response.")
+        return response
+
+
+async def stream_question_async(question: str, request_id: Optional[str] = None,
+                                client: Optional[str] = None) -> AsyncIterator[str]:
+    """Coroutine version of app.stream_question, yielding the same server-sent events."""
+    logging.info(f"STREAMING NEW QUESTION (async): '{question}'")
+
+    async with async_request_trace("ask_stream", request_id, client) as trace:
+        try:
+            with span("answer_cache") as record:
+                cached_answer = get_cached_answer(question)
+                record["hit"] = cached_answer is not None
+            if cached_answer is not None:
+                trace.outcome = "cached"
+                yield sse_event({"delta": cached_answer})
+                yield sse_event({}, event="done")
+                return
+
+            yield sse_event({"stage": "checking"}, event="status")
+            if not await is_question_relevant_async(question):
+                trace.outcome = "rejected"
+                with span("rejection"):
+                    rejection = await generate_humorous_rejection_async(question)
+                yield sse_event({"delta": rejection})
+                yield sse_event({}, event="done")
+                return
+
+            yield sse_event({"stage": "searching"}, event="status")
+            combined_context = await build_answer_context_async(question)
+
+            yield sse_event({"stage": "generating"}, event="status")
+            parts = []
+            with span("llm_generation") as record:
+                async for delta in stream_claude_with_context_async(question, combined_context):
+                    if not parts:
+                        record["first_token_s"] = trace.offset()
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+
+            store_answer(question, "".join(parts))
+            trace.outcome = "answered"
+            yield sse_event({}, event="done")
+
+        except Exception as e:
+            logging.error(f"Error streaming question: {e}")
+            trace.outcome = "error"
+            yield sse_event({"message": ANSWER_ERROR_MESSAGE}, event="error")
+
+# ==============================================================================
+# 4. ASGI Application
+# ==============================================================================
+
+flask_application = WsgiToAsgi(market_mentor.app)
+
+
+async def read_json_body(receive) -> Dict:
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def request_id_from(scope) -> str:
+    """Use the caller's X-Request-ID header when present, otherwise generate one."""
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id" and value:
+            return value.decode("latin-1")
+    return uuid.uuid4().hex
+
+
+def client_from(scope) -> str:
+    """Same client identity as the Flask routes: a known X-API-Key, else the (forwarded) client IP."""
+    headers = dict(scope.get("headers", []))
+    peer = scope.get("client")
+    return client_identity(
+        headers.get(b"x-api-key", b"").decode("latin-1") or None,
+        headers.get(b"x-forwarded-for", b"").decode("latin-1") or None,
+        peer[0] if peer else None,
+    )
+
+
+async def send_json(send, payload: Dict, status: int = 200, request_id: Optional[str] = None,
+                    extra_headers: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if request_id:
+        headers.append((b"x-request-id", request_id.encode("latin-1")))
+    headers.extend(extra_headers or [])
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def admit_client(scope, send, request_id: str) -> Optional[str]:
+    """Rate-limit the caller; returns its client identity, or None after sending a 429."""
+    client = client_from(scope)
+    retry_after = await asyncio.to_thread(client_limiter.admit, client)
+    if retry_after is None:
+        return client
+    retry_after = max(1, math.ceil(retry_after))
+    await send_json(
+        send, {'error': 'Too many questions. Please slow down and try again shortly.', 'retry_after': retry_after},
+        status=429, request_id=request_id, extra_headers=[(b"retry-after", str(retry_after).encode())],
+    )
+    return None
+
+
+async def ask_question(scope, receive, send) -> None:
+    """Async /ask: same request and response shape as the Flask route."""
+    try:
+        user_question = (await read_json_body(receive)).get("question")
+        if not isinstance(user_question, str) or not user_question.strip():
+            await send_json(send, {'response': 'Please provide a valid question.'})
+            return
+        request_id = request_id_from(scope)
+        client = await admit_client(scope, send, request_id)
+        if client is None:
+            return
+        response = await process_question_async(user_question, request_id=request_id, client=client)
+        await send_json(send, {'response': response}, request_id=request_id)
+    except Exception as e:
+        logging.error(f"Error in async ask_question route: {e}")
+        await send_json(send, {'response': f'An error occurred: {str(e)}'})
+
+
+async def ask_question_stream(scope, receive, send) -> None:
+    """Async /ask/stream: server-sent events, same format as the Flask route."""
+    user_question = (await read_json_body(receive)).get("question")
+    if not isinstance(user_question, str) or not user_question.strip():
+        await send_json(send, {'response': 'Please provide a valid question.'}, status=400)
+        return
+
+    request_id = request_id_from(scope)
+    client = await admit_client(scope, send, request_id)
+    if client is None:
+        return
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"x-request-id", request_id.encode("latin-1")),
+        ],
+    })
+    async for event in stream_question_async(user_question, request_id=request_id, client=client):
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+ASYNC_ROUTES = {
+    ("POST", "/ask"): ask_question,
+    ("POST", "/ask/stream"): ask_question_stream,
+}
+
+
+async def application(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                get_async_client()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    # Background jobs (/ask?mode=async) are queued and run by the Flask app's job pool
+    if handler is not None and "async" in parse_qs(scope.get("query_string", b"").decode("latin-1")).get("mode", []):
+        handler = None
+    if handler is not None:
+        await handler(scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
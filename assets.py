@@ -0,0 +1,244 @@
+# ==============================================================================
+# assets.py - Market Mentor: Static Asset Pipeline
+# ==============================================================================
+"""
+Fingerprinting and precompression for the files under static/ and public/.
+
+Every file gets a content-hashed name (static/style.css ->
+static/style.1a2b3c4d5e6f.css) that app.py serves under /assets/ with a
+one-year immutable Cache-Control, so browsers and the CDN never ask for it
+again until the content (and with it the name) changes. Templates link to
+assets through asset_url(), which resolves the hashed name.
+
+`build` writes the hashed copies plus .gz and .br variants (where compression
+saves at least MIN_SAVING) to an output directory with a manifest.json. The
+app always hashes the source files themselves and only borrows precompressed
+variants whose digest still matches, so a stale build can never serve old
+content; without a build, compressed variants are made on first request and
+kept in memory. Brotli needs the optional `Brotli` package; without it only
+gzip is offered.
+
+Build layout (one directory):
+    manifest.json                     format version and, per source path, its
+                                      hashed name, digest and encodings
+    static/style.1a2b3c4d5e6f.css     identity copy
+    static/style.1a2b3c4d5e6f.css.gz  gzip variant
+    static/style.1a2b3c4d5e6f.css.br  brotli variant
+
+Usage:
+    python assets.py build --out build/assets
+    python assets.py list
+"""
+import argparse
+import gzip
+import json
+import mimetypes
+import os
+import shutil
+from hashlib import sha256
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+MANIFEST_FORMAT = 1
+ASSET_ROOTS = ("static", "public")
+DIGEST_LENGTH = 12
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".map", ".svg", ".txt", ".xml", ".json", ".html", ".ico")
+MIN_SAVING = 0.1  # keep a compressed variant only if it is at least 10% smaller
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def compress(data: bytes, encoding: str) -> Optional[bytes]:
+    """data in the given encoding, or None when the encoder is unavailable."""
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def worth_keeping(original: bytes, compressed: Optional[bytes]) -> bool:
+    return compressed is not None and len(compressed) <= len(original) * (1 - MIN_SAVING)
+
+
+def negotiate_encodings(accept_encoding: str) -> List[str]:
+    """
+    Content codings the client accepts, best first (br, gzip, then identity).
+    q=0 refuses a coding; identity is always last as the fallback.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    return [encoding for encoding in ENCODING_SUFFIXES if accepted.get(encoding, wildcard) > 0] + ["identity"]
+
+
+def iter_source_files(base_dir: str, roots=ASSET_ROOTS) -> Iterator[str]:
+    """Source paths relative to base_dir ("public/images/favicon.ico"), skipping dotfiles."""
+    for root in roots:
+        for directory, subdirs, files in os.walk(os.path.join(base_dir, root)):
+            subdirs[:] = sorted(name for name in subdirs if not name.startswith("."))
+            for name in sorted(files):
+                if not name.startswith("."):
+                    yield os.path.relpath(os.path.join(directory, name), base_dir).replace(os.sep, "/")
+
+
+def hashed_name(path: str, digest: str) -> str:
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{digest}{extension}"
+
+# ==============================================================================
+# 1. Serving
+# ==============================================================================
+
+class Asset:
+    """One fingerprinted file; encoded bodies are read or compressed on first use and kept."""
+
+    def __init__(self, path: str, source: str, digest: str, built: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.source = source
+        self.digest = digest
+        self.hashed = hashed_name(path, digest)
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.compressible = path.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+        self.built = built or {}  # encoding -> precompressed file
+        self._bodies: Dict[str, Optional[bytes]] = {}
+
+    def etag(self, encoding: str) -> str:
+        return self.digest if encoding == "identity" else f"{self.digest}-{encoding}"
+
+    def body(self, encoding: str) -> Optional[bytes]:
+        """The file in the given encoding, or None when that variant is not worth having."""
+        if encoding not in self._bodies:
+            if encoding in self.built:
+                with open(self.built[encoding], "rb") as file:
+                    self._bodies[encoding] = file.read()
+            elif encoding == "identity":
+                with open(self.source, "rb") as file:
+                    self._bodies[encoding] = file.read()
+            elif self.compressible:
+                identity = self.body("identity")
+                compressed = compress(identity, encoding)
+                self._bodies[encoding] = compressed if worth_keeping(identity, compressed) else None
+            else:
+                self._bodies[encoding] = None
+        return self._bodies[encoding]
+
+
+class AssetManifest:
+    """Fingerprints of every source file, with precompressed variants from a build where still current."""
+
+    def __init__(self, base_dir: str, build_dir: Optional[str] = None, roots=ASSET_ROOTS):
+        built = {}
+        manifest_path = os.path.join(build_dir, "manifest.json") if build_dir else ""
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            if manifest.get("format") == MANIFEST_FORMAT:
+                built = manifest["assets"]
+
+        self.assets: Dict[str, Asset] = {}
+        self.precompressed = 0
+        for path in iter_source_files(base_dir, roots):
+            source = os.path.join(base_dir, path)
+            with open(source, "rb") as file:
+                digest = sha256(file.read()).hexdigest()[:DIGEST_LENGTH]
+            variants = {}
+            entry = built.get(path)
+            if entry and entry["digest"] == digest:
+                variants = {
+                    encoding: os.path.join(build_dir, entry["hashed"] + ENCODING_SUFFIXES[encoding])
+                    for encoding in entry["encodings"]
+                }
+                self.precompressed += bool(variants)
+            self.assets[path] = Asset(path, source, digest, variants)
+        self.by_hashed = {asset.hashed: asset for asset in self.assets.values()}
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    def url(self, path: str) -> str:
+        """Fingerprinted /assets/ URL for a source path; the plain path when it is not an asset."""
+        asset = self.assets.get(path)
+        return f"/assets/{quote(asset.hashed)}" if asset else f"/{quote(path)}"
+
+# ==============================================================================
+# 2. Build
+# ==============================================================================
+
+def build_assets(base_dir: str, out_dir: str, roots=ASSET_ROOTS) -> Dict:
+    """Write hashed copies, compressed variants and manifest.json to out_dir; returns size stats."""
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    entries = {}
+    stats = {"files": 0, "bytes": 0, "compressed": {encoding: 0 for encoding in ENCODING_SUFFIXES},
+             "compressed_from": 0, "brotli": compress(b"", "br") is not None}
+    for path in iter_source_files(base_dir, roots):
+        with open(os.path.join(base_dir, path), "rb") as file:
+            data = file.read()
+        digest = sha256(data).hexdigest()[:DIGEST_LENGTH]
+        target = os.path.join(out_dir, hashed_name(path, digest))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as file:
+            file.write(data)
+
+        encodings = []
+        if path.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            for encoding, suffix in ENCODING_SUFFIXES.items():
+                compressed = compress(data, encoding)
+                if worth_keeping(data, compressed):
+                    with open(target + suffix, "wb") as file:
+                        file.write(compressed)
+                    encodings.append(encoding)
+                    stats["compressed"][encoding] += len(compressed)
+            if encodings:
+                stats["compressed_from"] += len(data)
+        entries[path] = {"hashed": hashed_name(path, digest), "digest": digest, "encodings": encodings}
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump({"format": MANIFEST_FORMAT, "assets": entries}, file, indent=2)
+    return stats
+
+# ==============================================================================
+# 3. Command Line
+# ==============================================================================
+
+def main() -> None:
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the static assets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="write hashed, precompressed assets and a manifest")
+    build.add_argument("--out", default=os.path.join(base_dir, "build", "assets"), help="directory to (re)write")
+
+    listing = commands.add_parser("list", help="print each asset's URL and available encodings")
+    listing.add_argument("--build-dir", default=os.path.join(base_dir, "build", "assets"))
+
+    args = parser.parse_args()
+    if args.command == "build":
+        print(json.dumps(build_assets(base_dir, args.out), indent=2))
+        return
+
+    manifest = AssetManifest(base_dir, args.build_dir)
+    for path, asset in manifest.assets.items():
+        encodings = [encoding for encoding in ENCODING_SUFFIXES if asset.body(encoding) is not None]
+        origin = "build" if asset.built else "runtime"
+        print(f"{manifest.url(path):70} {', '.join(encodings) or '-':10} ({origin})")
+    print(f"{len(manifest)} assets, {manifest.precompressed} precompressed by the last build.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# ==============================================================================
+# batch.py - Market Mentor: Batch Answer Generation
+# ==============================================================================
+"""
+Pre-generate answers for a JSONL file of questions (one {"id": ..., "question":
+"..."} object or bare JSON string per line), writing one JSON result per line
+to the output file as each answer completes.
+
+The output file is the checkpoint: ids already answered there (anything but
+outcome "error") are skipped, so rerunning the same command after an
+interruption only answers what is left. Duplicate questions are answered once
+and similar questions share their search results (see app.answer_batch).
+
+By default the pipeline runs in this process with the app's configuration
+(API keys from the environment or .env). With --server the file is sent to a
+running deployment's /ask/batch endpoint instead, which keeps its own
+checkpoint as well.
+
+Usage:
+    python batch.py faq_questions.jsonl --out faq_answers.jsonl --workers 8
+    python batch.py faq_questions.jsonl --out faq_answers.jsonl --server https://mentor.example.com --api-key KEY
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List
+
+
+def parse_batch_lines(lines: Iterable[str]) -> List[Dict]:
+    """
+    Parse a JSONL batch: each non-empty line is {"id": ..., "question": "..."}
+    or just a JSON string. Lines without an id are numbered from 1. Raises
+    ValueError naming the first bad line.
+    """
+    items = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"line {number}: not valid JSON")
+        if isinstance(record, str):
+            record = {"question": record}
+        question = record.get("question") if isinstance(record, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError(f"line {number}: missing \"question\"")
+        items.append({"id": str(record.get("id", number)), "question": question.strip()})
+    if len({item["id"] for item in items}) != len(items):
+        raise ValueError("ids must be unique within a batch")
+    return items
+
+
+def read_finished(path: str) -> Dict[str, Dict]:
+    """Results already in the output file, by id (failed answers are retried)."""
+    finished = {}
+    if not os.path.exists(path):
+        return finished
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption
+            if isinstance(result, dict) and "id" in result and result.get("outcome") != "error":
+                finished[str(result["id"])] = result
+    return finished
+
+
+def answer_in_process(items: List[Dict], workers: int) -> Iterator[Dict]:
+    from app import answer_batch
+    return answer_batch(items, workers=workers)
+
+
+def answer_via_server(items: List[Dict], server: str, api_key: str, batch_id: str, timeout: float) -> Iterator[Dict]:
+    import requests
+
+    body = "".join(json.dumps(item) + "\n" for item in items)
+    headers = {"Content-Type": "application/x-ndjson"}
+    if api_key:
+        headers["X-API-Key"] = api_key
+    with requests.post(f"{server.rstrip('/')}/ask/batch", params={"batch_id": batch_id}, data=body.encode("utf-8"),
+                       headers=headers, stream=True, timeout=(10, timeout)) as response:
+        if response.status_code == 429:
+            sys.exit(f"Rate limited by the server; retry in {response.headers.get('Retry-After', '?')}s.")
+        if response.status_code == 413:
+            sys.exit(f"Batch refused by the server: {response.json().get('error')}")
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                yield json.loads(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions in bulk.")
+    parser.add_argument("questions", help="JSONL file of questions")
+    parser.add_argument("--out", required=True, help="JSONL file to append results to (also the checkpoint)")
+    parser.add_argument("--workers", type=int, help="questions answered at once (default: BATCH_WORKERS)")
+    parser.add_argument("--server", help="base URL of a deployment to send the batch to")
+    parser.add_argument("--api-key", default=os.getenv("MARKET_MENTOR_API_KEY", ""), help="X-API-Key for --server")
+    parser.add_argument("--batch-id", help="server-side checkpoint name (default: derived from the questions file)")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait between streamed results")
+    args = parser.parse_args()
+
+    # app is only imported for in-process runs; --server runs need just this file and requests
+    with open(args.questions, "r", encoding="utf-8") as file:
+        try:
+            items = parse_batch_lines(file)
+        except ValueError as e:
+            sys.exit(f"{args.questions}: {e}")
+
+    finished = read_finished(args.out)
+    pending = [item for item in items if item["id"] not in finished]
+    print(f"{len(items)} questions, {len(items) - len(pending)} already answered in {args.out}, "
+          f"{len(pending)} to go.", file=sys.stderr)
+    if not pending:
+        return
+
+    if args.server:
+        from hashlib import sha256
+        with open(args.questions, "rb") as file:
+            batch_id = args.batch_id or sha256(file.read()).hexdigest()[:24]
+        results = answer_via_server(pending, args.server, args.api_key, batch_id, args.timeout)
+    else:
+        from app import BATCH_WORKERS
+        results = answer_in_process(pending, args.workers or BATCH_WORKERS)
+
+    started = time.perf_counter()
+    outcomes: Dict[str, int] = {}
+    with open(args.out, "a", encoding="utf-8") as out:
+        for count, result in enumerate(results, start=1):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+            print(f"[{count}/{len(pending)}] {result['outcome']:8} {result['id']}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    print(f"Done in {elapsed:.1f}s ({len(pending) / elapsed:.2f} questions/s): {outcomes}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# ==============================================================================
+# benchmarks/cold_start_bench.py - Serverless cold-start benchmark
+# ==============================================================================
+"""
+Measure what a fresh process pays before it answers its first question, with
+LAZY_STARTUP off (everything built at import) and on (built on first use):
+
+    import      wall time of `import app`, and the cumulative time
+                `python -X importtime` attributes to it
+    GET /       first page render (template compile included)
+    first /ask  first question through the full pipeline, against local
+                upstream stand-ins with zero latency and all caches off
+    second /ask the same question again, for the steady-state cost
+
+Every run is a new interpreter, like a serverless cold start. The modules with
+the most import self-time under app are listed per mode, so the effect of
+deferred imports (requests/urllib3, numpy.random, docindex, relevance_model)
+is visible directly.
+
+Usage (from the repository root):
+    python benchmarks/cold_start_bench.py [--runs 7] [--top 12]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTION = "How do I improve my OTIF score for shipments to a Walmart distribution center?"
+
+
+def child() -> None:
+    """One cold start: import app, then time the first requests. Prints one JSON line."""
+    started = time.perf_counter()
+    import app as market_mentor
+    import_ms = (time.perf_counter() - started) * 1000
+
+    import logging
+    logging.disable(logging.WARNING)
+    client = market_mentor.app.test_client()
+    timings = {"import_ms": import_ms}
+    for name, send in [
+        ("home_ms", lambda: client.get("/")),
+        ("first_ask_ms", lambda: client.post("/ask", json={"question": QUESTION})),
+        ("second_ask_ms", lambda: client.post("/ask", json={"question": QUESTION})),
+    ]:
+        started = time.perf_counter()
+        response = send()
+        response.get_data()
+        timings[name] = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise SystemExit(f"{name}: HTTP {response.status_code}")
+    print(json.dumps(timings))
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Cumulative ms for `app` and self ms per top-level package imported under it.
+    -X importtime prints a module after everything it imports, so every line
+    before the `app` line belongs to its import (the child imports nothing else
+    first).
+    """
+    packages: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not self_us.isdigit():
+            continue  # the header line
+        if name == "app":
+            return int(cumulative_us) / 1000, packages
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+    raise RuntimeError("`import app` not found in -X importtime output")
+
+
+def cold_start(env: Dict[str, str]) -> Dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child"],
+        env=env, capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"cold start failed:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["importtime_ms"], timings["packages"] = parse_importtime(result.stderr)
+    return timings
+
+
+def report(mode: str, runs: List[Dict], top: int) -> None:
+    def median(key: str) -> float:
+        return statistics.median(run[key] for run in runs)
+
+    print(f"{mode} ({len(runs)} cold starts, medians):")
+    print(f"  import app (wall):      {median('import_ms'):8.1f} ms")
+    print(f"  import app (importtime):{median('importtime_ms'):8.1f} ms")
+    print(f"  first GET /:            {median('home_ms'):8.1f} ms")
+    print(f"  first POST /ask:        {median('first_ask_ms'):8.1f} ms")
+    print(f"  second POST /ask:       {median('second_ask_ms'):8.1f} ms")
+    print(f"  ready + first answer:   {median('import_ms') + median('first_ask_ms'):8.1f} ms")
+    packages = {name for run in runs for name in run["packages"]}
+    self_ms = {name: statistics.median(run["packages"].get(name, 0.0) for run in runs) for name in packages}
+    heaviest = sorted(self_ms.items(), key=lambda item: item[1], reverse=True)[:top]
+    print("  heaviest packages under app (import self-time): "
+          + ", ".join(f"{name} {ms:.1f}ms" for name, ms in heaviest))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=7, help="cold starts per mode")
+    parser.add_argument("--top", type=int, default=12, help="packages listed per mode")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    from benchmarks.stub_upstreams import LatencyProfile, start_stub_server, stub_environment
+
+    server = start_stub_server({name: LatencyProfile(0.0) for name in ["google", "you.com", "gate", "answer", "rejection"]})
+    workdir = tempfile.mkdtemp()
+    base_env = {
+        **os.environ,
+        **stub_environment(server),
+        "CACHE_DB_PATH": os.path.join(workdir, "cold_start_bench.sqlite3"),
+        "ANSWER_CACHE_ENABLED": "false",
+        "SEARCH_CACHE_BACKENDS": "",
+        "RELEVANCY_CACHE_BACKENDS": "",
+        "RATE_LIMIT_ENABLED": "false",
+    }
+    for mode, lazy in [("eager (LAZY_STARTUP=false)", "false"), ("lazy (LAZY_STARTUP=true)", "true")]:
+        runs = [cold_start({**base_env, "LAZY_STARTUP": lazy}) for _ in range(args.runs)]
+        report(mode, runs, args.top)
+
+
+if __name__ == "__main__":
+    main()
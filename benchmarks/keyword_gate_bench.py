@@ -0,0 +1,152 @@
+# ==============================================================================
+# benchmarks/keyword_gate_bench.py - Keyword gate micro-benchmark
+# ==============================================================================
+"""
+Compare the precompiled keyword matcher in app.py with the original
+per-keyword re.search loop on a corpus of sample supplier and off-topic
+questions. Reports time per question and every question where the two
+implementations disagree.
+
+Usage (from the repository root):
+    python benchmarks/keyword_gate_bench.py [--repeat 200]
+"""
+import argparse
+import os
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging  # noqa: E402
+logging.disable(logging.INFO)
+
+from app import find_walmart_keywords, get_keyword_matcher  # noqa: E402
+
+# Keyword list and loop from the original hardcoded_walmart_check (keyword list v1)
+LEGACY_WALMART_KEYWORDS = [
+    r"\bwalmart\b", r"\bsam['s]? club\b", r"\bwalmart connect\b", r"\bretail link\b", r"\bsupplier center\b",
+    r"\bwalmart supplier portal\b", r"\bmodular\b", r"\bin-store merchandising\b",
+    r"\bsupplier agreement\b", r"\bwalmart terms\b", r"\bstore planning\b", r"\bon-time in full\b",
+    r"\botif\b", r"\bsustainability\b", r"\bcompliance\b", r"\belectronic product code\b",
+    r"\bepc\b", r"\bpackaging\b", r"\bshipping\b", r"\bwarehouse\b", r"\bdelivery\b",
+    r"\bdistribution center\b", r"\bsupplier security\b", r"\bglobal supplier\b", r"\bedi\b",
+    r"\binvoice\b", r"\bupc\b", r"\bbarcode\b", r"\blabeling\b", r"\bfreight\b",
+    r"\bcollect-ready\b", r"\bmust arrive by date\b", r"\bmabd\b", r"\binventory management\b",
+    r"\bforecasting\b", r"\breplenishment\b", r"\bgeneral merchandise\b", r"\bproduct listing\b",
+    r"\bexecution requirements\b", r"\boms\b", r"\blogistics\b", r"\bvendor agreement\b",
+    r"\bonline marketplace\b", r"\bthird-party marketplace\b", r"\bwalmart marketplace\b",
+    r"\bvba\b", r"\bsupplier compliance\b", r"\bsuppliers?\b", r"\bsupply chain\b", r"\bmerchandise\b",
+    r"\bpurchase order\b", r"\bpo\b", r"\bcase pack\b", r"\bmaster pack\b", r"\bpackaging specification\b",
+    r"\bitem file\b", r"\breceiving\b", r"\bcarrier\b", r"\bpayables\b", r"\bvpn\b",
+    r"\bnew item setup\b", r"\bmod creation\b", r"\bmod changes\b", r"\brack and stack\b",
+    r"\bshelf management\b", r"\bmarket manager\b", r"\baccount manager\b", r"\bin-store compliance\b",
+    r"\bin-store standards\b", r"\bhazardous materials\b", r"\bhazmat\b", r"\bstorm compliance\b",
+    r"\brfid\b", r"\bgs1\b", r"\bglobal data synchronization network\b", r"\bgdsn\b",
+    r"\bdata sync\b", r"\bretail industry\b", r"\bclub channel\b", r"\bprivate label\b",
+    r"\bgreat value\b", r"\bbrand guidelines\b", r"\bpackaging design\b", r"\bexecution tracking\b",
+    r"\breturns policy\b", r"\bwalmart store returns\b", r"\bstore claims\b", r"\bdispute resolution\b",
+    r"\bvendor compliance\b", r"\bmonetary fines\b", r"\bchargebacks\b", r"\broot cause\b",
+    r"\bglobal compliance\b", r"\bproduct safety\b", r"\bfood safety\b", r"\bbakery supplier\b",
+    r"\bproduce supplier\b", r"\bmeat supplier\b", r"\bconsumables supplier\b", r"\bhealth and wellness supplier\b",
+    r"\bonline grocery\b", r"\bclick and collect\b", r"\bpickup tower\b", r"\bdrone delivery\b",
+    r"\bjet.com\b", r"\bfulfillment\b", r"\bwalmart fulfillment services\b", r"\breturns center\b",
+    r"\bapparel supplier\b", r"\belectronics supplier\b", r"\btoy supplier\b", r"\bimport requirements\b",
+    r"\btariffs\b", r"\bharmonized tariff schedule\b", r"\bhs code\b", r"\bcountry of origin\b",
+    r"\blead time\b", r"\bmodule changes\b", r"\bexecution guide\b", r"\bcompliance guide\b",
+    r"\bcorporate compliance\b", r"\bcorporate responsibility\b", r"\bethics\b", r"\bconduct\b",
+    r"\binvoice matching\b", r"\baccounts payable\b", r"\bremittance\b", r"\bbilling disputes\b",
+    r"\bremittance advice\b", r"\bpayment terms\b", r"\bsam's club suppliers?\b",
+    r"\bselling at walmart\b", r"\bproduct onboarding\b", r"\bproduct compliance\b",
+    r"\bonline item file\b", r"\bproduct development\b", r"\bwalmart labs\b", r"\bmerchandising portal\b"
+]
+
+
+def legacy_walmart_check(question: str) -> bool:
+    question_normalized = question.lower().translate(str.maketrans('', '', string.punctuation))
+    for keyword in LEGACY_WALMART_KEYWORDS:
+        if re.search(keyword, question_normalized):
+            return True
+    return False
+
+
+SAMPLE_QUESTIONS = [
+    "What is OTIF and how is it calculated for my shipments?",
+    "How do I set up a new item in Retail Link?",
+    "What does MABD mean for collect-ready orders?",
+    "How do I become a Sam's Club supplier?",
+    "Can I still sell through Jet.com?",
+    "What are the on-time in-full fines this year?",
+    "How do I dispute a chargeback for a late delivery?",
+    "What GS1 barcode requirements apply to case packs?",
+    "Explain the packaging specification for master packs.",
+    "How do I get access to the Walmart supplier portal?",
+    "Who is my market manager and how do I reach them?",
+    "What EDI documents do I need to send for a purchase order?",
+    "How do I read my remittance advice in accounts payable?",
+    "What are the RFID tagging requirements for apparel suppliers?",
+    "How does Walmart Fulfillment Services handle returns?",
+    "What are the third-party marketplace seller fees?",
+    "How do I submit a modular change request?",
+    "Where can I find the in-store compliance execution guide?",
+    "What country of origin labeling rules apply to imports?",
+    "How long is the typical lead time for replenishment orders?",
+    "What's the best recipe for banana bread?",
+    "Who won the football game last night?",
+    "How do I fix a leaking faucet?",
+    "Can you write me a poem about the ocean?",
+    "What is the capital of Australia?",
+    "Explain quantum entanglement simply.",
+    "What movies are playing this weekend?",
+    "How do I train my puppy to sit?",
+    "Recommend a good laptop for gaming.",
+    "What's the weather like in Paris in spring?",
+    "How do I improve my chess openings?",
+    "Translate 'good morning' into Spanish.",
+    "What are the symptoms of the flu?",
+    "How many calories are in an avocado?",
+    "Tell me a joke about cats.",
+    "What is the meaning of life?",
+    "How do I change a flat tire?",
+    "Write a haiku about autumn leaves.",
+    "What is the tallest mountain in the world?",
+    "How do I start investing in index funds?",
+]
+
+
+def time_per_call(check, questions, repeat: int) -> float:
+    """Return the mean microseconds per question over repeat passes of the corpus."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for question in questions:
+            check(question)
+    return (time.perf_counter() - started) / (repeat * len(questions)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200, help="passes over the sample corpus")
+    args = parser.parse_args()
+
+    legacy_us = time_per_call(legacy_walmart_check, SAMPLE_QUESTIONS, args.repeat)
+    compiled_us = time_per_call(find_walmart_keywords, SAMPLE_QUESTIONS, args.repeat)
+
+    matcher = get_keyword_matcher()
+    print(f"Keyword list v{matcher.version}: {len(matcher.keywords)} keywords, "
+          f"{len(SAMPLE_QUESTIONS)} sample questions x {args.repeat} passes")
+    print(f"  legacy re.search loop: {legacy_us:8.1f} us/question")
+    print(f"  compiled matcher:      {compiled_us:8.1f} us/question  ({legacy_us / compiled_us:.1f}x faster)")
+
+    disagreements = [
+        (question, legacy_walmart_check(question), find_walmart_keywords(question))
+        for question in SAMPLE_QUESTIONS
+        if legacy_walmart_check(question) != bool(find_walmart_keywords(question))
+    ]
+    print(f"Disagreements: {len(disagreements)}")
+    for question, legacy, matched in disagreements:
+        print(f"  legacy={legacy!s:5} compiled={matched!r:30} {question}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# ==============================================================================
+# benchmarks/load_test.py - Offline /ask load test
+# ==============================================================================
+"""
+Drive /ask at a target concurrency against local upstream stand-ins and report
+latency percentiles, throughput and error rate for each request path:
+
+    keyword-pass     question matches the keyword gate -> searches -> answer
+    ai-gate-reject   no keyword, rejected by the local classifier or AI gate -> rejection
+    full-answer      no keyword, AI gate says yes -> searches -> answer
+    viral            the same keyword question every time (exercises single-flight)
+
+By default the Flask app is started in-process on a threaded server with its
+caches disabled, so every request exercises the full path. Use --target to
+drive an already running server instead (start it with the environment printed
+by benchmarks/stub_upstreams.py). Results are written as JSON for comparison
+between runs.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py --requests 100 --concurrency 20
+    python benchmarks/load_test.py --paths keyword-pass --answer-latency 2 --output run.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_upstreams import (  # noqa: E402
+    GATE_ACCEPT_MARKER,
+    StubHandler,
+    add_latency_arguments,
+    profiles_from_args,
+    start_stub_server,
+    stub_environment,
+)
+
+PATHS = {
+    "keyword-pass": "How do I improve my OTIF score for shipments to distribution center {n}?",
+    "ai-gate-reject": "What is a good recipe for banana bread, variation {n}?",
+    "full-answer": f"Tell me about the {GATE_ACCEPT_MARKER} topic number {{n}} for my team.",
+    "viral": "How do I improve my OTIF score with Walmart?",
+}
+
+ERROR_PREFIXES = ("An error occurred",)
+
+
+def start_app_server(stub_env: Dict[str, str], keep_caches: bool) -> str:
+    """Import app.py against the stubs, serve it on a free port, and return its base URL."""
+    os.environ.update(stub_env)
+    # Every benchmark request comes from 127.0.0.1, so per-client rate limiting would refuse most of them
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    if not keep_caches:
+        os.environ.update({
+            "ANSWER_CACHE_ENABLED": "false",
+            "SEARCH_CACHE_BACKENDS": "",
+            "RELEVANCY_CACHE_BACKENDS": "",
+        })
+
+    import logging
+    logging.disable(logging.WARNING)
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_path(base_url: str, path_name: str, total: int, concurrency: int, timeout: float) -> Dict:
+    """Send total /ask requests for one path with the given concurrency and summarize them."""
+    template = PATHS[path_name]
+    local = threading.local()
+
+    def one_request(n: int):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/ask", json={"question": template.format(n=n)}, timeout=timeout)
+            text = response.json().get("response", "") if response.ok else ""
+            ok = response.ok and bool(text) and not text.startswith(ERROR_PREFIXES)
+        except (requests.RequestException, ValueError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one_request, range(total)))
+    wall_time = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    errors = sum(1 for _, ok in outcomes if not ok)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(total / wall_time, 3) if wall_time else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "mean": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test for /ask using local upstream stand-ins.")
+    parser.add_argument("--requests", type=int, default=50, help="requests per path")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--paths", nargs="+", choices=sorted(PATHS), default=[p for p in PATHS if p != "viral"])
+    parser.add_argument("--timeout", type=float, default=90.0, help="client timeout per request (s)")
+    parser.add_argument("--target", help="base URL of an already running server (skips the in-process app)")
+    parser.add_argument("--keep-caches", action="store_true", help="leave the answer/search/relevancy caches on")
+    parser.add_argument("--label", default="", help="free-form label stored with the results")
+    parser.add_argument("--output", help="where to write the JSON results (default: benchmarks/results/)")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    stub_server = start_stub_server(profiles_from_args(args))
+    base_url = args.target or start_app_server(stub_environment(stub_server), args.keep_caches)
+
+    results = {}
+    for path_name in args.paths:
+        print(f"Running {path_name}: {args.requests} requests at concurrency {args.concurrency}...")
+        results[path_name] = summary = run_path(base_url, path_name, args.requests, args.concurrency, args.timeout)
+        latency = summary["latency_ms"]
+        print(f"  p50 {latency['p50']:.0f}ms  p95 {latency['p95']:.0f}ms  p99 {latency['p99']:.0f}ms  "
+              f"{summary['throughput_rps']:.2f} req/s  errors {summary['error_rate']:.1%}")
+
+    report = {
+        "label": args.label,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "target": args.target or "in-process flask (threaded)",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "label", "target")},
+        "upstream_calls": dict(StubHandler.calls),
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        f"load_test-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
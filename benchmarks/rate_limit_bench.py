@@ -0,0 +1,100 @@
+# ==============================================================================
+# benchmarks/rate_limit_bench.py - Rate limiter hot-path overhead
+# ==============================================================================
+"""
+Measure what per-client rate limiting adds to every question:
+
+    identity    deriving the client name from the request headers
+    memory      ClientRateLimiter.admit with the in-process store
+    sqlite      ClientRateLimiter.admit with the shared SQLite store
+    route       a Flask test-client POST to /ask/stream with the limiter off vs
+                on; the question is answered from the answer cache, so the
+                difference is the limiter's share of a request that does no
+                upstream work at all
+
+Admit calls are spread over --clients client names, with a bucket large enough
+that none of them is refused; refusals cost the same work.
+
+Usage (from the repository root):
+    python benchmarks/rate_limit_bench.py [--calls 20000] [--clients 1000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("CACHE_DB_PATH", os.path.join(tempfile.mkdtemp(), "rate_limit_bench.sqlite3"))
+
+import logging  # noqa: E402
+logging.disable(logging.WARNING)
+
+import app as market_mentor  # noqa: E402
+from app import (  # noqa: E402
+    ClientRateLimiter,
+    MemoryRateLimitStore,
+    SQLiteRateLimitStore,
+    client_identity,
+    store_answer,
+)
+
+
+def time_per_call(fn, calls: int) -> float:
+    """Median microseconds per call over five rounds of calls // 5."""
+    per_round = max(1, calls // 5)
+    rounds = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for i in range(per_round):
+            fn(i)
+        rounds.append((time.perf_counter() - started) / per_round * 1e6)
+    return statistics.median(rounds)
+
+
+def route_time(limiter: ClientRateLimiter, calls: int) -> float:
+    market_mentor.client_limiter = limiter
+    client = market_mentor.app.test_client()
+    question = "How do I improve my OTIF score with Walmart?"
+    store_answer(question, "Cached benchmark answer.")
+
+    def one(i: int) -> None:
+        response = client.post("/ask/stream", json={"question": question},
+                               headers={"X-Forwarded-For": f"10.0.{i % 250}.{i % 200}"})
+        response.get_data()
+    return time_per_call(one, calls)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calls", type=int, default=20000, help="admit calls per store")
+    parser.add_argument("--clients", type=int, default=1000, help="distinct client names")
+    args = parser.parse_args()
+
+    clients = [f"ip:10.0.{n // 250}.{n % 250}" for n in range(args.clients)]
+    burst = float(args.calls)  # never refuse, so every call does the full update
+    stores = {
+        "memory": MemoryRateLimitStore(rate=1.0, burst=burst),
+        "sqlite": SQLiteRateLimitStore(os.environ["CACHE_DB_PATH"], rate=1.0, burst=burst),
+    }
+
+    identity_us = time_per_call(lambda i: client_identity(None, "203.0.113.9, 10.0.0.1", "127.0.0.1"), args.calls)
+    print(f"{args.calls} admit calls over {args.clients} clients")
+    print(f"  client identity:          {identity_us:8.2f} us/request")
+    for name, store in stores.items():
+        limiter = ClientRateLimiter(store, enabled=True)
+        admit_us = time_per_call(lambda i: limiter.admit(clients[i % len(clients)]), args.calls)
+        print(f"  admit ({name + ' store'}):{' ' * (13 - len(name))}{admit_us:8.2f} us/request")
+
+    route_calls = min(args.calls, 2000)
+    off_us = route_time(ClientRateLimiter(stores["memory"], enabled=False), route_calls)
+    on_us = route_time(ClientRateLimiter(stores["memory"], enabled=True), route_calls)
+    print(f"Cached /ask/stream via the Flask test client ({route_calls} requests):")
+    print(f"  limiter off:              {off_us:8.1f} us/request")
+    print(f"  limiter on (memory):      {on_us:8.1f} us/request  (+{on_us - off_us:.1f} us)")
+
+
+if __name__ == "__main__":
+    main()
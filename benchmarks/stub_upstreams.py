@@ -0,0 +1,247 @@
+# ==============================================================================
+# benchmarks/stub_upstreams.py - Local stand-ins for OpenRouter, Google and You.com
+# ==============================================================================
+"""
+One local HTTP server that imitates the three upstream APIs app.py calls, with
+configurable latency and error distributions:
+
+    /openrouter/chat/completions   OpenRouter chat completions (plain and streaming)
+    /google/customsearch/v1        Google Custom Search
+    /ydc/search                    You.com search
+
+Latency for each upstream is drawn from a log-normal distribution with the
+given median and spread; a configurable fraction of calls returns HTTP 500.
+The relevance-gate model answers "true" only when the question contains
+GATE_ACCEPT_MARKER, so load tests can choose which path a question takes.
+Token usage is estimated from the prompt (about four characters per token);
+like Anthropic's prompt cache, a prefix ending at a cache_control marker that
+is at least PROMPT_CACHE_MIN_TOKENS long is reported as cached from its second
+use on.
+
+Run standalone to point a separately started server (e.g. uvicorn asgi:application)
+at the stubs:
+    python benchmarks/stub_upstreams.py --port 8900
+and export the environment variables it prints.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import parse_qs, urlparse
+
+GATE_ACCEPT_MARKER = "bench-accept"
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+ANSWER_TEXT = (
+    "**Overview**\n\nThis is a stub answer from the local benchmark upstream. "
+    "It stands in for a long consultant-style response about Walmart supplier processes. "
+) * 20
+
+
+class LatencyProfile:
+    """Log-normal latency (median seconds, sigma) plus an error rate for one upstream."""
+
+    def __init__(self, median: float, sigma: float = 0.35, error_rate: float = 0.0):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median), self.sigma)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def prompt_usage(messages, cached_prefixes: set) -> Dict:
+    """Estimated prompt tokens, with the cached share of a marked prefix that was seen before."""
+    texts, marked = [], 0
+    for message in messages:
+        content = message.get("content")
+        for block in content if isinstance(content, list) else [{"text": content or ""}]:
+            texts.append(block.get("text", ""))
+            if block.get("cache_control"):
+                marked = len(texts)
+    prefix = "".join(texts[:marked])
+    cached = 0
+    if len(prefix) // 4 >= PROMPT_CACHE_MIN_TOKENS:
+        if prefix in cached_prefixes:
+            cached = len(prefix) // 4
+        cached_prefixes.add(prefix)
+    return {"prompt_tokens": sum(len(text) for text in texts) // 4, "prompt_tokens_details": {"cached_tokens": cached}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    profiles: Dict[str, LatencyProfile] = {}
+    calls: Dict[str, int] = {}
+    cached_prefixes: set = set()
+    calls_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, name: str) -> None:
+        with self.calls_lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _send_json(self, payload: Dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay_or_fail(self, profile_name: str) -> bool:
+        """Sleep for a sampled latency; return True (after sending a 500) if this call should fail."""
+        profile = self.profiles[profile_name]
+        time.sleep(profile.sample())
+        if profile.should_fail():
+            self._send_json({"error": {"message": f"stub {profile_name} failure"}}, status=500)
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/google/customsearch/v1":
+            self._count("google")
+            if self._delay_or_fail("google"):
+                return
+            num = int(query.get("num", ["10"])[0])
+            self._send_json({"items": [
+                {"title": f"Walmart supplier guide {i}", "link": f"https://corporate.walmart.com/guide/{i}",
+                 "snippet": "Suppliers must meet on-time in-full requirements and packaging standards."}
+                for i in range(num)
+            ]})
+        elif url.path == "/ydc/search":
+            self._count("you.com")
+            if self._delay_or_fail("you.com"):
+                return
+            num = int(query.get("num_web_results", ["10"])[0])
+            self._send_json({"hits": [
+                {"title": f"Supplier resource {i}", "url": f"https://supplierhelp.walmart.com/article/{i}",
+                 "description": "Walmart supplier help article.",
+                 "snippets": ["Retail Link reports show OTIF performance by DC."]}
+                for i in range(num)
+            ]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if url.path != "/openrouter/chat/completions":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        model = body.get("model", "")
+        is_gate = model == "openai/gpt-4o"
+        profile_name = "gate" if is_gate else ("answer" if body.get("max_tokens", 0) > 1000 else "rejection")
+        self._count(profile_name)
+        if self._delay_or_fail(profile_name):
+            return
+
+        if is_gate:
+            prompt = json.dumps(body.get("messages", []))
+            content = "true" if GATE_ACCEPT_MARKER in prompt else "false"
+        elif profile_name == "rejection":
+            content = "Stub rejection: I only talk about Walmart supplier topics."
+        else:
+            content = ANSWER_TEXT
+        usage = prompt_usage(body.get("messages", []), self.cached_prefixes)
+        usage["completion_tokens"] = len(content) // 4
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+            words = content.split(" ")
+            for index in range(0, len(words), 8):
+                chunk = {"model": model, "choices": [{"delta": {"content": " ".join(words[index:index + 8]) + " "}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            final = {"model": model, "choices": [{"delta": {}}], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            return
+
+        self._send_json({"model": model, "choices": [{"message": {"content": content}}], "usage": usage})
+
+
+def start_stub_server(profiles: Dict[str, LatencyProfile], host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the stub server in a daemon thread and return it (port 0 picks a free port)."""
+    StubHandler.profiles = profiles
+    StubHandler.calls = {}
+    StubHandler.cached_prefixes = set()
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_environment(server: ThreadingHTTPServer) -> Dict[str, str]:
+    """Environment variables that point app.py at the stub server."""
+    host, port = server.server_address[:2]
+    base = f"http://{host}:{port}"
+    return {
+        "OPENROUTER_URL": f"{base}/openrouter/chat/completions",
+        "GOOGLE_SEARCH_URL": f"{base}/google/customsearch/v1",
+        "YDC_SEARCH_URL": f"{base}/ydc/search",
+        "OPENROUTER_API_KEY": "stub", "OPENROUTER_DIF_API_KEY": "stub",
+        "GOOGLE_API_KEY": "stub", "CUSTOM_SEARCH_ENGINE_ID": "stub", "YDC_API_KEY": "stub",
+    }
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("upstream stand-ins")
+    group.add_argument("--search-latency", type=float, default=0.6, help="median You.com/Google latency (s)")
+    group.add_argument("--gate-latency", type=float, default=0.8, help="median GPT-4o gate latency (s)")
+    group.add_argument("--answer-latency", type=float, default=6.0, help="median Claude answer latency (s)")
+    group.add_argument("--rejection-latency", type=float, default=1.2, help="median rejection latency (s)")
+    group.add_argument("--latency-sigma", type=float, default=0.35, help="log-normal spread of all latencies")
+    group.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls returning 500")
+
+
+def profiles_from_args(args: argparse.Namespace) -> Dict[str, LatencyProfile]:
+    def profile(median: float) -> LatencyProfile:
+        return LatencyProfile(median, args.latency_sigma, args.error_rate)
+    return {
+        "google": profile(args.search_latency),
+        "you.com": profile(args.search_latency),
+        "gate": profile(args.gate_latency),
+        "answer": profile(args.answer_latency),
+        "rejection": profile(args.rejection_latency),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the Market Mentor upstream APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_stub_server(profiles_from_args(args), args.host, args.port)
+    for name, value in stub_environment(server).items():
+        print(f"export {name}={value}")
+    print("Stub upstreams running; press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
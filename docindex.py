@@ -0,0 +1,270 @@
+# ==============================================================================
+# docindex.py - Market Mentor: Local Supplier Document Index (BM25)
+# ==============================================================================
+"""
+Local retrieval over a directory of Walmart supplier documents (OTIF, MABD,
+packaging and EDI guides, ...). Documents are split into overlapping word
+windows ("chunks") and stored as a BM25 inverted index in plain .npy arrays
+that are memory-mapped on load, so opening an index costs almost nothing and
+only the postings a query touches are paged in.
+
+Index layout (one directory):
+    meta.json          format version, BM25 parameters, chunk count, vocabulary
+    term_offsets.npy   int64[V+1]  postings range of each term
+    posting_docs.npy   int32[P]    chunk id of each posting
+    posting_tfs.npy    uint16[P]   term frequency of each posting
+    idf.npy            float32[V]  BM25 idf of each term
+    doc_lengths.npy    int32[N]    token count of each chunk
+    chunk_offsets.npy  int64[N+1]  byte offsets into chunks.jsonl
+    chunks.jsonl       one {"title", "source", "text"} object per chunk
+
+Supported inputs are .txt, .md and .html/.htm files; convert PDFs to text first.
+
+Usage:
+    python docindex.py build ./supplier_docs --out ./doc_index
+    python docindex.py query ./doc_index "How is OTIF calculated?" -k 5
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+INDEX_FORMAT = 1
+DOCUMENT_EXTENSIONS = (".txt", ".md", ".html", ".htm")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+HTML_TAG_PATTERN = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens, the same tokenization as the keyword gate."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+# ==============================================================================
+# 1. Ingestion
+# ==============================================================================
+
+def read_document(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as file:
+        text = file.read()
+    if path.lower().endswith((".html", ".htm")):
+        text = HTML_TAG_PATTERN.sub(" ", text)
+    return text
+
+
+def document_title(path: str, text: str) -> str:
+    """First non-empty line of the document (without Markdown heading marks), else the file name."""
+    for line in text.splitlines():
+        line = line.strip().lstrip("#").strip()
+        if line:
+            return line[:120]
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def chunk_words(text: str, size: int, overlap: int) -> Iterator[str]:
+    """Split text into windows of size words, each overlapping the previous by overlap words."""
+    words = text.split()
+    step = max(1, size - overlap)
+    for start in range(0, len(words), step):
+        yield " ".join(words[start:start + size])
+        if start + size >= len(words):
+            break
+
+
+def iter_documents(source_dir: str) -> Iterator[str]:
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def build_index(source_dir: str, out_dir: str, size: int = 180, overlap: int = 40,
+                k1: float = 1.2, b: float = 0.75) -> Dict:
+    """
+    Chunk every document under source_dir and write a BM25 index to out_dir,
+    replacing any index already there. Returns the build statistics.
+    """
+    started = time.perf_counter()
+    tmp_dir = out_dir.rstrip(os.sep) + ".building"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lengths: List[int] = []
+    chunk_offsets = [0]
+    documents = 0
+
+    with open(os.path.join(tmp_dir, "chunks.jsonl"), "wb") as chunks_file:
+        for path in iter_documents(source_dir):
+            text = read_document(path)
+            title = document_title(path, text)
+            source = os.path.relpath(path, source_dir)
+            documents += 1
+            for chunk in chunk_words(text, size, overlap):
+                tokens = tokenize(chunk)
+                if not tokens:
+                    continue
+                chunk_id = len(doc_lengths)
+                doc_lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    postings.setdefault(term, []).append((chunk_id, tf))
+                line = json.dumps({"title": title, "source": source, "text": chunk}) + "\n"
+                chunks_file.write(line.encode("utf-8"))
+                chunk_offsets.append(chunk_offsets[-1] + len(line.encode("utf-8")))
+
+    vocabulary = sorted(postings)
+    num_chunks = len(doc_lengths)
+    term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    document_frequency = np.zeros(len(vocabulary), dtype=np.float64)
+    for term_id, term in enumerate(vocabulary):
+        document_frequency[term_id] = len(postings[term])
+        term_offsets[term_id + 1] = term_offsets[term_id] + len(postings[term])
+
+    posting_docs = np.empty(int(term_offsets[-1]), dtype=np.int32)
+    posting_tfs = np.empty(int(term_offsets[-1]), dtype=np.uint16)
+    for term_id, term in enumerate(vocabulary):
+        entries = np.asarray(postings[term], dtype=np.int64)
+        posting_docs[term_offsets[term_id]:term_offsets[term_id + 1]] = entries[:, 0]
+        posting_tfs[term_offsets[term_id]:term_offsets[term_id + 1]] = np.minimum(entries[:, 1], 65535)
+
+    # Lucene-style idf: always positive, so very common terms add little instead of subtracting
+    idf = np.log1p((num_chunks - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+    np.save(os.path.join(tmp_dir, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(tmp_dir, "posting_docs.npy"), posting_docs)
+    np.save(os.path.join(tmp_dir, "posting_tfs.npy"), posting_tfs)
+    np.save(os.path.join(tmp_dir, "idf.npy"), idf)
+    np.save(os.path.join(tmp_dir, "doc_lengths.npy"), np.asarray(doc_lengths, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "chunk_offsets.npy"), np.asarray(chunk_offsets, dtype=np.int64))
+
+    stats = {
+        "format": INDEX_FORMAT,
+        "k1": k1,
+        "b": b,
+        "documents": documents,
+        "num_chunks": num_chunks,
+        "avg_length": float(np.mean(doc_lengths)) if doc_lengths else 0.0,
+        "chunk_words": size,
+        "chunk_overlap": overlap,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump({**stats, "vocabulary": vocabulary}, file)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    stats.update(terms=len(vocabulary), postings=int(term_offsets[-1]),
+                 build_seconds=round(time.perf_counter() - started, 2))
+    return stats
+
+# ==============================================================================
+# 2. Querying
+# ==============================================================================
+
+class DocumentIndex:
+    """
+    Read-only BM25 index over memory-mapped arrays. Only the vocabulary and the
+    per-chunk length normalization are held in memory; postings and chunk text
+    are read on demand.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported document index format {meta.get('format')} in {path}")
+
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.num_chunks = meta["num_chunks"]
+        self.vocabulary = {term: term_id for term_id, term in enumerate(meta["vocabulary"])}
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.term_offsets = load("term_offsets.npy")
+        self.posting_docs = load("posting_docs.npy")
+        self.posting_tfs = load("posting_tfs.npy")
+        self.idf = load("idf.npy")
+        self.chunk_offsets = load("chunk_offsets.npy")
+        doc_lengths = load("doc_lengths.npy").astype(np.float32)
+        avg_length = meta["avg_length"] or 1.0
+        self.length_norm = (self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return self.num_chunks
+
+    def chunk(self, chunk_id: int) -> Dict:
+        start, end = int(self.chunk_offsets[chunk_id]), int(self.chunk_offsets[chunk_id + 1])
+        with open(os.path.join(self.path, "chunks.jsonl"), "rb") as file:
+            file.seek(start)
+            return json.loads(file.read(end - start))
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """Return the top-k chunks for the query as dicts with title, source, text, chunk_id and score."""
+        term_ids = [self.vocabulary[term] for term in set(tokenize(query)) if term in self.vocabulary]
+        if not term_ids or not self.num_chunks:
+            return []
+
+        scores = np.zeros(self.num_chunks, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.posting_docs[start:end]
+            tfs = self.posting_tfs[start:end].astype(np.float32)
+            scores[docs] += self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [
+            {**self.chunk(int(chunk_id)), "chunk_id": int(chunk_id), "score": float(scores[chunk_id])}
+            for chunk_id in ranked
+        ]
+
+# ==============================================================================
+# 3. Command Line
+# ==============================================================================
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or query the local supplier document index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="chunk a directory of documents into a BM25 index")
+    build.add_argument("source", help="directory of .txt/.md/.html documents")
+    build.add_argument("--out", default="doc_index", help="index directory to (re)write")
+    build.add_argument("--chunk-words", type=int, default=180)
+    build.add_argument("--overlap", type=int, default=40)
+    build.add_argument("--k1", type=float, default=1.2)
+    build.add_argument("--b", type=float, default=0.75)
+
+    query = commands.add_parser("query", help="print the top-k chunks for a question")
+    query.add_argument("index", help="index directory")
+    query.add_argument("question")
+    query.add_argument("-k", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        stats = build_index(args.source, args.out, args.chunk_words, args.overlap, args.k1, args.b)
+        print(json.dumps(stats, indent=2))
+        return
+
+    started = time.perf_counter()
+    index = DocumentIndex(args.index)
+    loaded = time.perf_counter()
+    hits = index.search(args.question, args.k)
+    searched = time.perf_counter()
+    for hit in hits:
+        print(f"[{hit['score']:.2f}] {hit['title']} ({hit['source']})\n    {hit['text'][:200]}...\n")
+    print(f"Loaded {len(index)} chunks in {(loaded - started) * 1000:.1f}ms; "
+          f"query took {(searched - loaded) * 1000:.2f}ms.")
+
+
+if __name__ == "__main__":
+    main()
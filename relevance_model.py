@@ -0,0 +1,177 @@
+# ==============================================================================
+# relevance_model.py - Market Mentor: Local Relevance Classifier
+# ==============================================================================
+"""
+A small logistic regression over hashed n-grams that scores how likely a
+question is to be about Walmart supplier or corporate processes. Scoring one
+question is a handful of hash lookups and a dot product (well under a
+millisecond), so the app can settle clear-cut questions locally and only send
+the ambiguous middle band to the GPT-4o gate.
+
+Features are word unigrams, word bigrams and character trigrams of each word,
+hashed into a fixed-size weight vector. The model is stored as a compressed
+.npz file holding the weights and the bias.
+
+Training data is JSONL with one {"question": ..., "relevant": true/false} object
+per line: the bundled relevance_seed.jsonl plus any decision logs written by the
+app (RELEVANCE_DECISION_LOG), which use the same format.
+
+Usage:
+    python relevance_model.py train --data relevance_seed.jsonl gate_decisions.jsonl --out relevance_model.npz
+    python relevance_model.py score relevance_model.npz "How do I dispute a chargeback?"
+"""
+import argparse
+import json
+import random
+import re
+import time
+import zlib
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+DEFAULT_DIM = 1 << 18
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def featurize(text: str, dim: int = DEFAULT_DIM) -> np.ndarray:
+    """Sorted unique hashed feature indices for the text."""
+    words = TOKEN_PATTERN.findall(text.lower())
+    features = [f"u:{w}" for w in words]
+    features += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"#{word}#"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return np.unique(np.array([zlib.crc32(f.encode("utf-8")) % dim for f in features], dtype=np.int64))
+
+
+class RelevanceModel:
+    """Logistic regression over hashed n-gram presence features."""
+
+    def __init__(self, weights: np.ndarray, bias: float):
+        self.weights = weights
+        self.bias = bias
+        self.dim = len(weights)
+
+    @classmethod
+    def load(cls, path: str) -> "RelevanceModel":
+        with np.load(path) as data:
+            return cls(data["weights"].astype(np.float32), float(data["bias"]))
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, weights=self.weights.astype(np.float32), bias=np.float32(self.bias))
+
+    def _logit(self, indices: np.ndarray) -> float:
+        if len(indices) == 0:
+            return self.bias
+        # Presence features scaled by 1/sqrt(n) so long questions do not saturate the score
+        return self.bias + float(self.weights[indices].sum()) / np.sqrt(len(indices))
+
+    def score(self, text: str) -> float:
+        """Probability that the question is relevant, in [0, 1]."""
+        return float(1.0 / (1.0 + np.exp(-self._logit(featurize(text, self.dim)))))
+
+
+def train(examples: List[Tuple[str, bool]], dim: int = DEFAULT_DIM, epochs: int = 30,
+          learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 13) -> RelevanceModel:
+    """Fit the model with plain SGD on the log loss (L2 on touched weights)."""
+    rng = random.Random(seed)
+    data = [(featurize(question, dim), 1.0 if relevant else 0.0) for question, relevant in examples]
+    model = RelevanceModel(np.zeros(dim, dtype=np.float32), 0.0)
+
+    for _ in range(epochs):
+        rng.shuffle(data)
+        for indices, label in data:
+            prediction = 1.0 / (1.0 + np.exp(-model._logit(indices)))
+            gradient = prediction - label
+            scale = np.sqrt(len(indices)) if len(indices) else 1.0
+            model.weights[indices] -= learning_rate * (gradient / scale + l2 * model.weights[indices])
+            model.bias -= learning_rate * gradient
+    return model
+
+
+def load_examples(paths: Iterable[str]) -> List[Tuple[str, bool]]:
+    """Read JSONL training files; later files win when the same question appears twice."""
+    examples = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                examples[record["question"].strip().lower()] = (record["question"], bool(record["relevant"]))
+    return list(examples.values())
+
+
+def evaluate(model: RelevanceModel, examples: List[Tuple[str, bool]], reject_below: float,
+             accept_above: float) -> dict:
+    """
+    Accuracy of the confident decisions, how many questions fall in the
+    ambiguous band, and the precision of local accepts and local rejects
+    separately (a wrong accept answers an off-topic question; a wrong reject
+    turns away a supplier).
+    """
+    accepted = rejected = correct_accepts = correct_rejects = 0
+    for question, relevant in examples:
+        score = model.score(question)
+        if score >= accept_above:
+            accepted += 1
+            correct_accepts += relevant
+        elif score <= reject_below:
+            rejected += 1
+            correct_rejects += not relevant
+    confident = accepted + rejected
+    return {
+        "examples": len(examples),
+        "confident": confident,
+        "ambiguous": len(examples) - confident,
+        "confident_accuracy": round((correct_accepts + correct_rejects) / confident, 3) if confident else None,
+        "accepted": accepted,
+        "accept_precision": round(correct_accepts / accepted, 3) if accepted else None,
+        "rejected": rejected,
+        "reject_precision": round(correct_rejects / rejected, 3) if rejected else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train or query the local relevance classifier.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="fit the model on JSONL question/label files")
+    train_parser.add_argument("--data", nargs="+", default=["relevance_seed.jsonl"])
+    train_parser.add_argument("--out", default="relevance_model.npz")
+    train_parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    train_parser.add_argument("--epochs", type=int, default=30)
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out for the report")
+    train_parser.add_argument("--reject-below", type=float, default=0.15)
+    train_parser.add_argument("--accept-above", type=float, default=0.85)
+
+    score_parser = commands.add_parser("score", help="print the relevance score of a question")
+    score_parser.add_argument("model")
+    score_parser.add_argument("question")
+
+    args = parser.parse_args()
+    if args.command == "score":
+        model = RelevanceModel.load(args.model)
+        model.score(args.question)  # warm up numpy before timing
+        started = time.perf_counter()
+        score = model.score(args.question)
+        print(f"{score:.3f} ({(time.perf_counter() - started) * 1000:.3f}ms)")
+        return
+
+    examples = load_examples(args.data)
+    random.Random(7).shuffle(examples)
+    split = int(len(examples) * (1 - args.holdout))
+    if args.holdout > 0:
+        heldout_model = train(examples[:split], args.dim, args.epochs)
+        report = evaluate(heldout_model, examples[split:], args.reject_below, args.accept_above)
+        print(f"Held-out report: {json.dumps(report)}")
+
+    model = train(examples, args.dim, args.epochs)
+    model.save(args.out)
+    print(f"Trained on {len(examples)} examples; model written to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -84,24 +84,148 @@ document.addEventListener('DOMContentLoaded', () => {
     }, duration);
   }
 
-  function handleResponseText(element, text) {
-    const formattedText = formatResponseText(text);
-
-    // Support message with gradient glow effect
-    const supportMessage = `
+  // Support message with gradient glow effect; the page passes the logo's
+  // fingerprinted URL so it is cached like the other assets
+  const coffeeLogo = document.body.dataset.coffeeLogo || "/public/images/coffee-full-logo.png";
+  const supportMessage = `
       <div class="support-message">
         <a href="https://www.buymeacoffee.com/nunnai" target="_blank">
-          <img src="/public/images/coffee-full-logo.png" alt="Buy Me A Coffee">
+          <img src="${coffeeLogo}" alt="Buy Me A Coffee">
         </a>
       </div>
     `;
 
+  function handleResponseText(element, text) {
+    const formattedText = formatResponseText(text);
+
     // Combine the formatted text with the support message
     const combinedContent = formattedText + supportMessage;
 
     fadeInEffect(element, combinedContent);
   }
 
+  // Read a server-sent event stream from a fetch response, calling
+  // onEvent(eventName, data) for each event as it arrives
+  async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = "message";
+        let data = "";
+        for (const line of block.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (event === "done") return;
+        onEvent(event, data ? JSON.parse(data) : {});
+      }
+    }
+  }
+
+  const JOB_MAX_WAIT_MS = 5 * 60 * 1000; // Stop polling a job after five minutes
+  const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+  // Submit the question as a background job and poll until it finishes.
+  // Resolves to the answer text, or null when the server has job mode disabled.
+  async function askViaJob(question, signal, onProgress) {
+    console.log("Submitting background job...");
+    const response = await fetch("/ask?mode=async", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ question }),
+      signal,
+    });
+
+    if (response.status === 404) return null;
+    if (response.status === 429) throw busyError(response);
+    if (!response.ok) {
+      throw new Error(`HTTP error: ${response.status}`);
+    }
+
+    const { poll_url: pollUrl } = await response.json();
+    const giveUpAt = Date.now() + JOB_MAX_WAIT_MS;
+    let delay = 750;
+    while (Date.now() < giveUpAt) {
+      await sleep(delay);
+      delay = Math.min(delay * 1.5, 3000);
+
+      const poll = await fetch(pollUrl, { signal, cache: "no-store" });
+      if (!poll.ok) {
+        throw new Error(`HTTP error: ${poll.status}`);
+      }
+      const job = await poll.json();
+      // The job is alive, so keep the idle timeout from firing while it runs
+      onProgress();
+      if (job.status === "done") return job.response;
+      if (job.status === "failed") throw new Error(job.error || "The question could not be answered.");
+    }
+    throw new Error("The background job did not finish in time.");
+  }
+
+  // A 429 means the job queue is full or this client is over its rate limit
+  function busyError(response) {
+    const retryAfter = response.headers.get("Retry-After") || "a few";
+    const busy = new Error(`Market Mentor is busy right now. Please try again in ${retryAfter} seconds.`);
+    busy.name = "BusyError";
+    return busy;
+  }
+
+  // Stream the answer over server-sent events, rendering it as it arrives
+  async function askViaStream(question, signal, onProgress, responseDiv, loadingAnimation) {
+    console.log("Sending streaming fetch request...");
+    const response = await fetch("/ask/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ question }),
+      signal,
+    });
+
+    if (response.status === 429) throw busyError(response);
+    if (!response.ok) {
+      throw new Error(`HTTP error: ${response.status}`);
+    }
+
+    let answerText = "";
+    let renderFrame = null;
+
+    const render = () => {
+      renderFrame = null;
+      responseDiv.innerHTML = formatResponseText(answerText);
+    };
+
+    await readEventStream(response, (event, data) => {
+      onProgress();
+      if (event === "error") {
+        throw new Error(data.message || "Streaming error");
+      }
+      if (event === "message" && data.delta) {
+        if (!answerText && loadingAnimation) {
+          loadingAnimation.classList.remove('show');
+        }
+        answerText += data.delta;
+        // Re-render at most once per animation frame
+        if (renderFrame === null) {
+          renderFrame = requestAnimationFrame(render);
+        }
+      }
+    });
+
+    clearTimeout(timeout);
+    if (renderFrame !== null) cancelAnimationFrame(renderFrame);
+    responseDiv.innerHTML = formatResponseText(answerText) + supportMessage;
+  }
+
   // Function to handle the search request
   async function handleSearch() {
     const questionInput = document.getElementById("question").value.trim();
@@ -134,30 +258,33 @@ document.addEventListener('DOMContentLoaded', () => {
       if (timeout) clearTimeout(timeout);
 
       const controller = new AbortController();
-      timeout = setTimeout(() => {
-        controller.abort();
-        console.log("Request timed out.");
-      }, 60000);
-
-      console.log("Sending fetch request...");
-      const response = await fetch("/ask", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ question: questionInput }),
-        signal: controller.signal,
-      });
-
-      clearTimeout(timeout);
-
-      if (!response.ok) {
-        throw new Error(`HTTP error: ${response.status}`);
-      }
+      // Idle timeout: restarted whenever the server sends data or reports the
+      // job still running, so long answers are not cut off while in progress
+      const resetTimeout = () => {
+        clearTimeout(timeout);
+        timeout = setTimeout(() => {
+          controller.abort();
+          console.log("Request timed out.");
+        }, 60000);
+      };
+      resetTimeout();
 
-      const data = await response.json();
-      handleResponseText(responseDiv, data.response);
+      // Prefer a background job; servers with job mode disabled answer 404,
+      // in which case the answer is streamed instead
+      const answer = await askViaJob(questionInput, controller.signal, resetTimeout);
+      if (answer === null) {
+        await askViaStream(questionInput, controller.signal, resetTimeout, responseDiv, loadingAnimation);
+      } else {
+        clearTimeout(timeout);
+        if (loadingAnimation) loadingAnimation.classList.remove('show');
+        handleResponseText(responseDiv, answer);
+      }
     } catch (err) {
       console.error("Error during fetch:", err);
-      responseDiv.innerHTML = `<span class='error'>${err.name === 'AbortError' ? "Request timed out. Please try again." : "An error occurred. Please try again later."}</span>`;
+      const message = err.name === 'AbortError'
+        ? "Request timed out. Please try again."
+        : (err.name === 'BusyError' ? err.message : "An error occurred. Please try again later.");
+      responseDiv.innerHTML = `<span class='error'>${message}</span>`;
     } finally {
       isFetching = false;
       searchButton.disabled = false;
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+import asgi
+from app import AdaptiveLimiter
+
+
+def full_limiter() -> AdaptiveLimiter:
+    limiter = AdaptiveLimiter("test", minimum=1, maximum=1)
+    assert limiter.try_acquire()
+    return limiter
+
+
+def test_slot_waiter_wakes_on_release_from_another_thread():
+    limiter = full_limiter()
+
+    async def wait_for_slot():
+        waiter = asgi.AsyncSlotWaiter(limiter, asyncio.get_running_loop())
+        threading.Timer(0.05, limiter.release).start()
+        started = time.monotonic()
+        acquired = await waiter.acquire(timeout=5)
+        return acquired, time.monotonic() - started
+
+    acquired, waited = asyncio.run(wait_for_slot())
+    assert acquired
+    assert waited < 1
+    assert limiter.in_flight == 1
+
+
+def test_slot_waiter_times_out_without_release():
+    limiter = full_limiter()
+
+    async def wait_for_slot():
+        return await asgi.AsyncSlotWaiter(limiter, asyncio.get_running_loop()).acquire(timeout=0.05)
+
+    assert not asyncio.run(wait_for_slot())
+    assert limiter.in_flight == 1
+
+
+def test_slot_waiters_share_releases_without_losing_one():
+    limiter = full_limiter()
+
+    async def wait_for_slots():
+        waiter = asgi.AsyncSlotWaiter(limiter, asyncio.get_running_loop())
+        first = asyncio.ensure_future(waiter.acquire(timeout=5))
+        second = asyncio.ensure_future(waiter.acquire(timeout=5))
+        await asyncio.sleep(0.01)
+        limiter.release()
+        await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+        limiter.release()
+        return await asyncio.wait_for(asyncio.gather(first, second), timeout=1)
+
+    assert asyncio.run(wait_for_slots()) == [True, True]
@@ -0,0 +1,39 @@
+import app
+from docindex import DocumentIndex, build_index
+
+TOPICS = ["pallet labels", "carrier appointments", "early deliveries", "late deliveries", "fine disputes"]
+
+
+def build_guide(tmp_path):
+    """One supplier guide whose sections become separate, distinct chunks."""
+    source = tmp_path / "docs"
+    source.mkdir()
+    sections = [
+        f"OTIF section on {topic}: " + " ".join(f"{topic.split()[0]}{n}" for n in range(40))
+        for topic in TOPICS
+    ]
+    (source / "otif_guide.txt").write_text(" ".join(sections))
+    build_index(str(source), str(tmp_path / "index"), size=45, overlap=0)
+    return DocumentIndex(str(tmp_path / "index"))
+
+
+def test_chunks_from_one_document_are_not_url_deduplicated(tmp_path):
+    hits = build_guide(tmp_path).search("OTIF section", k=10)
+    assert len(hits) == len(TOPICS)
+    assert len({hit["source"] for hit in hits}) == 1
+
+    context = app.assemble_context("OTIF section", [("LOCAL", app.local_passages(tuple(hits)))],
+                                   budget=100_000)
+    assert context.count("Title: ") == len(TOPICS)
+    for topic in TOPICS:
+        assert f"OTIF section on {topic}" in context
+
+
+def test_web_results_are_still_deduplicated_by_url():
+    passages = [
+        {"title": "OTIF", "url": "https://www.example.com/otif/", "text": "short"},
+        {"title": "OTIF", "url": "http://example.com/otif#fines", "text": "a longer snippet about OTIF fines"},
+    ]
+    context = app.assemble_context("OTIF fines", [("WEB", passages)], budget=100_000)
+    assert context.count("Title: ") == 1
+    assert "a longer snippet about OTIF fines" in context
@@ -0,0 +1,21 @@
+import app
+
+
+def test_cache_marker_is_sent_on_a_long_enough_prefix_by_default():
+    _, payload = app.build_answer_request("How is OTIF measured?", "Some context.")
+    instructions, context = payload["messages"][0]["content"]
+    assert instructions["cache_control"] == {"type": "ephemeral"}
+    assert instructions["text"] == app.ANSWER_INSTRUCTIONS
+    assert "cache_control" not in context
+
+
+def test_cached_prefix_reaches_the_provider_minimum():
+    assert app.estimate_tokens(app.ANSWER_INSTRUCTIONS) >= app.PROMPT_CACHE_MIN_TOKENS
+    # Claude's tokenizer gives English prose at least ~1.3 tokens per word
+    assert len(app.ANSWER_INSTRUCTIONS.split()) * 1.3 >= app.PROMPT_CACHE_MIN_TOKENS
+
+
+def test_prefix_is_identical_across_questions():
+    first = app.build_answer_request("How is OTIF measured?", "Context A.")[1]
+    second = app.build_answer_request("What is MABD?", "Context B.", stream=True)[1]
+    assert first["messages"][0]["content"][0] == second["messages"][0]["content"][0]
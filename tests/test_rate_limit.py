@@ -0,0 +1,35 @@
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def charges(monkeypatch):
+    """Record every client_limiter.admit call, admitting all of them."""
+    calls = []
+    monkeypatch.setattr(app.client_limiter, "admit", lambda client, cost=1: calls.append(cost))
+    return calls
+
+
+def test_async_mode_disabled_is_not_charged(monkeypatch, charges):
+    monkeypatch.setattr(app, "ASYNC_JOBS_ENABLED", False)
+    response = app.app.test_client().post("/ask?mode=async", json={"question": "How is OTIF measured?"})
+    assert response.status_code == 404
+    assert charges == []
+
+
+def test_batch_is_charged_per_question(charges):
+    body = "\n".join(f'"Batch question {n} about OTIF?"' for n in range(3))
+    app.app.test_client().post("/ask/batch", query_string={"batch_id": uuid.uuid4().hex}, data=body)
+    assert charges == [3]
+
+
+def test_batch_larger_than_burst_is_refused(monkeypatch, charges):
+    monkeypatch.setattr(app.client_limiter, "enabled", True)
+    burst = int(app.client_limiter.store.burst)
+    body = "\n".join(f'"Oversized batch question {n}?"' for n in range(burst + 1))
+    response = app.app.test_client().post("/ask/batch", data=body)
+    assert response.status_code == 413
+    assert charges == []